@@ -1,6 +1,14 @@
 from .log import logger_group
-from .client import HttpClient, TransportType, Client
+from .client import (
+    HttpClient,
+    TransportType,
+    Client,
+    ConnectionLane,
+    ResponseRoute,
+    RESPONSE_ROUTES
+)
 from .api import MessageDirection, Api
+from .schemas import ValidationMode, set_validation_mode
 from .responses import *
 from .events import *
 from .exceptions import *
@@ -22,11 +22,11 @@ This module contains primitives to build Matrix API http requests.
 
 from __future__ import unicode_literals
 
-import json
 from typing import Any, Dict, Optional, Tuple, List, Set, DefaultDict, Union
 from enum import Enum, unique
 from collections import defaultdict
 
+from . import json_codec
 from .exceptions import LocalProtocolError
 from .http import Http2Request, HttpRequest, TransportRequest
 
@@ -62,18 +62,13 @@ class Api(object):
     def to_json(content_dict):
         # type: (Dict[Any, Any]) -> str
         """Turn a dictionary into a json string."""
-        return json.dumps(content_dict, separators=(",", ":"))
+        return json_codec.dumps(content_dict)
 
     @staticmethod
     def to_canonical_json(content_dict):
         # type: (Dict[Any, Any]) -> str
         """Turn a dictionary into a canonical json string."""
-        return json.dumps(
-            content_dict,
-            ensure_ascii=False,
-            separators=(",", ":"),
-            sort_keys=True,
-        )
+        return json_codec.canonical_dumps(content_dict)
 
     @staticmethod
     def mimetype_to_msgtype(mimetype):
@@ -229,7 +224,7 @@ class Api(object):
             query_parameters["timeout"] = str(timeout)
 
         if filter:
-            filter_json = json.dumps(filter, separators=(",", ":"))
+            filter_json = Api.to_json(filter)
             query_parameters["filter"] = filter_json
 
         return "GET", Api._build_path("sync", query_parameters)
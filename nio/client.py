@@ -15,7 +15,6 @@
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 import attr
-import json
 import pprint
 from builtins import str, super
 from enum import Enum, unique
@@ -39,13 +38,16 @@ import h2
 import h11
 from logbook import Logger
 
+from . import json_codec
 from .api import Api, MessageDirection
 from .exceptions import (
+    GroupEncryptionError,
     LocalProtocolError,
+    OlmTrustError,
     RemoteProtocolError,
     RemoteTransportError,
 )
-from .crypto import DeviceStore, Olm
+from .crypto import DeviceStore, Olm, RotationPolicy
 from .http import HttpRequest, Http2Request
 
 from .http import (
@@ -81,6 +83,11 @@ from .responses import (
     DeleteDevicesResponse,
     JoinedMembersResponse,
     KeysUploadError,
+    KeysQueryError,
+    KeysClaimError,
+    ShareGroupSessionError,
+    JoinedMembersError,
+    SyncError,
     RoomTypingResponse,
     RoomReadMarkersResponse,
     ProfileSetDisplayNameResponse
@@ -91,9 +98,13 @@ from .events import (
     BadEventType,
     RoomEncryptedEvent,
     MegolmEvent,
-    RoomKeyEvent
+    RoomKeyEvent,
+    RoomMemberEvent,
+    LazyEvent,
+    EAGER_EVENT_TYPES,
 )
-from .rooms import MatrixInvitedRoom, MatrixRoom
+from .rooms import EncryptedRoomIndex, MatrixInvitedRoom, MatrixRoom
+from .schemas import set_validation_mode
 from .store import MatrixStore, DefaultStore
 
 if False:
@@ -108,6 +119,8 @@ except ImportError:
 logger = Logger("nio.client")
 logger_group.add_logger(logger)
 
+ConnectionType = Union[HttpConnection, Http2Connection]
+
 
 def connected(func):
     @wraps(func)
@@ -162,10 +175,149 @@ class RequestType(Enum):
     profile_set_displayname = 20
 
 
+@unique
+class ConnectionLane(Enum):
+    """Enum representing the connections a HttpClient can hold.
+
+    Requests are routed to a lane depending on their type, so long running
+    requests like sync don't block other requests on the same connection.
+    If the lane of a request isn't connected the interactive lane is used.
+    """
+
+    interactive = 0
+    sync = 1
+    bulk = 2
+
+
+REQUEST_LANES = {
+    RequestType.sync: ConnectionLane.sync,
+    RequestType.room_messages: ConnectionLane.bulk,
+    RequestType.joined_members: ConnectionLane.bulk,
+}  # type: Dict[RequestType, ConnectionLane]
+
+
+@attr.s
+class ResponseRoute(object):
+    """Description of how the response for a request type is created.
+
+    Attributes:
+        response_class (type): The response class whose from_dict() method
+            creates the response.
+        extra_data (bool): Should the extra data of the request be passed to
+            from_dict().
+        status_overrides (Dict[int, type]): Response classes that are used
+            instead of the response_class if the server replies with the
+            given HTTP status code.
+        partial (bool): Can the response be parsed partially, if set the
+            maximal number of events that should be parsed is passed to
+            from_dict().
+
+    """
+
+    response_class = attr.ib()
+    extra_data = attr.ib(default=False, type=bool)
+    status_overrides = attr.ib(default=attr.Factory(dict), type=Dict[int, Any])
+    partial = attr.ib(default=False, type=bool)
+
+
+RESPONSE_ROUTES = {
+    RequestType.login: ResponseRoute(LoginResponse),
+    RequestType.sync: ResponseRoute(SyncResponse, partial=True),
+    RequestType.room_send: ResponseRoute(RoomSendResponse, True),
+    RequestType.room_put_state: ResponseRoute(RoomPutStateResponse, True),
+    RequestType.room_redact: ResponseRoute(RoomRedactResponse, True),
+    RequestType.room_kick: ResponseRoute(RoomKickResponse),
+    RequestType.room_invite: ResponseRoute(RoomInviteResponse),
+    RequestType.join: ResponseRoute(JoinResponse),
+    RequestType.room_leave: ResponseRoute(RoomLeaveResponse),
+    RequestType.room_messages: ResponseRoute(RoomMessagesResponse),
+    RequestType.room_typing: ResponseRoute(RoomTypingResponse, True),
+    RequestType.room_read_markers: ResponseRoute(
+        RoomReadMarkersResponse,
+        True
+    ),
+    RequestType.keys_upload: ResponseRoute(KeysUploadResponse),
+    RequestType.keys_query: ResponseRoute(KeysQueryResponse),
+    RequestType.keys_claim: ResponseRoute(KeysClaimResponse, True),
+    RequestType.share_group_session: ResponseRoute(
+        ShareGroupSessionResponse,
+        True
+    ),
+    RequestType.devices: ResponseRoute(DevicesResponse),
+    RequestType.update_device: ResponseRoute(UpdateDeviceResponse),
+    RequestType.joined_members: ResponseRoute(JoinedMembersResponse, True),
+    RequestType.delete_devices: ResponseRoute(
+        DeleteDevicesResponse,
+        status_overrides={401: DeleteDevicesAuthResponse}
+    ),
+    RequestType.profile_set_displayname: ResponseRoute(
+        ProfileSetDisplayNameResponse
+    ),
+}  # type: Dict[Any, ResponseRoute]
+
+
 @attr.s
 class RequestInfo(object):
     type = attr.ib(type=RequestType)
     extra_data = attr.ib(default=None)
+    lane = attr.ib(default=ConnectionLane.interactive, type=ConnectionLane)
+    # Is the request a share of the successor of a room's outbound group
+    # session, messages can be sent while it's in flight.
+    successor_share = attr.ib(default=False, type=bool)
+
+    @property
+    def route(self):
+        # type: () -> ResponseRoute
+        """The route describing how the response should be created."""
+        return RESPONSE_ROUTES[self.type]
+
+
+@attr.s
+class QueuedMessage(object):
+    message_type = attr.ib(type=str)
+    content = attr.ib(type=Dict[Any, Any])
+    tx_id = attr.ib(type=UUID)
+
+
+@attr.s
+class SendQueue(object):
+    """Messages of a room that are waiting to be sent.
+
+    Attributes:
+        messages (Deque[QueuedMessage]): The queued messages, in the order
+            they will be sent.
+        claimed (Set[Tuple[str, str]]): User and device id pairs of the
+            devices a one-time key was already claimed for. Devices that are
+            still missing an Olm session after the claim are left out of the
+            room key share instead of being claimed for again.
+        checked (bool): Are the device lists and Olm sessions of the room
+            members checked since the last response that could change them.
+        waiting (bool): Does the room wait for a response or for a device to
+            be verified or blacklisted before the room key can be shared.
+    """
+
+    messages = attr.ib(factory=deque, type=Deque[QueuedMessage])
+    claimed = attr.ib(factory=set, type=Set[Tuple[str, str]])
+    checked = attr.ib(default=False, type=bool)
+    waiting = attr.ib(default=False, type=bool)
+
+
+# HTTP/2 stream weights, the weight of a stream decides how much of the
+# connection bandwidth the stream gets compared to its siblings. Valid
+# weights are between 1 and 256, requests not found here get the default
+# weight of 16.
+DEFAULT_REQUEST_PRIORITIES = {
+    RequestType.room_send: 256,
+    RequestType.room_typing: 256,
+    RequestType.room_read_markers: 128,
+    RequestType.room_redact: 128,
+    RequestType.share_group_session: 256,
+    RequestType.keys_claim: 128,
+    RequestType.keys_query: 64,
+    RequestType.sync: 32,
+    RequestType.room_messages: 8,
+    RequestType.joined_members: 8,
+}  # type: Dict[RequestType, int]
 
 
 @attr.s
@@ -181,6 +333,48 @@ class ClientConfig(object):
             used.
         pickle_key: (str, optional): A passphrase that will be used to encrypt
             end to end encryption keys.
+        http_pipelining (bool, optional): Should idempotent requests be
+            pipelined on HTTP/1.1 connections. Pipelining is turned off
+            automatically if the server closes the connection while requests
+            are in flight, and stays off for the reconnected connections.
+        max_pipeline_depth (int, optional): The maximal number of requests
+            that are in flight at once on a pipelined HTTP/1.1 connection.
+        request_priorities (Dict[RequestType, int], optional): A mapping from
+            a request type to the HTTP/2 stream weight (1-256) requests of
+            that type should be sent with.
+        json_codec (str, optional): The JSON library that should be used to
+            encode requests and parse responses, one of "json", "orjson",
+            "ujson" or "auto" to pick the fastest installed one. The codec is
+            a process wide setting, it is only changed if this is set. By
+            default the codec selected with nio.json_codec.set_codec() is
+            used, which is the standard library json module unless selected
+            otherwise.
+        validation (str, optional): How strictly server responses and events
+            are validated, the name of a ValidationMode: "strict", "lenient"
+            skips format checks and checks for unknown keys, "trusted" only
+            checks that required keys are present and should only be used
+            with a trusted homeserver. The mode is a process wide setting, it
+            is only changed if this is set. Decrypted payloads are always
+            validated strictly.
+        session_cache_size (int, optional): The number of devices whose Olm
+            sessions are kept in memory. If set the sessions of a device are
+            loaded from the store the first time they are needed instead of
+            at startup, the least recently used ones are dropped from memory
+            once the limit is reached. By default all the sessions are loaded
+            at startup.
+        group_session_cache_size (int, optional): The number of Megolm
+            inbound group sessions kept in memory. If set the sessions aren't
+            loaded from the store at startup, they are loaded when they are
+            first needed and the least recently used ones are dropped from
+            memory once the limit is reached. By default all the sessions are
+            loaded at startup.
+        rotation_policy (RotationPolicy, optional): When outbound group
+            sessions are rotated and if their successors are shared ahead of
+            time. Defaults to rotating after 100 messages or a week without
+            sharing ahead.
+        encryption_workers (int, optional): The number of threads that
+            encrypt room keys when they are shared with many devices at once.
+            By default room keys are encrypted in the calling thread.
 
     """
 
@@ -188,6 +382,18 @@ class ClientConfig(object):
     store_name = attr.ib(type=str, default="")
     encryption_enabled = attr.ib(type=bool, default=True)
     pickle_key = attr.ib(type=str, default="DEFAULT_KEY")
+    http_pipelining = attr.ib(type=bool, default=False)
+    max_pipeline_depth = attr.ib(type=int, default=8)
+    request_priorities = attr.ib(
+        type=Dict[RequestType, int],
+        default=attr.Factory(lambda: dict(DEFAULT_REQUEST_PRIORITIES))
+    )
+    json_codec = attr.ib(type=Optional[str], default=None)
+    validation = attr.ib(type=Optional[str], default=None)
+    session_cache_size = attr.ib(type=Optional[int], default=None)
+    group_session_cache_size = attr.ib(type=Optional[int], default=None)
+    encryption_workers = attr.ib(type=int, default=0)
+    rotation_policy = attr.ib(type=RotationPolicy, factory=RotationPolicy)
 
 
 class Client(object):
@@ -202,6 +408,8 @@ class Client(object):
        rooms(Dict[str, MatrixRoom)): A dictionary containing a mapping of room
            ids to MatrixRoom objects. All the rooms a user is joined to will be
            here after a sync.
+       encrypted_room_index(EncryptedRoomIndex): Index of the encrypted
+           rooms the members of our rooms are in.
 
     Args:
        user (str): User that will be used to log in.
@@ -229,12 +437,19 @@ class Client(object):
         self.store = None  # type: Optional[MatrixStore]
         self.config = config or ClientConfig()
 
+        if self.config.json_codec is not None:
+            json_codec.set_codec(self.config.json_codec)
+
+        if self.config.validation is not None:
+            set_validation_mode(self.config.validation)
+
         self.user_id = ""
         self.access_token = ""
         self.next_batch = ""
 
         self.rooms = dict()  # type: Dict[str, MatrixRoom]
         self.invited_rooms = dict()  # type: Dict[str, MatrixRoom]
+        self.encrypted_room_index = EncryptedRoomIndex()
 
     @property
     def logged_in(self):
@@ -314,7 +529,15 @@ class Client(object):
             self.config.pickle_key
         )
         assert self.store
-        self.olm = Olm(self.user_id, self.device_id, self.store)
+        self.olm = Olm(
+            self.user_id,
+            self.device_id,
+            self.store,
+            session_cache_size=self.config.session_cache_size,
+            group_session_cache_size=self.config.group_session_cache_size,
+            encryption_workers=self.config.encryption_workers,
+            rotation_policy=self.config.rotation_policy
+        )
 
     def room_contains_unverified(self, room_id):
         # type: (str) -> bool
@@ -353,20 +576,86 @@ class Client(object):
             None
         )
 
+        # A successor might have been shared with the same devices.
+        self.olm.group_session_successors.pop(room_id, None)
+
         # There is no need to invalidate the session if it was never
         # shared, put it back where it was.
         if session and not session.shared:
             self.olm.outbound_group_sessions[room_id] = session
         elif session:
             logger.info("Invalidating session for {}".format(room_id))
+            self.olm.store.remove_outbound_group_session(room_id)
 
     def _invalidate_outbound_sessions(self, device):
         # type: (OlmDevice) -> None
+        """Invalidate the outbound sessions that were shared with a device.
+
+        Devices that don't know the room key yet only need the key shared
+        with them, there is no need to rotate the session.
+        """
         assert self.olm
 
-        for room in self.rooms.values():
-            if device.user_id in room.users:
-                self.invalidate_outbound_session(room.room_id)
+        rooms = self.encrypted_room_index.rooms_for_user(device.user_id)
+
+        for room_id in rooms:
+            sessions = (
+                self.olm.outbound_group_sessions.get(room_id),
+                self.olm.group_session_successors.get(room_id)
+            )
+
+            if any(session
+                   and (device.user_id, device.id) in session.shared_with
+                   for session in sessions):
+                self.invalidate_outbound_session(room_id)
+
+    def should_share_ahead(self, room_id):
+        # type: (str) -> bool
+        """Should the successor of the room key of a room be shared.
+
+        The successor is shared using share_group_session() with the
+        successor argument set, once the current room key expires the
+        successor replaces it without waiting for a new key share.
+
+        Args:
+            room_id (str): Room id of the room that should be checked.
+
+        Returns True if the current room key is close to expiry according to
+        the rotation policy and its successor isn't shared yet. Returns False
+        if no Olm session is loaded.
+        """
+        if not self.olm:
+            return False
+
+        return self.olm.should_share_ahead(room_id)
+
+    @store_loaded
+    def devices_without_room_key(self, room_id):
+        # type: (str) -> Dict[str, List[str]]
+        """Get the devices in a room that still need the room key.
+
+        These are the devices of the room members that the current outbound
+        group session of the room wasn't shared with. Blacklisted devices are
+        left out, so are devices a share skipped because there was no Olm
+        session with them, as long as there still is none.
+
+        Encrypted messages can't be sent to the room until every one of
+        these devices got the room key.
+
+        Args:
+            room_id (str): Room id of the room that should be checked.
+
+        Returns a dictionary mapping user ids to a list of device ids.
+        """
+        try:
+            room = self.rooms[room_id]
+        except KeyError:
+            raise LocalProtocolError("No such room with id {}".format(room_id))
+
+        return self.olm.get_devices_without_room_key(
+            room_id,
+            list(room.users.keys())
+        )
 
     @store_loaded
     def verify_device(self, device):
@@ -528,12 +817,21 @@ class Client(object):
 
             if room_id not in self.rooms:
                 logger.info("New joined room {}".format(room_id))
-                self.rooms[room_id] = MatrixRoom(room_id, self.user_id)
+                self.rooms[room_id] = MatrixRoom(
+                    room_id,
+                    self.user_id,
+                    self.encrypted_room_index
+                )
 
             room = self.rooms[room_id]
+            members_changed = False
 
             for event in join_info.state:
-                room.handle_event(event)
+                event = self._required_event(event)
+
+                if event:
+                    members_changed |= isinstance(event, RoomMemberEvent)
+                    room.handle_event(event)
 
             if join_info.summary:
                 room.update_summary(join_info.summary)
@@ -541,6 +839,13 @@ class Client(object):
             decrypted_events = []
 
             for index, event in enumerate(join_info.timeline.events):
+                event = self._required_event(event)
+
+                if not event:
+                    continue
+
+                members_changed |= isinstance(event, RoomMemberEvent)
+
                 if isinstance(event, MegolmEvent) and self.olm:
                     event.room_id = room_id
                     new_event = self.olm.decrypt_event(event)
@@ -560,29 +865,41 @@ class Client(object):
             if room.encrypted and self.olm is not None:
                 self.olm.update_tracked_users(room)
 
+                if members_changed:
+                    self.olm.invalidate_room_key_check(room_id)
+
         if self.olm:
             changed_users = set()
             self.olm.uploaded_key_count = (
                 response.device_key_count.signed_curve25519)
 
             for user in response.device_list.changed:
-                for room in self.rooms.values():
-                    if not room.encrypted:
-                        continue
-
-                    if user in room.users:
-                        changed_users.add(user)
+                if user in self.encrypted_room_index:
+                    changed_users.add(user)
 
             for user in response.device_list.left:
-                for room in self.rooms.values():
-                    if not room.encrypted:
-                        continue
-
-                    if user in room.users:
-                        changed_users.add(user)
+                if user in self.encrypted_room_index:
+                    changed_users.add(user)
 
             self.olm.add_changed_users(changed_users)
 
+    @staticmethod
+    def _required_event(event):
+        # type: (Any) -> Optional[Any]
+        """Get the parsed event if the client needs it for its state.
+
+        Lazy events are only parsed if they are encrypted or change the room
+        state, None is returned for every other lazy event so it stays
+        unparsed.
+        """
+        if type(event) is not LazyEvent:
+            return event
+
+        if event.type in EAGER_EVENT_TYPES:
+            return event.event
+
+        return None
+
     def _handle_messages_response(self, response):
         decrypted_events = []
 
@@ -601,10 +918,9 @@ class Client(object):
         self.olm.handle_response(response)
 
         if isinstance(response, KeysQueryResponse):
-            for user_id in response.changed:
-                for room in self.rooms.values():
-                    if room.encrypted and user_id in room.users:
-                        self.invalidate_outbound_session(room.room_id)
+            for devices in response.changed.values():
+                for device in devices.values():
+                    self._invalidate_outbound_sessions(device)
 
     def _handle_joined_members(self, response):
         if response.room_id not in self.rooms:
@@ -617,6 +933,7 @@ class Client(object):
 
         if room.encrypted and self.olm is not None:
             self.olm.update_tracked_users(room)
+            self.olm.invalidate_room_key_check(room.room_id)
 
     def receive_response(self, response):
         # type: (Response) -> None
@@ -651,6 +968,11 @@ class Client(object):
         else:
             pass
 
+        # Sessions that changed while handling the response are written out
+        # in a single transaction.
+        if self.olm:
+            self.olm.flush()
+
 
 class HttpClient(Client):
     def __init__(
@@ -667,12 +989,41 @@ class HttpClient(Client):
         self.parse_queue = deque()  \
             # type: Deque[Tuple[RequestInfo, TransportResponse]]
         self.partial_sync = None  # type: Optional[PartialSyncResponse]
+        self.send_queues = dict()  # type: Dict[str, SendQueue]
+        # Requests of closed HTTP/1.1 connections that are sent again once
+        # their lane is reconnected.
+        self.requeued_requests = dict() \
+            # type: Dict[ConnectionLane, List[HttpRequest]]
+        self.pipelining_disabled = False
 
-        self.connection = None \
-            # type: Optional[Union[HttpConnection, Http2Connection]]
+        self.connections = dict() \
+            # type: Dict[ConnectionLane, ConnectionType]
 
         super().__init__(user, device_id, store_path, config)
 
+    @property
+    def connection(self):
+        # type: () -> Optional[ConnectionType]
+        """The connection of the interactive lane."""
+        return self.connections.get(ConnectionLane.interactive, None)
+
+    def lane_for(self, request_type):
+        # type: (RequestType) -> ConnectionLane
+        """Get the lane that requests of the given type are sent over.
+
+        The data that a request method returns needs to be sent over the
+        connection of this lane.
+
+        Args:
+            request_type (RequestType): The type of the request.
+        """
+        lane = REQUEST_LANES.get(request_type, ConnectionLane.interactive)
+
+        if lane not in self.connections:
+            return ConnectionLane.interactive
+
+        return lane
+
     @connected
     def _send(
         self,
@@ -681,9 +1032,16 @@ class HttpClient(Client):
         uuid=None      # type: Optional[UUID]
     ):
         # type: (...) -> Tuple[UUID, bytes]
-        assert self.connection
+        request_info.lane = self.lane_for(request_info.type)
+        connection = self.connections[request_info.lane]
+
+        if isinstance(request, Http2Request):
+            request.priority_weight = self.config.request_priorities.get(
+                request_info.type,
+                None
+            )
 
-        ret_uuid, data = self.connection.send(request, uuid)
+        ret_uuid, data = connection.send(request, uuid)
         self.requests_made[ret_uuid] = request_info
         return ret_uuid, data
 
@@ -719,41 +1077,148 @@ class HttpClient(Client):
     @property
     def lag(self):
         # type: () -> float
-        if not self.connection:
+        if not self.connections:
             return 0
 
-        return self.connection.elapsed
+        return max(c.elapsed for c in self.connections.values())
+
+    def connect(
+        self,
+        transport_type=TransportType.HTTP,  # type: Optional[TransportType]
+        lane=ConnectionLane.interactive     # type: ConnectionLane
+    ):
+        # type: (...) -> bytes
+        """Create a new connection for the given lane.
+
+        The interactive lane needs to be connected first, every other lane
+        needs to use the same transport type as the interactive lane.
+
+        Returns the bytes that should be sent to the socket of the lane.
 
-    def connect(self, transport_type=TransportType.HTTP):
-        # type: (Optional[TransportType]) -> bytes
+        Args:
+            transport_type (TransportType): The transport type of the
+                connection.
+            lane (ConnectionLane): The lane the connection will serve.
+        """
         if transport_type == TransportType.HTTP:
-            self.connection = HttpConnection()
+            connection_class = HttpConnection
         elif transport_type == TransportType.HTTP2:
-            self.connection = Http2Connection()
+            connection_class = Http2Connection
         else:
             raise NotImplementedError
 
-        return self.connection.connect()
+        if lane != ConnectionLane.interactive:
+            if not self.connection:
+                raise LocalProtocolError("The interactive lane needs to be "
+                                         "connected first.")
+
+            if not isinstance(self.connection, connection_class):
+                raise LocalProtocolError("Mismatched transport type for lane "
+                                         "{}.".format(lane.name))
+
+        old_connection = self.connections.get(lane)
+
+        if isinstance(old_connection, HttpConnection):
+            self._queue_responses(
+                self._take_over_requests(lane, old_connection)
+            )
+
+        requeued = self.requeued_requests.pop(lane, [])
+
+        if connection_class is HttpConnection:
+            connection = HttpConnection(
+                self.config.http_pipelining and not self.pipelining_disabled,
+                self.config.max_pipeline_depth
+            )
+            connection.requeue(requeued)
+        else:
+            connection = Http2Connection()
+            self._queue_responses(self._fail_requests(requeued))
+
+        self.connections[lane] = connection
+        return connection.connect() + connection.data_to_send()
+
+    def _take_over_requests(self, lane, connection):
+        # type: (ConnectionLane, HttpConnection) -> List[TransportResponse]
+        """Take the unsent requests of a closed connection.
+
+        The requests are sent again once the lane is reconnected, if the
+        connection gave up on pipelining it stays disabled for the server.
+
+        Returns the failed responses of the requests that can't be sent again.
+        """
+        failed = connection.connection_lost()
+
+        if self.config.http_pipelining and not connection.pipelining:
+            self.pipelining_disabled = True
+
+        self.requeued_requests.setdefault(lane, []).extend(
+            connection.unsent_requests()
+        )
+
+        return failed
+
+    @staticmethod
+    def _fail_requests(requests):
+        # type: (List[HttpRequest]) -> List[TransportResponse]
+        responses = []  # type: List[TransportResponse]
+
+        for request in requests:
+            assert request.response
+            request.response.was_reset = True
+            request.response.mark_as_received()
+            responses.append(request.response)
+
+        return responses
 
     def _clear_queues(self):
         self.requests_made.clear()
         self.parse_queue.clear()
+        self.requeued_requests.clear()
+
+    def _get_lane_connection(self, lane):
+        # type: (ConnectionLane) -> ConnectionType
+        try:
+            return self.connections[lane]
+        except KeyError:
+            raise LocalProtocolError("Lane {} is not connected.".format(
+                lane.name))
 
     @connected
-    def disconnect(self):
-        # type: () -> bytes
-        assert self.connection
+    def disconnect(self, lane=ConnectionLane.interactive):
+        # type: (ConnectionLane) -> bytes
+        """Disconnect the connection of the given lane.
+
+        Disconnecting the interactive lane disconnects every lane.
+
+        Returns the bytes that should be sent to the socket of the lane.
+        """
+        connection = self._get_lane_connection(lane)
+        data = connection.disconnect()
+
+        if lane == ConnectionLane.interactive:
+            for other_connection in self.connections.values():
+                if other_connection is not connection:
+                    other_connection.disconnect()
+
+            self._clear_queues()
+            self.connections.clear()
+            return data
+
+        del self.connections[lane]
+        self.requeued_requests.pop(lane, None)
+
+        for uuid, request_info in list(self.requests_made.items()):
+            if request_info.lane == lane:
+                del self.requests_made[uuid]
 
-        data = self.connection.disconnect()
-        self._clear_queues()
-        self.connection = None
         return data
 
     @connected
-    def data_to_send(self):
-        # type: () -> bytes
-        assert self.connection
-        return self.connection.data_to_send()
+    def data_to_send(self, lane=ConnectionLane.interactive):
+        # type: (ConnectionLane) -> bytes
+        """Get the data that needs to be sent to the socket of a lane."""
+        return self._get_lane_connection(lane).data_to_send()
 
     @connected
     def login(self, password, device_name=""):
@@ -787,6 +1252,7 @@ class HttpClient(Client):
                         "content": content,
                         "type": message_type
                     },
+                    room.users
                 )
                 message_type = "m.room.encrypted"
 
@@ -1026,6 +1492,10 @@ class HttpClient(Client):
         if not user_list:
             raise LocalProtocolError("No key query required.")
 
+        return self._keys_query(user_list)
+
+    def _keys_query(self, user_list):
+        # type: (List[str]) -> Tuple[UUID, bytes]
         request = self._build_request(
             Api.keys_query(
                 self.access_token,
@@ -1050,6 +1520,10 @@ class HttpClient(Client):
         user_list = self.olm.get_missing_sessions(
             list(room.users.keys())
         )
+        return self._keys_claim(room_id, user_list)
+
+    def _keys_claim(self, room_id, user_list):
+        # type: (str, Dict[str, List[str]]) -> Tuple[UUID, bytes]
         request = self._build_request(
             Api.keys_claim(
                 self.access_token,
@@ -1068,9 +1542,10 @@ class HttpClient(Client):
         self,
         room_id,
         ignore_missing_sessions=False,
-        tx_id=None
+        tx_id=None,
+        successor=False
     ):
-        # type: (str, bool, str) -> Tuple[UUID, bytes]
+        # type: (str, bool, str, bool) -> Tuple[UUID, bytes]
         assert self.olm
         try:
             room = self.rooms[room_id]
@@ -1081,14 +1556,16 @@ class HttpClient(Client):
             raise LocalProtocolError("Room with id {} is not encrypted".format(
                 room_id))
 
+        uuid = tx_id or uuid4()
+
         to_device_dict = self.olm.share_group_session(
             room_id,
             list(room.users.keys()),
-            ignore_missing_sessions
+            ignore_missing_sessions,
+            share_id=str(uuid),
+            successor=successor
         )
 
-        uuid = tx_id or uuid4()
-
         request = self._build_request(
             Api.to_device(
                 self.access_token,
@@ -1100,9 +1577,280 @@ class HttpClient(Client):
 
         return self._send(
             request,
-            RequestInfo(RequestType.share_group_session, room_id)
+            RequestInfo(
+                RequestType.share_group_session,
+                room_id,
+                successor_share=successor
+            )
         )
 
+    @connected
+    @logged_in
+    def queue_room_send(self, room_id, message_type, content, tx_id=None):
+        # type: (str, str, Dict[Any, Any], Optional[UUID]) -> UUID
+        """Queue a message that should be sent to a room.
+
+        Messages for encrypted rooms wait until the room key is shared with
+        the devices of the room members. The requests that are needed for
+        this, as well as the room send requests for the messages, are
+        created by send_queued_messages().
+
+        Args:
+            room_id (str): The room id of the room the message is sent to.
+            message_type (str): The type of the message.
+            content (Dict): The content of the message.
+            tx_id (UUID, optional): The transaction id of the message.
+
+        Returns the transaction id of the message, the room send request that
+        carries the message uses it as its uuid.
+        """
+        if room_id not in self.rooms:
+            raise LocalProtocolError(
+                "No such room with id {} found.".format(room_id)
+            )
+
+        uuid = tx_id or uuid4()
+
+        queue = self.send_queues.setdefault(room_id, SendQueue())
+        queue.messages.append(QueuedMessage(message_type, content, uuid))
+
+        return uuid
+
+    @connected
+    @logged_in
+    def send_queued_messages(self):
+        # type: () -> List[Tuple[UUID, bytes]]
+        """Create the requests that move the queued messages forward.
+
+        Only the requests that a room is still missing are created: a key
+        query if the device list of a member is outdated, a key claim for the
+        devices we don't have an Olm session with and a share of the room key
+        with the devices that don't have it yet. Requests that don't depend
+        on each other are created together, e.g. the key claim for the
+        devices we already know about goes out alongside the key query. Once
+        the room key is shared the queued messages of the room are released
+        as room send requests.
+
+        Messages for a room that contains devices which are neither verified
+        nor blacklisted stay queued until the devices are verified or
+        blacklisted.
+
+        This should be called after queuing messages and after every response
+        returned by next_response() until the send queues are empty.
+
+        The device lists and Olm sessions of the room members are only
+        checked again after a response that could change them, e.g. a sync,
+        key query or key claim response, calls after other responses don't
+        look at the room members.
+
+        Returns a list of uuid and bytes tuples, one for every request that
+        was created. The requests should be sent concurrently, the bytes need
+        to be sent to the socket of the lane the request was made on.
+        """
+        requests = []  # type: List[Tuple[UUID, bytes]]
+        in_flight = self._requests_in_flight()
+
+        query_in_flight = any(
+            info.type == RequestType.keys_query for info in in_flight
+        )
+        shares = [
+            info for info in in_flight
+            if info.type == RequestType.share_group_session
+        ]
+        # Sharing the successor of a session doesn't hold up the messages
+        # that are encrypted with the current one.
+        busy_rooms = set(
+            info.extra_data for info in in_flight
+            if info.type == RequestType.keys_claim
+        )
+        busy_rooms.update(
+            info.extra_data for info in shares if not info.successor_share
+        )
+        sharing_ahead = set(
+            info.extra_data for info in shares if info.successor_share
+        )
+
+        for room_id, queue in list(self.send_queues.items()):
+            if not queue.messages or room_id in busy_rooms:
+                continue
+
+            try:
+                room = self.rooms[room_id]
+            except KeyError:
+                logger.warn("Dropping {} queued messages for room {}, the "
+                            "room is gone.".format(len(queue.messages),
+                                                   room_id))
+                del self.send_queues[room_id]
+                continue
+
+            if not room.encrypted or not self.olm:
+                requests.extend(self._release_messages(room_id, queue))
+                continue
+
+            users = list(room.users.keys())
+
+            if not queue.checked:
+                outdated = self.olm.users_for_key_query.intersection(users)
+
+                if outdated and not query_in_flight:
+                    requests.append(
+                        self._keys_query(list(self.olm.users_for_key_query))
+                    )
+                    query_in_flight = True
+
+                # Users with outdated device lists may have new devices or
+                # new one-time keys, their devices are claimed for once the
+                # query returns.
+                queue.claimed = set(
+                    device for device in queue.claimed
+                    if device[0] not in outdated
+                )
+
+                unclaimed = self._unclaimed_devices(
+                    [user_id for user_id in users if user_id not in outdated],
+                    queue.claimed
+                )
+
+                if unclaimed:
+                    requests.append(self._keys_claim(room_id, unclaimed))
+                    queue.claimed.update(
+                        (user_id, device_id)
+                        for user_id, device_ids in unclaimed.items()
+                        for device_id in device_ids
+                    )
+
+                queue.checked = True
+                queue.waiting = bool(outdated or unclaimed)
+
+            if queue.waiting:
+                continue
+
+            session = self.olm.outbound_group_sessions.get(room_id)
+
+            if not session:
+                self.olm.create_outbound_group_session(room_id)
+            elif session.expired:
+                self.olm.rotate_outbound_group_session(room_id)
+
+            try:
+                session = self.olm.outbound_group_sessions[room_id]
+
+                # Devices the key couldn't be shared with because they have
+                # no Olm session aren't counted as missing the room key.
+                if (not session.shared
+                        or self.olm.get_devices_without_room_key(room_id,
+                                                                 users)):
+                    requests.append(self.share_group_session(room_id, True))
+                    continue
+
+                requests.extend(self._release_messages(room_id, queue))
+
+                if queue.messages:
+                    # The session expired while the messages were encrypted,
+                    # its replacement needs to be shared first.
+                    requests.append(self.share_group_session(room_id, True))
+                elif (room_id not in sharing_ahead
+                      and self.olm.should_share_ahead(room_id)):
+                    requests.append(
+                        self.share_group_session(room_id, True, successor=True)
+                    )
+            except OlmTrustError as e:
+                logger.warn("Can't share the room key for room {}: {}".format(
+                    room_id, e))
+                queue.waiting = True
+
+        return requests
+
+    def _requests_in_flight(self):
+        # type: () -> List[RequestInfo]
+        return list(self.requests_made.values()) + [
+            request_info for request_info, _ in self.parse_queue
+        ]
+
+    def _unclaimed_devices(self, users, claimed):
+        # type: (List[str], Set[Tuple[str, str]]) -> Dict[str, List[str]]
+        """Get the devices of the users that need a one-time key claimed.
+
+        Devices that were already claimed for are skipped without looking up
+        their Olm sessions, as are blacklisted devices which never get the
+        room key.
+        """
+        assert self.olm
+        unclaimed = dict()  # type: Dict[str, List[str]]
+
+        devices = [
+            device
+            for user_id in users
+            for device in self.olm.device_store.active_user_devices(user_id)
+            if device.id != self.olm.device_id
+            and (user_id, device.id) not in claimed
+            and not self.olm.is_device_blacklisted(device)
+        ]
+        with_sessions = self.olm.session_store.keys_with_sessions(
+            device.curve25519 for device in devices
+        )
+
+        for device in devices:
+            if device.curve25519 not in with_sessions:
+                unclaimed.setdefault(device.user_id, []).append(device.id)
+
+        return unclaimed
+
+    def _recheck_send_queues(self):
+        # type: () -> None
+        for queue in self.send_queues.values():
+            queue.checked = False
+
+    def _invalidate_outbound_sessions(self, device):
+        # type: (OlmDevice) -> None
+        super()._invalidate_outbound_sessions(device)
+        # A device got verified or blacklisted, rooms that waited on its
+        # trust state may be able to share their room key now.
+        self._recheck_send_queues()
+
+    def receive_response(self, response):
+        # type: (Response) -> None
+        super().receive_response(response)
+
+        # Only these responses change the device lists, Olm sessions or room
+        # members the send queues depend on, the rooms don't need to be
+        # checked again after any other response.
+        if isinstance(response, (
+            SyncResponse,
+            PartialSyncResponse,
+            SyncError,
+            JoinedMembersResponse,
+            JoinedMembersError,
+            KeysQueryResponse,
+            KeysQueryError,
+            KeysClaimResponse,
+            KeysClaimError,
+            ShareGroupSessionResponse,
+            ShareGroupSessionError,
+        )):
+            self._recheck_send_queues()
+
+    def _release_messages(self, room_id, queue):
+        # type: (str, SendQueue) -> List[Tuple[UUID, bytes]]
+        requests = []  # type: List[Tuple[UUID, bytes]]
+
+        while queue.messages:
+            message = queue.messages[0]
+
+            try:
+                requests.append(self.room_send(
+                    room_id,
+                    message.message_type,
+                    message.content,
+                    message.tx_id
+                ))
+            except GroupEncryptionError:
+                break
+
+            queue.messages.popleft()
+
+        return requests
+
     @connected
     @logged_in
     def devices(self):
@@ -1195,83 +1943,62 @@ class HttpClient(Client):
 
         return self._send(request, RequestInfo(RequestType.sync))
 
+    @connected
+    def send_request(
+        self,
+        request_type,     # type: Any
+        api_call,         # type: Tuple[Any, ...]
+        extra_data=None,  # type: Any
+        timeout=0         # type: int
+    ):
+        # type: (...) -> Tuple[UUID, bytes]
+        """Send a request to an endpoint that has no dedicated method.
+
+        The response for the request is created according to the
+        ResponseRoute registered for the request type in RESPONSE_ROUTES.
+
+        Returns a unique uuid that identifies the request and the bytes that
+        should be sent to the socket.
+
+        Args:
+            request_type: The request type, either a RequestType or any
+                other key that was registered in RESPONSE_ROUTES.
+            api_call (Tuple): The method, path and optionally the body of the
+                request as returned by the Api methods.
+            extra_data (optional): Data that is passed to the from_dict()
+                method of the response class if the route asks for it.
+            timeout (int, optional): The timeout of the request.
+        """
+        if request_type not in RESPONSE_ROUTES:
+            raise LocalProtocolError(
+                "No response route for request type {}".format(request_type)
+            )
+
+        request = self._build_request(api_call, timeout)
+        return self._send(request, RequestInfo(request_type, extra_data))
+
     @staticmethod
     def _create_response(request_info, transport_response, max_events=0):
-        request_type = request_info.type
         try:
-            parsed_dict = json.loads(transport_response.text, encoding="utf-8")
+            parsed_dict = json_codec.loads(transport_response.body)
         except JSONDecodeError:
             parsed_dict = {}
 
-        if request_type is RequestType.login:
-            response = LoginResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.sync:
-            response = SyncResponse.from_dict(parsed_dict, max_events)
-        elif request_type is RequestType.room_send:
-            response = RoomSendResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.room_put_state:
-            response = RoomPutStateResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.room_redact:
-            response = RoomRedactResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.room_kick:
-            response = RoomKickResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.room_invite:
-            response = RoomInviteResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.join:
-            response = JoinResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.room_leave:
-            response = RoomLeaveResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.room_messages:
-            response = RoomMessagesResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.room_typing:
-            response = RoomTypingResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.room_read_markers:
-            response = RoomReadMarkersResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.keys_upload:
-            response = KeysUploadResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.keys_query:
-            response = KeysQueryResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.keys_claim:
-            response = KeysClaimResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.share_group_session:
-            response = ShareGroupSessionResponse.from_dict(
-                parsed_dict,
-                request_info.extra_data
-            )
-        elif request_type is RequestType.devices:
-            response = DevicesResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.update_device:
-            response = UpdateDeviceResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.joined_members:
-            response = JoinedMembersResponse.from_dict(
+        route = request_info.route
+        response_class = route.status_overrides.get(
+            transport_response.status_code,
+            route.response_class
+        )
+
+        if route.partial:
+            response = response_class.from_dict(parsed_dict, max_events)
+        elif route.extra_data:
+            response = response_class.from_dict(
                 parsed_dict,
                 request_info.extra_data
             )
-        elif request_type is RequestType.delete_devices:
-            if transport_response.status_code == 401:
-                response = DeleteDevicesAuthResponse.from_dict(parsed_dict)
-            else:
-                response = DeleteDevicesResponse.from_dict(parsed_dict)
-        elif request_type is RequestType.profile_set_displayname:
-            response = ProfileSetDisplayNameResponse.from_dict(parsed_dict)
+        else:
+            response = response_class.from_dict(parsed_dict)
 
         assert response
 
@@ -1293,17 +2020,31 @@ class HttpClient(Client):
             self.olm.save_account()
 
     @connected
-    def receive(self, data):
-        # type: (bytes) -> None
-        """Pass received data to the client"""
-        assert self.connection
+    def receive(self, data, lane=ConnectionLane.interactive):
+        # type: (bytes, ConnectionLane) -> None
+        """Pass received data to the client.
+
+        Every response that the data completes is put into the parse queue.
+
+        Args:
+            data (bytes): The data that was received.
+            lane (ConnectionLane): The lane whose socket received the data.
+        """
+        connection = self._get_lane_connection(lane)
 
         try:
-            response = self.connection.receive(data)
+            responses = connection.receive(data)
         except (h11.RemoteProtocolError, h2.exceptions.ProtocolError) as e:
             raise RemoteTransportError(e)
 
-        if response:
+        if isinstance(connection, HttpConnection) and connection.closed:
+            responses.extend(self._take_over_requests(lane, connection))
+
+        self._queue_responses(responses)
+
+    def _queue_responses(self, responses):
+        # type: (List[TransportResponse]) -> None
+        for response in responses:
             try:
                 request_info = self.requests_made.pop(response.uuid)
             except KeyError:
@@ -1323,7 +2064,6 @@ class HttpClient(Client):
                 )
 
             self.parse_queue.append((request_info, response))
-        return
 
     def next_response(self, max_events=0):
         # type: (int) -> Optional[Union[TransportResponse, Response]]
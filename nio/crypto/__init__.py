@@ -5,12 +5,15 @@ from .sessions import (
     InboundSession,
     OutboundGroupSession,
     InboundGroupSession,
-    OlmDevice
+    OlmDevice,
+    RotationPolicy
 )
 
 from .memorystores import (
     SessionStore,
+    LazySessionStore,
     GroupSessionStore,
+    LazyGroupSessionStore,
     DeviceStore
 )
 
@@ -14,50 +14,254 @@
 # CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-from collections import defaultdict
-from typing import DefaultDict, Iterator, Optional, List, Dict
+from builtins import super
+from collections import OrderedDict, defaultdict
+from typing import (
+    Callable,
+    DefaultDict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    List,
+    Dict,
+    Set,
+    Tuple
+)
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    # Python 2 has no read-only dict view, hand out copies instead.
+    MappingProxyType = dict  # type: ignore
 
 if False:
     from .sessions import OlmDevice, InboundGroupSession, Session
 
 
 class SessionStore(object):
+    """Store holding the Olm sessions of devices.
+
+    The sessions of a device are ordered by their last successful use, the
+    most recently used session comes first. Adding a session makes it the
+    most recently used one.
+
+    Attributes:
+        version (int): Incremented every time a session is added, a changed
+            version means devices may have gained a session.
+    """
+
     def __init__(self):
         # type: () -> None
-        self._entries = defaultdict(list) \
-            # type: DefaultDict[str, List[Session]]
+        self._entries = dict() \
+            # type: Dict[str, OrderedDict[str, Session]]
+        self.version = 0
+
+    def _sessions(self, curve_key):
+        # type: (str) -> Optional[OrderedDict[str, Session]]
+        return self._entries.get(curve_key)
 
     def add(self, curve_key, session):
         # type: (str, Session) -> bool
-        if session in self._entries[curve_key]:
+        sessions = self._sessions(curve_key)
+
+        if sessions is None:
+            sessions = self._entries[curve_key] = OrderedDict()
+
+        if session.id in sessions:
+            return False
+
+        sessions[session.id] = session
+        self.version += 1
+        return True
+
+    def promote(self, curve_key, session):
+        # type: (str, Session) -> bool
+        """Mark the session as the most recently used one of its device.
+
+        Returns True if the session was found in the store, False otherwise.
+        """
+        sessions = self._sessions(curve_key)
+
+        if not sessions or session.id not in sessions:
             return False
 
-        self._entries[curve_key].append(session)
-        self._entries[curve_key].sort(key=lambda x: x.id)
+        sessions[session.id] = sessions.pop(session.id)
         return True
 
     def __iter__(self):
         # type: () -> Iterator[Session]
-        for session_list in self._entries.values():
+        for session_list in self.values():
             for session in session_list:
                 yield session
 
+    @staticmethod
+    def _ordered(sessions):
+        # type: (OrderedDict[str, Session]) -> List[Session]
+        return [sessions[session_id] for session_id in reversed(sessions)]
+
     def values(self):
-        return self._entries.values()
+        # type: () -> List[List[Session]]
+        return [self._ordered(s) for s in list(self._entries.values())]
 
     def items(self):
-        return self._entries.items()
+        # type: () -> List[Tuple[str, List[Session]]]
+        return [
+            (curve_key, self._ordered(sessions))
+            for curve_key, sessions in list(self._entries.items())
+        ]
 
     def get(self, curve_key):
         # type: (str) -> Optional[Session]
-        if self._entries[curve_key]:
-            return self._entries[curve_key][0]
+        """Get the most recently used session of a device."""
+        sessions = self._sessions(curve_key)
+
+        if sessions:
+            return sessions[next(reversed(sessions))]
 
         return None
 
     def __getitem__(self, curve_key):
         # type: (str) -> List[Session]
-        return self._entries[curve_key]
+        """Get the sessions of a device, most recently used first."""
+        sessions = self._sessions(curve_key)
+
+        if not sessions:
+            return []
+
+        return self._ordered(sessions)
+
+    def get_many(self, curve_keys):
+        # type: (Iterable[str]) -> Dict[str, Session]
+        """Get the most recently used session of many devices.
+
+        Returns a dictionary mapping the curve keys that have a session to
+        their most recently used session.
+        """
+        found = dict()  # type: Dict[str, Session]
+
+        for curve_key in curve_keys:
+            sessions = self._entries.get(curve_key)
+
+            if sessions:
+                found[curve_key] = sessions[next(reversed(sessions))]
+
+        return found
+
+    def keys_with_sessions(self, curve_keys):
+        # type: (Iterable[str]) -> Set[str]
+        """Get the curve keys out of the given ones that have a session."""
+        return set(
+            curve_key for curve_key in curve_keys
+            if self._entries.get(curve_key)
+        )
+
+
+SessionLoader = Callable[[str], List["Session"]]
+SessionBatchLoader = Callable[[Iterable[str]], Dict[str, List["Session"]]]
+SessionKeysLoader = Callable[[Iterable[str]], Set[str]]
+
+
+class LazySessionStore(SessionStore):
+    """Olm session store that loads sessions on demand.
+
+    The sessions of a curve key are fetched using the loader the first time
+    they are needed, the sessions of at most max_keys curve keys are kept in
+    memory, the least recently used ones are dropped first.
+
+    Lookups of many curve keys at once, get_many() and keys_with_sessions(),
+    don't put the loaded sessions into memory, a pass over more devices than
+    max_keys would otherwise drop the sessions it just loaded.
+
+    Args:
+        loader (Callable): Function that loads the list of sessions for a
+            curve key, ordered from the least to the most recently used one.
+        max_keys (int): The maximal number of curve keys whose sessions are
+            kept in memory.
+        batch_loader (Callable, optional): Function that loads the sessions
+            of many curve keys at once, returns a dictionary mapping the
+            curve keys that have sessions to their list of sessions. The
+            loader is called for every curve key if it isn't given.
+        keys_loader (Callable, optional): Function that returns the set of
+            curve keys out of the given ones that have sessions, without
+            loading the sessions. The batch loader is used if it isn't given.
+    """
+
+    def __init__(
+        self,
+        loader,  # type: SessionLoader
+        max_keys=1000,  # type: int
+        batch_loader=None,  # type: Optional[SessionBatchLoader]
+        keys_loader=None,  # type: Optional[SessionKeysLoader]
+    ):
+        # type: (...) -> None
+        super().__init__()
+        self._loader = loader
+        self._batch_loader = batch_loader
+        self._keys_loader = keys_loader
+        self.max_keys = max_keys
+        self._entries = OrderedDict() \
+            # type: OrderedDict[str, OrderedDict[str, Session]]
+
+    def _sessions(self, curve_key):
+        # type: (str) -> OrderedDict[str, Session]
+        sessions = self._entries.pop(curve_key, None)
+
+        if sessions is None:
+            sessions = OrderedDict(
+                (session.id, session) for session in self._loader(curve_key)
+            )
+
+        self._entries[curve_key] = sessions
+
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+        return sessions
+
+    def _load_many(self, curve_keys):
+        # type: (List[str]) -> Dict[str, List[Session]]
+        if self._batch_loader:
+            return self._batch_loader(curve_keys)
+
+        loaded = dict()  # type: Dict[str, List[Session]]
+
+        for curve_key in curve_keys:
+            sessions = self._loader(curve_key)
+
+            if sessions:
+                loaded[curve_key] = sessions
+
+        return loaded
+
+    def get_many(self, curve_keys):
+        # type: (Iterable[str]) -> Dict[str, Session]
+        curve_keys = list(curve_keys)
+        found = super().get_many(curve_keys)
+
+        unknown = [k for k in curve_keys if k not in self._entries]
+
+        for curve_key, sessions in self._load_many(unknown).items():
+            found[curve_key] = sessions[-1]
+
+        return found
+
+    def keys_with_sessions(self, curve_keys):
+        # type: (Iterable[str]) -> Set[str]
+        curve_keys = list(curve_keys)
+        found = super().keys_with_sessions(curve_keys)
+
+        unknown = [k for k in curve_keys if k not in self._entries]
+
+        if not unknown:
+            return found
+
+        if self._keys_loader:
+            found.update(self._keys_loader(unknown))
+        else:
+            found.update(self._load_many(unknown))
+
+        return found
 
 
 class GroupSessionStore(object):
@@ -82,21 +286,103 @@ class GroupSessionStore(object):
 
     def get(self, room_id, sender_key, session_id):
         # type: (str, str, str) -> Optional[InboundGroupSession]
-        if session_id in self._entries[room_id][sender_key]:
-            return self._entries[room_id][sender_key][session_id]
+        room_sessions = self._entries.get(room_id)
 
-        return None
+        if not room_sessions:
+            return None
+
+        sender_sessions = room_sessions.get(sender_key)
+
+        if not sender_sessions:
+            return None
+
+        return sender_sessions.get(session_id)
 
     def __getitem__(self, room_id):
         # type: (str) -> DefaultDict[str, Dict[str, InboundGroupSession]]
         return self._entries[room_id]
 
 
+GroupSessionLoader = Callable[[str, str, str], Optional["InboundGroupSession"]]
+
+
+class LazyGroupSessionStore(object):
+    """Group session store that loads sessions on demand.
+
+    Sessions that aren't in memory are fetched using the loader, at most
+    max_sessions sessions are kept in memory, the least recently used ones
+    are dropped first.
+
+    Args:
+        loader (Callable): Function that loads a session given a room id,
+            sender key and session id, returns None if the session doesn't
+            exist.
+        max_sessions (int): The maximal number of sessions kept in memory.
+    """
+
+    def __init__(self, loader, max_sessions=1000):
+        # type: (GroupSessionLoader, int) -> None
+        self._loader = loader
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict() \
+            # type: OrderedDict[Tuple[str, str, str], InboundGroupSession]
+
+    def __iter__(self):
+        # type: () -> Iterator[InboundGroupSession]
+        for session in list(self._entries.values()):
+            yield session
+
+    def _insert(self, key, session):
+        # type: (Tuple[str, str, str], InboundGroupSession) -> None
+        self._entries.pop(key, None)
+        self._entries[key] = session
+
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def add(self, session, room_id, sender_key):
+        # type: (InboundGroupSession, str, str) -> bool
+        key = (room_id, sender_key, session.id)
+
+        if self._entries.get(key) is session:
+            return False
+
+        self._insert(key, session)
+        return True
+
+    def get(self, room_id, sender_key, session_id):
+        # type: (str, str, str) -> Optional[InboundGroupSession]
+        key = (room_id, sender_key, session_id)
+        session = self._entries.get(key)
+
+        if not session:
+            session = self._loader(room_id, sender_key, session_id)
+
+            if not session:
+                return None
+
+        self._insert(key, session)
+        return session
+
+
 class DeviceStore(object):
+    """Store holding the devices of users.
+
+    Devices are indexed by their owner and device id as well as by their
+    curve25519 and ed25519 keys.
+
+    Attributes:
+        version (int): Incremented every time a device is added or its keys
+            change.
+    """
+
     def __init__(self):
         # type: () -> None
         self._entries = defaultdict(dict)  \
             # type: DefaultDict[str, Dict[str, OlmDevice]]
+        self._curve25519_keys = dict()  # type: Dict[str, OlmDevice]
+        self._ed25519_keys = dict()  # type: Dict[str, OlmDevice]
+        self.version = 0
 
     def __iter__(self):
         # type: () -> Iterator[OlmDevice]
@@ -105,12 +391,25 @@ class DeviceStore(object):
                 yield device
 
     def __getitem__(self, user_id):
-        # type: (str) -> Dict[str, OlmDevice]
-        return self._entries[user_id]
+        # type: (str) -> Mapping[str, OlmDevice]
+        """Get the devices of a user, keyed by their device id.
+
+        The mapping is read-only, devices are added to the store using add()
+        so the key indexes stay up to date.
+        """
+        return MappingProxyType(self._entries.get(user_id, {}))
+
+    def __contains__(self, device):
+        # type: (object) -> bool
+        try:
+            user_devices = self._entries.get(device.user_id, {})
+            return user_devices.get(device.id) is device
+        except AttributeError:
+            return False
 
     def active_user_devices(self, user_id):
         # type: (str) -> Iterator[OlmDevice]
-        for device in self._entries[user_id].values():
+        for device in self._entries.get(user_id, {}).values():
             if not device.deleted:
                 yield device
 
@@ -121,12 +420,70 @@ class DeviceStore(object):
 
     def devices(self, user_id):
         # type (str) -> str
-        return self._entries[user_id].keys()
+        return self._entries.get(user_id, {}).keys()
+
+    def get(self, user_id, device_id):
+        # type: (str, str) -> Optional[OlmDevice]
+        """Get a device by its owner and device id."""
+        user_devices = self._entries.get(user_id)
+
+        if not user_devices:
+            return None
+
+        return user_devices.get(device_id)
+
+    def get_by_curve25519(self, curve_key):
+        # type: (str) -> Optional[OlmDevice]
+        """Get the device that owns the given curve25519 key."""
+        device = self._curve25519_keys.get(curve_key)
+
+        if device and device.curve25519 == curve_key:
+            return device
+
+        return None
+
+    def get_by_ed25519(self, ed25519_key):
+        # type: (str) -> Optional[OlmDevice]
+        """Get the device that owns the given ed25519 key."""
+        device = self._ed25519_keys.get(ed25519_key)
+
+        if device and device.ed25519 == ed25519_key:
+            return device
+
+        return None
+
+    def _unindex(self, device):
+        # type: (OlmDevice) -> None
+        if self._curve25519_keys.get(device.curve25519) is device:
+            del self._curve25519_keys[device.curve25519]
+
+        if self._ed25519_keys.get(device.ed25519) is device:
+            del self._ed25519_keys[device.ed25519]
 
     def add(self, device):
         # type: (OlmDevice) -> bool
-        if device in self:
+        user_devices = self._entries[device.user_id]
+        old_device = user_devices.get(device.id)
+
+        if old_device is device:
             return False
 
-        self._entries[device.user_id][device.id] = device
+        if old_device:
+            self._unindex(old_device)
+
+        user_devices[device.id] = device
+        self._curve25519_keys[device.curve25519] = device
+        self._ed25519_keys[device.ed25519] = device
+        self.version += 1
+
         return True
+
+    def update_curve25519(self, device, curve_key):
+        # type: (OlmDevice, str) -> None
+        """Change the curve25519 key of a device in the store."""
+        if self._curve25519_keys.get(device.curve25519) is device:
+            del self._curve25519_keys[device.curve25519]
+
+        device.curve25519 = curve_key
+        self._curve25519_keys[curve_key] = device
+        self.version += 1
@@ -16,7 +16,6 @@
 
 from __future__ import unicode_literals
 
-import json
 import os
 
 # pylint: disable=redefined-builtin
@@ -28,6 +27,7 @@ from typing import (
     DefaultDict,
     Deque,
     Dict,
+    Iterable,
     Iterator,
     List,
     NamedTuple,
@@ -47,7 +47,7 @@ from olm import (
     OlmSessionError,
 )
 
-from ..schemas import Schemas, validate_json
+from ..schemas import Schemas, strict_validation, validate_json
 from ..exceptions import (
     EncryptionError,
     GroupEncryptionError,
@@ -56,6 +56,7 @@ from ..exceptions import (
 )
 from . import (
     OutboundGroupSession,
+    RotationPolicy,
     InboundGroupSession,
     OlmDevice,
     OlmAccount,
@@ -63,7 +64,9 @@ from . import (
     OutboundSession,
     InboundSession,
     SessionStore,
+    LazySessionStore,
     GroupSessionStore,
+    LazyGroupSessionStore,
     DeviceStore,
     logger
 )
@@ -87,6 +90,7 @@ from ..events import (
     UnknownBadEvent,
     validate_or_badevent
 )
+from .. import json_codec
 from ..api import Api
 
 try:
@@ -94,6 +98,18 @@ try:
 except ImportError:  # pragma: no cover
     JSONDecodeError = ValueError  # type: ignore
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    # Python 2 without the futures backport, room keys are encrypted in the
+    # calling thread.
+    ThreadPoolExecutor = None  # type: ignore
+
+
+# The minimal number of devices a room key is shared with before the
+# encryption is done in the encryption thread pool.
+PARALLEL_ENCRYPTION_THRESHOLD = 64
+
 
 class Olm(object):
     def __init__(
@@ -101,10 +117,19 @@ class Olm(object):
         user_id,    # type: str
         device_id,  # type: str
         store,      # type: MatrixStore
+        session_cache_size=None,  # type: Optional[int]
+        group_session_cache_size=None,  # type: Optional[int]
+        encryption_workers=0,  # type: int
+        rotation_policy=None,  # type: Optional[RotationPolicy]
     ):
         # type: (...) -> None
         self.user_id = user_id
         self.device_id = device_id
+        self.session_cache_size = session_cache_size
+        self.group_session_cache_size = group_session_cache_size
+        self.encryption_workers = encryption_workers
+        self.rotation_policy = rotation_policy or RotationPolicy()
+        self.store = store
         self.uploaded_key_count = None  # type: Optional[int]
         self.users_for_key_query = set()   # type: Set[str]
 
@@ -114,18 +139,22 @@ class Olm(object):
         # Dict[user_id, Dict[device_id, OlmDevice]]
         self.device_store = DeviceStore()
         # Dict[curve25519_key, List[Session]]
-        self.session_store = SessionStore()
+        self.session_store = self._create_session_store() \
+            # type: Union[SessionStore, LazySessionStore]
         # Dict[RoomId, Dict[curve25519_key, Dict[session id, Session]]]
-        self.inbound_group_store = GroupSessionStore()
+        self.inbound_group_store = self._create_group_session_store() \
+            # type: Union[GroupSessionStore, LazyGroupSessionStore]
 
         # Dict of outbound Megolm sessions Dict[room_id]
         self.outbound_group_sessions = {} \
             # type: Dict[str, OutboundGroupSession]
+        # Dict of the sessions replacing the outbound Megolm sessions once they
+        # expire Dict[room_id]
+        self.group_session_successors = {} \
+            # type: Dict[str, OutboundGroupSession]
 
         self.tracked_users = set()  # type: Set[str]
 
-        self.store = store
-
         self.account = self.store.load_account()
 
         if not self.account:
@@ -263,9 +292,9 @@ class Olm(object):
             for device_id, one_time_key in user_devices.items():
                 # We need to find the device curve key for the wanted
                 # user and his device.
-                try:
-                    device = self.device_store[user_id][device_id]
-                except KeyError:
+                device = self.device_store.get(user_id, device_id)
+
+                if not device:
                     logger.warn("Curve key for user {} and device {} not "
                                 "found, failed to start Olm session".format(
                                     user_id,
@@ -354,21 +383,21 @@ class Olm(object):
                     )
                     continue
 
-                user_devices = self.device_store[user_id]
-                try:
-                    device = user_devices[device_id]
-                except KeyError:
+                device = self.device_store.get(user_id, device_id)
+
+                if not device:
                     logger.info("Adding new device to the device store for "
                                 "user {} with device id {}".format(
                                     user_id,
                                     device_id
                                 ))
-                    self.device_store.add(OlmDevice(
+                    device = OlmDevice(
                         user_id,
                         device_id,
                         ed25519_key=signing_key,
                         curve25519_key=curve_key,
-                    ))
+                    )
+                    self.device_store.add(device)
                 else:
                     if device.ed25519 != signing_key:
                         logger.warning("Ed25519 key has changed for device %s "
@@ -376,14 +405,14 @@ class Olm(object):
                         continue
                     if device.curve25519 == curve_key:
                         continue
-                    device.curve25519 = curve_key
+                    self.device_store.update_curve25519(device, curve_key)
                     logger.info("Updating curve key in the device store for "
                                 "user {} with device id {}".format(
                                     user_id,
                                     device_id
                                 ))
 
-                changed[user_id][device_id] = user_devices[device_id]
+                changed[user_id][device_id] = device
 
             current_devices = set(device_dict.keys())
             stored_devices = set(
@@ -393,7 +422,7 @@ class Olm(object):
             deleted_devices = stored_devices - current_devices
 
             for device_id in deleted_devices:
-                device = self.device_store[user_id][device_id]
+                device = self.device_store.get(user_id, device_id)
                 device.deleted = True
                 logger.info("Marking device {} of user {} as deleted".format(
                     user_id, device_id))
@@ -417,10 +446,29 @@ class Olm(object):
 
         elif isinstance(response, ShareGroupSessionResponse):
             room_id = response.room_id
-            session = self.outbound_group_sessions[room_id]
+            share_id = str(response.uuid) if response.uuid else None
+            session = self.outbound_group_sessions.get(room_id)
+            successor = self.group_session_successors.get(room_id)
+
+            if successor and share_id in successor.pending_shares:
+                logger.info("Marking successor group session for room {} "
+                            "as shared".format(room_id))
+                successor.mark_as_shared(share_id)
+                return
+
+            # The session might have been invalidated while the request was
+            # in flight.
+            if not session:
+                return
+
             logger.info("Marking outbound group session for room {} "
                         "as shared".format(room_id))
-            session.shared = True
+            recipients = session.mark_as_shared(share_id)
+            self.store.save_outbound_group_session(
+                room_id,
+                session,
+                recipients
+            )
 
     def _create_inbound_session(
         self,
@@ -447,8 +495,31 @@ class Olm(object):
 
     def unblacklist_device(self, device):
         # type: (OlmDevice) -> bool
+        # The device needs the room keys again.
+        self.invalidate_room_key_check()
         return self.store.unblacklist_device(device)
 
+    def invalidate_room_key_check(self, room_id=None):
+        # type: (Optional[str]) -> None
+        """Check again that every room device has the room key on the next
+        group_encrypt() call.
+
+        The check is redone on its own when devices or Olm sessions are
+        added, this needs to be called if the members of a room change.
+
+        Args:
+            room_id (str, optional): The room whose check should be redone,
+                the checks of all rooms are redone if not given.
+        """
+        if room_id is None:
+            sessions = list(self.outbound_group_sessions.values())
+        else:
+            session = self.outbound_group_sessions.get(room_id)
+            sessions = [session] if session else []
+
+        for session in sessions:
+            session.key_check = None
+
     def verify_device(self, device):
         # type: (OlmDevice) -> bool
         return self.store.verify_device(device)
@@ -473,7 +544,7 @@ class Olm(object):
         # database.
         self.save_account()
         self.session_store.add(curve_key, session)
-        self.save_session(curve_key, session)
+        self.store.save_session(curve_key, session)
 
     def create_group_session(
         self, sender_key, sender_fp_key, room_id, session_id, session_key
@@ -498,13 +569,12 @@ class Olm(object):
             return
 
         self.inbound_group_store.add(session, room_id, sender_key)
-        self.save_inbound_group_session(room_id, sender_key, session)
+        self.store.save_inbound_group_session(room_id, sender_key, session)
 
-    def create_outbound_group_session(self, room_id):
-        # type: (str) -> None
-        logger.info("Creating outbound group session for {}".format(room_id))
+    def _new_outbound_group_session(self, room_id):
+        # type: (str) -> OutboundGroupSession
         session = OutboundGroupSession()
-        self.outbound_group_sessions[room_id] = session
+        self.rotation_policy.apply(session)
 
         id_key = self.account.identity_keys["curve25519"]
         fp_key = self.account.identity_keys["ed25519"]
@@ -512,23 +582,116 @@ class Olm(object):
         self.create_group_session(
             id_key, fp_key, room_id, session.id, session.session_key
         )
+
+        return session
+
+    def create_outbound_group_session(self, room_id):
+        # type: (str) -> None
+        logger.info("Creating outbound group session for {}".format(room_id))
+        session = self._new_outbound_group_session(room_id)
+        self.outbound_group_sessions[room_id] = session
+        self.group_session_successors.pop(room_id, None)
+        self.store.remove_outbound_group_session(room_id)
+        self.store.save_outbound_group_session(room_id, session)
         logger.info("Created outbound group session for {}".format(room_id))
 
+    def create_successor_group_session(self, room_id):
+        # type: (str) -> OutboundGroupSession
+        """Create the session that replaces the outbound group session of a
+        room once it expires.
+
+        The successor can be shared ahead of time, so the room doesn't need
+        to wait for a key share once the current session expires.
+        """
+        logger.info("Creating successor group session for {}".format(room_id))
+        session = self._new_outbound_group_session(room_id)
+        self.group_session_successors[room_id] = session
+        return session
+
+    def should_share_ahead(self, room_id):
+        # type: (str) -> bool
+        """Should the successor of the outbound group session of a room be
+        shared.
+
+        Returns True if the current session is shared and is close to expiry
+        according to the rotation policy, while its successor isn't shared
+        yet.
+        """
+        session = self.outbound_group_sessions.get(room_id)
+
+        if not session or not session.shared:
+            return False
+
+        successor = self.group_session_successors.get(room_id)
+
+        if successor and successor.shared:
+            return False
+
+        return session.should_share_ahead(self.rotation_policy.share_ahead)
+
     def get_missing_sessions(self, users):
         # type: (List[str]) -> Dict[str, List[str]]
         missing = defaultdict(list)  # type: DefaultDict[str, List[str]]
 
-        for user_id in users:
-            for device in self.device_store.active_user_devices(user_id):
-                # we don't need a session for our own device, skip it
-                if device.id == self.device_id:
-                    continue
+        # we don't need a session for our own device, skip it
+        devices = [
+            device
+            for user_id in users
+            for device in self.device_store.active_user_devices(user_id)
+            if device.id != self.device_id
+        ]
+        with_sessions = self.session_store.keys_with_sessions(
+            device.curve25519 for device in devices
+        )
 
-                if not self.session_store.get(device.curve25519):
-                    logger.warn(
-                        "Missing session for device {}".format(device.id)
-                    )
-                    missing[user_id].append(device.id)
+        for device in devices:
+            if device.curve25519 not in with_sessions:
+                logger.warn(
+                    "Missing session for device {}".format(device.id)
+                )
+                missing[device.user_id].append(device.id)
+
+        return missing
+
+    def get_devices_without_room_key(self, room_id, users):
+        # type: (str, List[str]) -> Dict[str, List[str]]
+        """Get the devices the outbound group session of a room wasn't shared
+        with.
+
+        Blacklisted devices and our own device are left out, so are devices
+        a share skipped because there was no Olm session with them, as long
+        as there still is none.
+
+        Args:
+            room_id (str): The room the outbound group session belongs to.
+            users (List[str]): The members of the room.
+
+        Returns a dictionary mapping user ids to a list of device ids.
+        """
+        session = self.outbound_group_sessions.get(room_id)
+        shared_with = session.shared_with if session else set()
+        skipped = session.skipped_devices if session else set()
+
+        missing = defaultdict(list)  # type: DefaultDict[str, List[str]]
+        devices = [
+            device
+            for user_id in users
+            for device in self.device_store.active_user_devices(user_id)
+            if device.id != self.device_id
+            and (user_id, device.id) not in shared_with
+            and not self.is_device_blacklisted(device)
+        ]
+        with_sessions = self.session_store.keys_with_sessions(
+            device.curve25519 for device in devices
+            if (device.user_id, device.id) in skipped
+        )
+
+        for device in devices:
+            if ((device.user_id, device.id) in skipped
+                    and device.curve25519 not in with_sessions):
+                continue
+
+            missing[device.user_id].append(device.id)
 
         return missing
 
@@ -541,8 +704,8 @@ class Olm(object):
         # type: (...) -> Optional[str]
         plaintext = None
 
-        # Let's try to decrypt with each known session for the sender.
-        # for a specific device?
+        # Let's try to decrypt with each known session for the sender, the
+        # most recently used sessions are tried first.
         for session in self.session_store[sender_key]:
             matches = False
             try:
@@ -561,6 +724,7 @@ class Olm(object):
                 )
 
                 plaintext = session.decrypt(message)
+                self.session_store.promote(sender_key, session)
                 self.save_session(sender_key, session)
 
                 logger.info(
@@ -595,12 +759,22 @@ class Olm(object):
 
         return None
 
-    def _verify_olm_payload(self, sender, payload):
-        # type: (str, Dict[Any, Any]) -> bool
+    def _verify_olm_payload(self, sender, sender_key, payload):
+        # type: (str, str, Dict[Any, Any]) -> bool
         # Verify that the sender in the payload matches the sender of the event
         if sender != payload["sender"]:
             raise VerificationError("Missmatched sender in Olm payload")
 
+        # If we know the device the sender key belongs to, verify that it
+        # belongs to the sender and that the payload claims its signing key.
+        device = self.device_store.get_by_curve25519(sender_key)
+
+        if device and (device.user_id != sender
+                       or device.ed25519 != payload["keys"]["ed25519"]):
+            raise VerificationError(
+                "Missmatched sender device keys in Olm payload"
+            )
+
         # Verify that we're the recipient of the payload.
         if self.user_id != payload["recipient"]:
             raise VerificationError("Missmatched recipient in Olm " "payload")
@@ -697,19 +871,24 @@ class Olm(object):
             verified = True
         # Else check that the message is from a verified device
         else:
-            try:
-                device = self.device_store[event.sender][event.device_id]
-            except KeyError:
+            # The sender key identifies the sending device, the device id
+            # of the event is only used if no device owns the sender key.
+            device = (
+                self.device_store.get_by_curve25519(event.sender_key)
+                or self.device_store.get(event.sender, event.device_id)
+            )
+
+            if not device:
                 # We don't have the device keys for this device, add them
                 # to our quey set so we fetch in the next key query.
                 self.users_for_key_query.add(event.sender)
-                pass
             else:
                 # Do not mark events decrypted using a forwarded key as
                 # verified
                 if (self.is_device_verified(device)
                         and not session.forwarding_chain):
-                    if (device.ed25519 != session.ed25519
+                    if (device.user_id != event.sender
+                            or device.ed25519 != session.ed25519
                             or device.curve25519 != event.sender_key):
                         message = ("Device keys mismatch in event sent "
                                    "by device {}.".format(device.id))
@@ -721,29 +900,32 @@ class Olm(object):
                     verified = True
 
         try:
-            parsed_dict = json.loads(plaintext, encoding="utf-8") \
+            parsed_dict = json_codec.loads(plaintext) \
                 # type: Dict[Any, Any]
         except JSONDecodeError as e:
             raise EncryptionError("Error parsing payload: {}".format(str(e)))
 
-        bad = validate_or_badevent(
-            parsed_dict,
-            Schemas.room_megolm_decrypted
-        )
+        # The payload comes from a remote device, not from the homeserver,
+        # it's validated strictly whatever the validation mode is.
+        with strict_validation():
+            bad = validate_or_badevent(
+                parsed_dict,
+                Schemas.room_megolm_decrypted
+            )
 
-        if bad:
-            return bad
+            if bad:
+                return bad
 
-        parsed_dict["event_id"] = event.event_id
-        parsed_dict["sender"] = event.sender
-        parsed_dict["origin_server_ts"] = event.server_timestamp
+            parsed_dict["event_id"] = event.event_id
+            parsed_dict["sender"] = event.sender
+            parsed_dict["origin_server_ts"] = event.server_timestamp
 
-        if event.transaction_id:
-            parsed_dict["unsigned"] = {
-                "transaction_id": event.transaction_id
-            }
+            if event.transaction_id:
+                parsed_dict["unsigned"] = {
+                    "transaction_id": event.transaction_id
+                }
 
-        new_event = EncryptedEvent.parse_event(parsed_dict)
+            new_event = EncryptedEvent.parse_event(parsed_dict)
 
         if isinstance(new_event, UnknownBadEvent):
             return new_event
@@ -838,7 +1020,7 @@ class Olm(object):
 
         # The plaintext should be valid json, let's parse it and verify it.
         try:
-            parsed_payload = json.loads(plaintext, encoding="utf-8")
+            parsed_payload = json_codec.loads(plaintext)
         except JSONDecodeError as e:
             # Failed parsing the payload, return early.
             logger.error(
@@ -850,8 +1032,11 @@ class Olm(object):
         # well that the types of the values are the one we expect.
         # Note: The keys of the content object aren't checked here, the caller
         # should check the content depending on the type of the event
+        # The payload comes from a remote device, not from the homeserver,
+        # it's validated strictly whatever the validation mode is.
         try:
-            validate_json(parsed_payload, Schemas.olm_event)
+            with strict_validation():
+                validate_json(parsed_payload, Schemas.olm_event)
         except (ValidationError, SchemaError) as e:
             # Something is wrong with the payload log an error and return
             # early.
@@ -865,7 +1050,7 @@ class Olm(object):
         # sender/recipient/keys/recipient_keys and check if the sender device
         # is alread verified by us
         try:
-            self._verify_olm_payload(sender, parsed_payload)
+            self._verify_olm_payload(sender, sender_key, parsed_payload)
 
         except VerificationError as e:
             # We found a missmatched property don't process the event any
@@ -875,19 +1060,50 @@ class Olm(object):
 
         else:
             # Verification succeded, handle the event
-            return self._handle_olm_event(sender, sender_key, parsed_payload)
+            with strict_validation():
+                return self._handle_olm_event(
+                    sender,
+                    sender_key,
+                    parsed_payload
+                )
 
     def rotate_outbound_group_session(self, room_id):
-        logger.info("Rotating outbound group session for room {}".format(
-            room_id))
-        self.create_outbound_group_session(room_id)
+        successor = self.group_session_successors.pop(room_id, None)
+
+        if not successor or not successor.shared:
+            logger.info("Rotating outbound group session for room {}".format(
+                room_id))
+            self.create_outbound_group_session(room_id)
+            return
+
+        logger.info("Replacing outbound group session for room {} with its "
+                    "successor".format(room_id))
+        self.outbound_group_sessions[room_id] = successor
+        self.store.remove_outbound_group_session(room_id)
+        self.store.save_outbound_group_session(
+            room_id,
+            successor,
+            successor.shared_with
+        )
 
     def group_encrypt(
         self,
         room_id,  # type: str
         plaintext_dict,  # type: Dict[str, str]
+        users=None,  # type: Optional[Iterable[str]]
     ):
         # type: (...) -> Dict[str, str]
+        """Encrypt a room event with the outbound group session of a room.
+
+        Args:
+            room_id (str): The room the event is sent to.
+            plaintext_dict (Dict): The event that should be encrypted.
+            users (Iterable[str], optional): The members of the room. If
+                given the event is only encrypted if every device of the
+                members that should get the room key has it.
+
+        Raises GroupEncryptionError if the session needs to be shared first.
+        """
         if room_id not in self.outbound_group_sessions:
             self.create_outbound_group_session(room_id)
 
@@ -901,9 +1117,27 @@ class Olm(object):
             raise GroupEncryptionError("Group session for room {} not "
                                        "shared.".format(room_id))
 
+        # Devices that joined after the key was shared would get a message
+        # they can't decrypt, the key needs to be shared with them first.
+        # The check is only redone if devices or Olm sessions were added or
+        # the room members changed since it last passed.
+        key_check = (self.device_store.version, self.session_store.version)
+
+        if users is not None and session.key_check != key_check:
+            if self.get_devices_without_room_key(room_id, list(users)):
+                raise GroupEncryptionError("Group session for room {} not "
+                                           "shared with every device in the "
+                                           "room.".format(room_id))
+
+            session.key_check = key_check
+
         plaintext_dict["room_id"] = room_id
         ciphertext = session.encrypt(Api.to_json(plaintext_dict))
 
+        # The ratchet moved forward, it needs to hit the disk before the
+        # message is sent out, a reused ratchet would reuse message keys.
+        self.store.save_outbound_group_session(room_id, session)
+
         payload_dict = {
             "algorithm": "m.megolm.v1.aes-sha2",
             "sender_key": self.account.identity_keys["curve25519"],
@@ -928,15 +1162,81 @@ class Olm(object):
             logger.error("Error decrypting megolm event: {}".format(str(e)))
             return None, None
 
+    def _encrypt_for_devices(self, recipients):
+        # type: (List[Tuple[OlmDevice, Session, str]]) -> List[Any]
+        """Encrypt the payload of every recipient with its Olm session.
+
+        Large fan-outs are encrypted in a thread pool if encryption workers
+        are configured, libolm doesn't hold the GIL while it encrypts. The
+        payloads of a single session are encrypted in order by one thread.
+        The pool only lives for the duration of the call, so no threads are
+        left behind once the share is done.
+
+        Returns a list of Olm messages in the order of the recipients.
+        """
+        if (not self.encryption_workers
+                or ThreadPoolExecutor is None
+                or len(recipients) < PARALLEL_ENCRYPTION_THRESHOLD):
+            return [
+                session.encrypt(payload) for _, session, payload in recipients
+            ]
+
+        jobs = defaultdict(list)  # type: DefaultDict[Session, List[int]]
+
+        for i, (_, session, _) in enumerate(recipients):
+            jobs[session].append(i)
+
+        def encrypt(job):
+            session, indices = job
+            return [(i, session.encrypt(recipients[i][2])) for i in indices]
+
+        olm_messages = [None] * len(recipients)  # type: List[Any]
+        workers = min(self.encryption_workers, len(jobs))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in pool.map(encrypt, jobs.items()):
+                for i, olm_message in batch:
+                    olm_messages[i] = olm_message
+
+        return olm_messages
+
     def share_group_session(
         self,
         room_id,  # type: str
         users,    # type: List[str]
-        ignore_missing_sessions=False  # type: bool
+        ignore_missing_sessions=False,  # type: bool
+        share_id=None,  # type: Optional[str]
+        successor=False  # type: bool
     ):
         # type: (...) -> Dict[str, Any]
-        logger.info("Sharing group session for room {}".format(room_id))
-        group_session = self.outbound_group_sessions[room_id]
+        """Encrypt the room key of a room for the devices of the given users.
+
+        Devices the outbound group session was already shared with are
+        skipped, only the devices that are missing the key get it.
+
+        Args:
+            room_id (str): The room the outbound group session belongs to.
+            users (List[str]): The users that should receive the room key.
+            ignore_missing_sessions (bool): Skip devices we don't have an Olm
+                session with instead of raising an EncryptionError.
+            share_id (str, optional): The transaction id of the to-device
+                request that will carry the keys. The recipients are added to
+                the shared_with set of the session once the matching
+                ShareGroupSessionResponse is received.
+            successor (bool): Share the successor of the outbound group
+                session instead of the session itself, the successor is
+                created if it doesn't exist yet.
+
+        Returns the content of the to-device request.
+        """
+        if successor:
+            logger.info("Sharing successor group session for room {}".format(
+                room_id))
+            group_session = (self.group_session_successors.get(room_id)
+                             or self.create_successor_group_session(room_id))
+        else:
+            logger.info("Sharing group session for room {}".format(room_id))
+            group_session = self.outbound_group_sessions[room_id]
 
         key_content = {
             "algorithm": "m.megolm.v1.aes-sha2",
@@ -956,66 +1256,129 @@ class Olm(object):
 
         to_device_dict = {"messages": {}}  # type: Dict[str, Any]
 
-        for user_id in users:
-            for device in self.device_store.active_user_devices(user_id):
-                # No need to share the session with our own device
-                if device.id == self.device_id:
-                    continue
+        # Every device is checked before anything gets encrypted, an
+        # unverified device aborts the share without advancing any session.
+        recipients = []  # type: List[Tuple[OlmDevice, Session, str]]
+        skipped = []  # type: List[Tuple[str, str]]
+
+        devices = [
+            device
+            for user_id in users
+            for device in self.device_store.active_user_devices(user_id)
+            # No need to share the session with our own device
+            if device.id != self.device_id
+            and (user_id, device.id) not in group_session.shared_with
+            and not self.is_device_blacklisted(device)
+        ]
+        # The sessions are looked up in one go, with a session cache smaller
+        # than the number of devices single lookups would keep dropping the
+        # sessions they just loaded.
+        sessions = self.session_store.get_many(
+            device.curve25519 for device in devices
+        )
+
+        for device in devices:
+            user_id = device.user_id
+            session = sessions.get(device.curve25519)
 
-                if self.is_device_blacklisted(device):
+            if not session:
+                if ignore_missing_sessions:
+                    skipped.append((user_id, device.id))
                     continue
+                else:
+                    raise EncryptionError("Missing Olm session for user {}"
+                                          " and device {}".format(
+                                              user_id,
+                                              device.id))
+
+            if not self.is_device_verified(device):
+                raise OlmTrustError("Device {} for user {} is not "
+                                    "verified or blacklisted.".format(
+                                        device.id,
+                                        device.user_id
+                                    ))
+
+            device_payload_dict = payload_dict.copy()
+            device_payload_dict["recipient"] = user_id
+            device_payload_dict["recipient_keys"] = {
+                "ed25519": device.ed25519
+            }
 
-                session = self.session_store.get(device.curve25519)
+            recipients.append(
+                (device, session, Api.to_json(device_payload_dict))
+            )
 
-                if not session:
-                    if ignore_missing_sessions:
-                        continue
-                    else:
-                        raise EncryptionError("Missing Olm session for user {}"
-                                              " and device {}".format(
-                                                  user_id,
-                                                  device.id))
-
-                if not self.is_device_verified(device):
-                    raise OlmTrustError("Device {} for user {} is not "
-                                        "verified or blacklisted.".format(
-                                            device.id,
-                                            device.user_id
-                                        ))
-
-                device_payload_dict = payload_dict.copy()
-                device_payload_dict["recipient"] = user_id
-                device_payload_dict["recipient_keys"] = {
-                    "ed25519": device.ed25519
-                }
+        olm_messages = self._encrypt_for_devices(recipients)
 
-                olm_message = session.encrypt(
-                    Api.to_json(device_payload_dict)
-                )
-                self.store.save_session(device.curve25519, session)
-
-                olm_dict = {
-                    "algorithm": "m.olm.v1.curve25519-aes-sha2",
-                    "sender_key": self.account.identity_keys["curve25519"],
-                    "ciphertext": {
-                        device.curve25519: {
-                            "type": olm_message.message_type,
-                            "body": olm_message.ciphertext,
-                        }
-                    },
-                }
+        group_session.skipped_devices.update(skipped)
+
+        group_session.add_pending_share(
+            share_id,
+            ((device.user_id, device.id) for device, _, _ in recipients)
+        )
+
+        for (device, session, _), olm_message in zip(recipients, olm_messages):
+            self.save_session(device.curve25519, session)
+
+            olm_dict = {
+                "algorithm": "m.olm.v1.curve25519-aes-sha2",
+                "sender_key": self.account.identity_keys["curve25519"],
+                "ciphertext": {
+                    device.curve25519: {
+                        "type": olm_message.message_type,
+                        "body": olm_message.ciphertext,
+                    }
+                },
+            }
+
+            if device.user_id not in to_device_dict["messages"]:
+                to_device_dict["messages"][device.user_id] = {}
 
-                if user_id not in to_device_dict["messages"]:
-                    to_device_dict["messages"][user_id] = {}
+            to_device_dict["messages"][device.user_id][device.id] = olm_dict
 
-                to_device_dict["messages"][user_id][device.id] = olm_dict
+        # The ratchets of the sessions moved forward, they need to hit the
+        # disk before the messages are sent out.
+        self.flush()
 
         return to_device_dict
 
+    def _create_session_store(self, load=False):
+        # type: (bool) -> Union[SessionStore, LazySessionStore]
+        if self.session_cache_size:
+            return LazySessionStore(
+                self.store.load_sessions_for,
+                self.session_cache_size,
+                self.store.load_sessions_for_keys,
+                self.store.load_session_keys
+            )
+
+        if load:
+            return self.store.load_sessions()
+
+        return SessionStore()
+
+    def _create_group_session_store(self, load=False):
+        # type: (bool) -> Union[GroupSessionStore, LazyGroupSessionStore]
+        if self.group_session_cache_size:
+            return LazyGroupSessionStore(
+                self.store.load_inbound_group_session,
+                self.group_session_cache_size
+            )
+
+        if load:
+            return self.store.load_inbound_group_sessions()
+
+        return GroupSessionStore()
+
     def load(self):
         # type: () -> None
-        self.session_store = self.store.load_sessions()
-        self.inbound_group_store = self.store.load_inbound_group_sessions()
+        self.session_store = self._create_session_store(load=True)
+        self.inbound_group_store = self._create_group_session_store(load=True)
+        self.outbound_group_sessions = \
+            self.store.load_outbound_group_sessions()
+
+        for session in self.outbound_group_sessions.values():
+            self.rotation_policy.apply(session)
         self.device_store = self.store.load_device_keys()
 
     def save(self):
@@ -1026,13 +1389,25 @@ class Olm(object):
             for session in session_list:
                 self.save_session(curve_key, session)
 
+        self.flush()
+
     def save_session(self, curve_key, session):
         # type: (str, Session) -> None
-        self.store.save_session(curve_key, session)
+        self.store.mark_session_dirty(curve_key, session)
 
     def save_inbound_group_session(self, room_id, sender_key, session):
         # type: (str, str, InboundGroupSession) -> None
-        self.store.save_inbound_group_session(room_id, sender_key, session)
+        self.store.mark_inbound_group_session_dirty(
+            room_id,
+            sender_key,
+            session
+        )
+
+    def flush(self):
+        # type: () -> None
+        """Write the sessions that changed since the last flush to the store.
+        """
+        self.store.flush()
 
     def save_account(self):
         # type: () -> None
@@ -15,10 +15,11 @@
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 
+import attr
 import olm
 from builtins import super
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from ..exceptions import EncryptionError
 
@@ -108,6 +109,32 @@ class InboundGroupSession(olm.InboundGroupSession):
         return session
 
 
+@attr.s
+class RotationPolicy(object):
+    """Policy deciding when outbound group sessions are rotated.
+
+    Attributes:
+        max_messages (int): The number of messages a session encrypts before
+            it is rotated.
+        max_age (datetime.timedelta): The age at which a session is rotated.
+        share_ahead (float): The part of the lifetime of a session, counted
+            from its end, during which a successor session can be shared
+            ahead of time. The successor replaces the session once it
+            expires, without waiting for a new key share. Zero disables
+            sharing ahead.
+    """
+
+    max_messages = attr.ib(type=int, default=100)
+    max_age = attr.ib(type=timedelta, default=timedelta(days=7))
+    share_ahead = attr.ib(type=float, default=0.0)
+
+    def apply(self, session):
+        # type: (OutboundGroupSession) -> None
+        """Set the rotation limits of a session to the ones of the policy."""
+        session.max_messages = self.max_messages
+        session.max_age = self.max_age
+
+
 class OutboundGroupSession(olm.OutboundGroupSession):
 
     """Outbound group session aware of the users it is shared with.
@@ -116,6 +143,18 @@ class OutboundGroupSession(olm.OutboundGroupSession):
     Attributes:
         creation_time (datetime.datetime): Creation time of the session.
         message_count (int): Number of messages encrypted using the session.
+        shared_with (Set[Tuple[str, str]]): The user and device id pairs of
+            the devices the session is known to be shared with.
+        pending_shares (Dict[str, Set[Tuple[str, str]]]): The devices the
+            session was sent to in a to-device request that isn't yet
+            confirmed, keyed by the transaction id of the request.
+        skipped_devices (Set[Tuple[str, str]]): The user and device id pairs
+            of the devices a share left out because there was no Olm session
+            with them.
+        key_check (Tuple[int, int], optional): The versions of the device
+            store and the Olm session store when every device of the room was
+            last found to have the session, None if that needs to be checked
+            again.
     """
 
     def __init__(self):
@@ -124,18 +163,105 @@ class OutboundGroupSession(olm.OutboundGroupSession):
         self.creation_time = datetime.now()
         self.message_count = 0
         self.shared = False
+        self.shared_with = set()  # type: Set[Tuple[str, str]]
+        self.pending_shares = dict() \
+            # type: Dict[Optional[str], Set[Tuple[str, str]]]
+        self.skipped_devices = set()  # type: Set[Tuple[str, str]]
+        self.key_check = None  # type: Optional[Tuple[int, int]]
         super().__init__()
 
     def __new__(cls, **kwargs):
         return super().__new__(cls)
 
-    def mark_as_shared(self):
+    @classmethod
+    def from_pickle(
+        cls,
+        pickle,  # type: bytes
+        creation_time,  # type: datetime
+        message_count,  # type: int
+        passphrase="",  # type: str
+        shared_with=None,  # type: Optional[Iterable[Tuple[str, str]]]
+    ):
+        # type: (...) -> OutboundGroupSession
+        session = super().from_pickle(pickle, passphrase)
+        session.max_age = timedelta(days=7)
+        session.max_messages = 100
+        session.creation_time = creation_time
+        session.message_count = message_count
+        session.shared_with = set(shared_with or ())
+        # Only sessions that reached a device are known to be shared.
+        session.shared = bool(session.shared_with)
+        session.pending_shares = dict()
+        session.skipped_devices = set()
+        session.key_check = None
+        return session
+
+    def add_pending_share(self, share_id, devices):
+        # type: (Optional[str], Iterable[Tuple[str, str]]) -> None
+        """Remember the devices a to-device request shares the session with.
+
+        Args:
+            share_id (str, optional): The transaction id of the request.
+            devices (Iterable[Tuple[str, str]]): The user and device id pairs
+                of the recipients.
+        """
+        self.pending_shares.setdefault(share_id, set()).update(devices)
+
+    def mark_as_shared(self, share_id=None):
+        # type: (Optional[str]) -> Set[Tuple[str, str]]
+        """Mark the session as shared.
+
+        Args:
+            share_id (str, optional): The transaction id of the to-device
+                request that succeeded, its recipients are added to the
+                shared_with set. If no id is given all the pending
+                recipients are.
+
+        Returns the devices that were added to the shared_with set.
+        """
         self.shared = True
 
+        if share_id is None:
+            devices = set()  # type: Set[Tuple[str, str]]
+
+            for pending in self.pending_shares.values():
+                devices.update(pending)
+
+            self.pending_shares.clear()
+        else:
+            devices = self.pending_shares.pop(share_id, set())
+
+        devices -= self.shared_with
+        self.shared_with.update(devices)
+
+        return devices
+
     @property
     def expired(self):
         return self.should_rotate()
 
+    def should_share_ahead(self, share_ahead):
+        # type: (float) -> bool
+        """Wether a successor of the session should be shared.
+
+        Args:
+            share_ahead (float): The part of the lifetime of the session,
+                counted from its end, during which a successor is shared.
+
+        Returns:
+            True if it should, False if not.
+        """
+        if not share_ahead:
+            return False
+
+        remaining = 1 - share_ahead
+
+        if (self.message_count >= self.max_messages * remaining
+                or datetime.now() - self.creation_time
+                >= self.max_age * remaining):
+            return True
+        return False
+
     def should_rotate(self):
         """Wether the session should be rotated.
         Returns:
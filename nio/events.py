@@ -19,10 +19,10 @@ from __future__ import unicode_literals
 import attr
 import time
 
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 
 from functools import wraps
-from builtins import super
+from builtins import str, super
 from jsonschema.exceptions import SchemaError, ValidationError
 from logbook import Logger
 
@@ -66,13 +66,13 @@ def verify(schema):
     return decorator
 
 
-@attr.s
+@attr.s(slots=True)
 class UnknownBadEvent(object):
     event_dict = attr.ib()
     transaction_id = attr.ib(default=None, init=False)
 
 
-@attr.s
+@attr.s(slots=True)
 class Event(object):
     event_id = attr.ib()
     sender = attr.ib()
@@ -102,31 +102,19 @@ class Event(object):
             if "redacted_because" in event_dict["unsigned"]:
                 return RedactedEvent.from_dict(event_dict)
 
-        if event_dict["type"] == "m.room.message":
-            return RoomMessage.parse_event(event_dict)
-        elif event_dict["type"] == "m.room.member":
-            return RoomMemberEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.canonical_alias":
-            return RoomAliasEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.name":
-            return RoomNameEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.topic":
-            return RoomTopicEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.power_levels":
-            return PowerLevelsEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.encryption":
-            return RoomEncryptionEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.redaction":
-            return RedactionEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.encrypted":
-            return RoomEncryptedEvent.parse_event(event_dict)
-        elif event_dict["type"].startswith("m.call"):
-            return CallEvent.parse_event(event_dict)
+        parser = EVENT_PARSERS.get(event_dict["type"])
+
+        if parser:
+            return parser(event_dict)
+
+        # Call events of an unknown type are ignored.
+        if event_dict["type"].startswith("m.call"):
+            return None
 
         return UnknownEvent.from_dict(event_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class UnknownEvent(Event):
     type = attr.ib()
     event_dict = attr.ib()
@@ -142,7 +130,7 @@ class UnknownEvent(Event):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class EncryptedEvent(Event):
     @classmethod
     def parse_event(
@@ -159,7 +147,7 @@ class EncryptedEvent(Event):
         return super().parse_event(event_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class AccountDataEvent(object):
     """Abstract class for account data events."""
 
@@ -176,7 +164,7 @@ class AccountDataEvent(object):
         return UnknownAccountDataEvent.from_dict(event_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class FullyReadEvent(AccountDataEvent):
     """Read marker location event.
 
@@ -202,7 +190,7 @@ class FullyReadEvent(AccountDataEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class UnknownAccountDataEvent(AccountDataEvent):
     """Account data event of an unknown type.
 
@@ -225,28 +213,22 @@ class UnknownAccountDataEvent(AccountDataEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class CallEvent(Event):
     call_id = attr.ib()
     version = attr.ib()
 
     @staticmethod
     def parse_event(event_dict):
-        event = None
+        if not event_dict["type"].startswith("m.call"):
+            return None
 
-        if event_dict["type"] == "m.call.candidates":
-            event = CallCandidatesEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.invite":
-            event = CallInviteEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.answer":
-            event = CallAnswerEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.hangup":
-            event = CallHangupEvent.from_dict(event_dict)
+        parser = EVENT_PARSERS.get(event_dict["type"])
 
-        return event
+        return parser(event_dict) if parser else None
 
 
-@attr.s
+@attr.s(slots=True)
 class CallCandidatesEvent(CallEvent):
     candidates = attr.ib()
 
@@ -264,7 +246,7 @@ class CallCandidatesEvent(CallEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class CallInviteEvent(CallEvent):
     lifetime = attr.ib()
     offer = attr.ib()
@@ -290,7 +272,7 @@ class CallInviteEvent(CallEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class CallAnswerEvent(CallEvent):
     answer = attr.ib()
 
@@ -308,7 +290,7 @@ class CallAnswerEvent(CallEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class CallHangupEvent(CallEvent):
     @classmethod
     @verify(Schemas.call_hangup)
@@ -323,7 +305,7 @@ class CallHangupEvent(CallEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class ToDeviceEvent(object):
     sender = attr.ib()
 
@@ -344,7 +326,7 @@ class ToDeviceEvent(object):
         return None
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedEvent(object):
     @classmethod
     @verify(Schemas.room_encrypted)
@@ -359,7 +341,7 @@ class RoomEncryptedEvent(object):
         return None
 
 
-@attr.s
+@attr.s(slots=True)
 class OlmEvent(ToDeviceEvent, RoomEncryptedEvent):
     sender_key = attr.ib()
     ciphertext = attr.ib()
@@ -375,7 +357,7 @@ class OlmEvent(ToDeviceEvent, RoomEncryptedEvent):
         return cls(event_dict["sender"], sender_key, ciphertext)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomKeyEvent(object):
     sender = attr.ib(type=str)
     sender_key = attr.ib(type=str)
@@ -397,7 +379,7 @@ class RoomKeyEvent(object):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class MegolmEvent(RoomEncryptedEvent):
     event_id = attr.ib()
     sender = attr.ib()
@@ -439,7 +421,7 @@ class MegolmEvent(RoomEncryptedEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class InviteEvent(object):
     sender = attr.ib()
 
@@ -460,7 +442,7 @@ class InviteEvent(object):
         return None
 
 
-@attr.s
+@attr.s(slots=True)
 class InviteMemberEvent(InviteEvent):
     state_key = attr.ib()
     content = attr.ib()
@@ -482,7 +464,7 @@ class InviteMemberEvent(InviteEvent):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class InviteAliasEvent(InviteEvent):
     canonical_alias = attr.ib()
 
@@ -496,7 +478,7 @@ class InviteAliasEvent(InviteEvent):
         return cls(sender, canonical_alias)
 
 
-@attr.s
+@attr.s(slots=True)
 class InviteNameEvent(InviteEvent):
     name = attr.ib()
 
@@ -510,7 +492,7 @@ class InviteNameEvent(InviteEvent):
         return cls(sender, canonical_alias)
 
 
-@attr.s
+@attr.s(slots=True)
 class BadEvent(Event):
     type = attr.ib()
     source = attr.ib()
@@ -533,7 +515,7 @@ class BadEvent(Event):
 BadEventType = Union[BadEvent, UnknownBadEvent]
 
 
-@attr.s
+@attr.s(slots=True)
 class RedactedEvent(Event):
     event_type = attr.ib()
     redacter = attr.ib()
@@ -563,12 +545,12 @@ class RedactedEvent(Event):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptionEvent(Event):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomAliasEvent(Event):
     canonical_alias = attr.ib()
 
@@ -585,7 +567,7 @@ class RoomAliasEvent(Event):
         return cls(event_id, sender, timestamp, canonical_alias)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomNameEvent(Event):
     name = attr.ib()
 
@@ -602,7 +584,7 @@ class RoomNameEvent(Event):
         return cls(event_id, sender, timestamp, canonical_alias)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomTopicEvent(Event):
     topic = attr.ib()
 
@@ -619,7 +601,7 @@ class RoomTopicEvent(Event):
         return cls(event_id, sender, timestamp, canonical_alias)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessage(Event):
     @classmethod
     @verify(Schemas.room_message)
@@ -627,22 +609,11 @@ class RoomMessage(Event):
         # type: (Dict[Any, Any]) -> Union[RoomMessage, BadEventType]
         content_dict = parsed_dict["content"]
 
-        if content_dict["msgtype"] == "m.text":
-            event = RoomMessageText.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.emote":
-            event = RoomMessageEmote.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.notice":
-            event = RoomMessageNotice.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.image":
-            event = RoomMessageImage.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.audio":
-            event = RoomMessageAudio.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.video":
-            event = RoomMessageVideo.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.file":
-            event = RoomMessageFile.from_dict(parsed_dict)
-        else:
-            event = RoomMessageUnknown.from_dict(parsed_dict)
+        event_class = MESSAGE_CLASSES.get(
+            content_dict["msgtype"],
+            RoomMessageUnknown
+        )
+        event = event_class.from_dict(parsed_dict)
 
         if "unsigned" in parsed_dict:
             txn_id = parsed_dict["unsigned"].get("transaction_id", None)
@@ -651,7 +622,7 @@ class RoomMessage(Event):
         return event
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedMessage(RoomMessage):
     @classmethod
     @verify(Schemas.room_message)
@@ -659,14 +630,10 @@ class RoomEncryptedMessage(RoomMessage):
         # type: (Dict[Any, Any]) -> Union[RoomMessage, BadEventType]
         msgtype = parsed_dict["content"]["msgtype"]
 
-        if msgtype == "m.image":
-            event = RoomEncryptedImage.from_dict(parsed_dict)
-        elif msgtype == "m.audio":
-            event = RoomEncryptedAudio.from_dict(parsed_dict)
-        elif msgtype == "m.video":
-            event = RoomEncryptedVideo.from_dict(parsed_dict)
-        elif msgtype == "m.file":
-            event = RoomEncryptedFile.from_dict(parsed_dict)
+        event_class = ENCRYPTED_MESSAGE_CLASSES.get(msgtype)
+
+        if event_class:
+            event = event_class.from_dict(parsed_dict)
         else:
             event = RoomMessage.parse_event(parsed_dict)
 
@@ -677,7 +644,7 @@ class RoomEncryptedMessage(RoomMessage):
         return event
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageMedia(RoomMessage):
     url = attr.ib()
     body = attr.ib()
@@ -694,7 +661,7 @@ class RoomMessageMedia(RoomMessage):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedMedia(RoomMessage):
     url = attr.ib()
     body = attr.ib()
@@ -717,47 +684,47 @@ class RoomEncryptedMedia(RoomMessage):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedImage(RoomEncryptedMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedAudio(RoomEncryptedMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedVideo(RoomEncryptedMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEncryptedFile(RoomEncryptedMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageImage(RoomMessageMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageAudio(RoomMessageMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageVideo(RoomMessageMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageFile(RoomMessageMedia):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageUnknown(RoomMessage):
     type = attr.ib()
     content = attr.ib()
@@ -774,7 +741,7 @@ class RoomMessageUnknown(RoomMessage):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageNotice(RoomMessage):
     body = attr.ib()
 
@@ -789,7 +756,7 @@ class RoomMessageNotice(RoomMessage):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageText(RoomMessage):
     body = attr.ib()
     formatted_body = attr.ib()
@@ -834,7 +801,7 @@ class RoomMessageText(RoomMessage):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessageEmote(RoomMessageText):
     @staticmethod
     def _validate(parsed_dict):
@@ -842,7 +809,7 @@ class RoomMessageEmote(RoomMessageText):
         return validate_or_badevent(parsed_dict, Schemas.room_message_emote)
 
 
-@attr.s
+@attr.s(slots=True)
 class DefaultLevels(object):
     ban = attr.ib(default=50, type=int)
     invite = attr.ib(default=50, type=int)
@@ -866,7 +833,7 @@ class DefaultLevels(object):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class PowerLevels(object):
     defaults = attr.ib(default=attr.Factory(DefaultLevels))
     users = attr.ib(default=attr.Factory(dict), type=Dict[str, int])
@@ -888,7 +855,7 @@ class PowerLevels(object):
         self.users.update(new_levels.users)
 
 
-@attr.s
+@attr.s(slots=True)
 class PowerLevelsEvent(Event):
     power_levels = attr.ib()
 
@@ -910,7 +877,7 @@ class PowerLevelsEvent(Event):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RedactionEvent(Event):
     redacts = attr.ib()
     reason = attr.ib(default=None)
@@ -931,7 +898,7 @@ class RedactionEvent(Event):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMemberEvent(Event):
     state_key = attr.ib()
     content = attr.ib()
@@ -953,3 +920,219 @@ class RoomMemberEvent(Event):
             content,
             prev_content,
         )
+
+
+class LazyEvent(Event):
+    """Room event that is validated and parsed on first access.
+
+    The event id, sender, timestamp and type are read directly from the raw
+    event. Accessing any other attribute parses the event into its regular
+    event class and returns the attribute of the parsed event.
+
+    Lazy events don't pass isinstance checks for the class of the parsed
+    event, the parsed event can be accessed through the event attribute. The
+    class of a lazy event can be told apart by its type without parsing it.
+
+    Attributes:
+        source (Dict): The raw event as received from the server.
+
+    """
+
+    __slots__ = ("source", "_event", "_parsed")
+
+    def __init__(self, source):
+        # type: (Dict[Any, Any]) -> None
+        self.source = source
+        self._event = None  # type: Optional[Union[Event, BadEventType]]
+        self._parsed = False
+
+    @staticmethod
+    def can_defer(event_dict):
+        # type: (Any) -> bool
+        """Check if parsing the event can be deferred.
+
+        Events that change the state of the client are always parsed eagerly,
+        so are call events of an unknown type since those are dropped.
+        """
+        if not isinstance(event_dict, dict):
+            return False
+
+        event_type = event_dict.get("type")
+
+        if not isinstance(event_type, str) or event_type in EAGER_EVENT_TYPES:
+            return False
+
+        return (event_type in EVENT_PARSERS
+                or not event_type.startswith("m.call"))
+
+    @property
+    def event_id(self):
+        # type: () -> Optional[str]
+        return self.source.get("event_id")
+
+    @property
+    def sender(self):
+        # type: () -> Optional[str]
+        return self.source.get("sender")
+
+    @property
+    def server_timestamp(self):
+        # type: () -> Optional[int]
+        return self.source.get("origin_server_ts")
+
+    @property
+    def type(self):
+        # type: () -> str
+        return self.source["type"]
+
+    @property
+    def event(self):
+        # type: () -> Union[Event, BadEventType]
+        """The parsed event."""
+        if not self._parsed:
+            self._parsed = True
+            # The parsers remove keys from the dictionary they get, parse a
+            # copy so the source stays intact.
+            event_dict = dict(self.source)
+
+            try:
+                validate_json(event_dict, Schemas.room_event)
+            except (SchemaError, ValidationError) as e:
+                logger.error("Error validating event: {}".format(str(e)))
+                self._event = UnknownBadEvent(event_dict)
+            else:
+                self._event = Event.parse_event(event_dict)
+
+        return self._event
+
+    def __getattr__(self, name):
+        # type: (str) -> Any
+        # Private and special attributes aren't forwarded, copy and pickle
+        # look them up on instances whose slots aren't set yet.
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return getattr(self.event, name)
+
+    def __reduce__(self):
+        return (LazyEvent, (self.source,))
+
+    def __eq__(self, other):
+        if isinstance(other, LazyEvent):
+            other = other.event
+
+        return self.event == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self):
+        # type: () -> str
+        return "LazyEvent(type={!r}, event_id={!r})".format(
+            self.source.get("type"),
+            self.event_id
+        )
+
+
+# Event types that change the state of the client, these are never parsed
+# lazily.
+EAGER_EVENT_TYPES = frozenset([
+    "m.room.member",
+    "m.room.canonical_alias",
+    "m.room.name",
+    "m.room.topic",
+    "m.room.power_levels",
+    "m.room.encryption",
+    "m.room.encrypted",
+])
+
+_lazy_events = False
+
+
+def set_lazy_events(enabled):
+    # type: (bool) -> None
+    """Enable or disable lazy parsing of room events in responses.
+
+    Lazy events are only validated and parsed once an attribute other than
+    the event id, sender, timestamp or type is accessed, events that change
+    the room state are always parsed. The setting is a module level setting,
+    it applies to every client in the process.
+    """
+    global _lazy_events
+    _lazy_events = enabled
+
+
+def lazy_events_enabled():
+    # type: () -> bool
+    """Check if room events in responses are parsed lazily."""
+    return _lazy_events
+
+
+# Parsers for room events keyed by the event type, events of a type that
+# isn't found here are turned into an UnknownEvent.
+EVENT_PARSERS = {
+    "m.room.message": RoomMessage.parse_event,
+    "m.room.member": RoomMemberEvent.from_dict,
+    "m.room.canonical_alias": RoomAliasEvent.from_dict,
+    "m.room.name": RoomNameEvent.from_dict,
+    "m.room.topic": RoomTopicEvent.from_dict,
+    "m.room.power_levels": PowerLevelsEvent.from_dict,
+    "m.room.encryption": RoomEncryptionEvent.from_dict,
+    "m.room.redaction": RedactionEvent.from_dict,
+    "m.room.encrypted": RoomEncryptedEvent.parse_event,
+    "m.call.candidates": CallCandidatesEvent.from_dict,
+    "m.call.invite": CallInviteEvent.from_dict,
+    "m.call.answer": CallAnswerEvent.from_dict,
+    "m.call.hangup": CallHangupEvent.from_dict,
+}  # type: Dict[str, Callable[[Dict[Any, Any]], Any]]
+
+# Room message classes keyed by the message type, messages of a type that
+# isn't found here are turned into a RoomMessageUnknown.
+MESSAGE_CLASSES = {
+    "m.text": RoomMessageText,
+    "m.emote": RoomMessageEmote,
+    "m.notice": RoomMessageNotice,
+    "m.image": RoomMessageImage,
+    "m.audio": RoomMessageAudio,
+    "m.video": RoomMessageVideo,
+    "m.file": RoomMessageFile,
+}  # type: Dict[str, Any]
+
+# Message classes for decrypted messages with encrypted attachments, other
+# decrypted messages are parsed using the MESSAGE_CLASSES.
+ENCRYPTED_MESSAGE_CLASSES = {
+    "m.image": RoomEncryptedImage,
+    "m.audio": RoomEncryptedAudio,
+    "m.video": RoomEncryptedVideo,
+    "m.file": RoomEncryptedFile,
+}  # type: Dict[str, Any]
+
+
+def register_event_type(event_type, event_class):
+    # type: (str, Any) -> None
+    """Register a class that room events of the given type are parsed into.
+
+    Registering a type that nio already knows replaces the built-in class.
+
+    Args:
+        event_type (str): The type of the room event, e.g. "org.example.foo".
+        event_class (class): The class the event should be parsed into. The
+            class needs to provide a from_dict() class method that takes the
+            event dictionary and returns the event.
+    """
+    EVENT_PARSERS[event_type] = event_class.from_dict
+
+
+def register_message_type(msgtype, event_class):
+    # type: (str, Any) -> None
+    """Register a class that room messages of the given type are parsed into.
+
+    Args:
+        msgtype (str): The message type, e.g. "org.example.location".
+        event_class (class): The class the message should be parsed into. The
+            class needs to provide a from_dict() class method that takes the
+            event dictionary and returns the event.
+    """
+    MESSAGE_CLASSES[msgtype] = event_class
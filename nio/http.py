@@ -16,9 +16,10 @@
 
 from __future__ import unicode_literals
 
-import json
+import codecs
 import pprint
 import time
+import zlib
 from builtins import bytes, super
 from collections import OrderedDict, deque
 from enum import Enum, unique
@@ -27,9 +28,11 @@ from uuid import UUID, uuid4
 
 import h2.connection
 import h2.events
+import h2.exceptions
 import h11
 from logbook import Logger
 
+from . import json_codec
 from .log import logger_group
 
 logger = Logger("nio.http")
@@ -37,6 +40,18 @@ logger_group.add_logger(logger)
 
 USER_AGENT = "nio"
 
+# Response bodies announcing a bigger size than this won't get a pre-sized
+# buffer, they will be collected chunk by chunk instead.
+MAX_PREALLOCATED_BODY_SIZE = 128 * 1024 * 1024
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+# Compressed response bodies that decode to more than this are dropped, a
+# small body could otherwise decompress to an arbitrary amount of memory.
+MAX_DECOMPRESSED_BODY_SIZE = 256 * 1024 * 1024
+
+IDEMPOTENT_METHODS = (b"GET", b"HEAD", b"PUT", b"DELETE", b"OPTIONS")
+
 
 @unique
 class TransportType(Enum):
@@ -70,6 +85,12 @@ class HttpRequest(TransportRequest):
         super().__init__(request, data, timeout)
         self._end_of_message = h11.EndOfMessage()
 
+    @property
+    def idempotent(self):
+        # type: () -> bool
+        """Can the request be safely repeated."""
+        return self._request.method in IDEMPOTENT_METHODS
+
     @classmethod
     def get(cls, host, target, timeout=0):
         request = h11.Request(
@@ -86,6 +107,7 @@ class HttpRequest(TransportRequest):
             ("Host", "{host}".format(host=host)),
             ("Connection", "keep-alive"),
             ("Accept", "*/*"),
+            ("Accept-Encoding", ACCEPT_ENCODING),
         ]
 
         if data:
@@ -100,13 +122,11 @@ class HttpRequest(TransportRequest):
     @classmethod
     def _post_or_put(cls, method, host, target, data, timeout=0):
         request_data = (
-            json.dumps(data, separators=(",", ":"))
+            json_codec.dumps_bytes(data)
             if isinstance(data, dict)
-            else data
+            else bytes(data, "utf-8")
         )
 
-        request_data = bytes(request_data, "utf-8")
-
         request = h11.Request(
             method=method,
             target=target,
@@ -127,6 +147,11 @@ class HttpRequest(TransportRequest):
 
 
 class Http2Request(TransportRequest):
+    def __init__(self, request, data=b"", timeout=0):
+        super().__init__(request, data, timeout)
+        # The weight of the stream, if unset the default weight is used.
+        self.priority_weight = None  # type: Optional[int]
+
     @staticmethod
     def _request(method, target, headers):
         h = [(":method", method), (":path", target)]
@@ -145,6 +170,7 @@ class Http2Request(TransportRequest):
         ]
 
         headers.append(("accept", "application/json"))
+        headers.append(("accept-encoding", ACCEPT_ENCODING))
 
         if data:
             headers.append(("content-type", "application/json"))
@@ -158,13 +184,11 @@ class Http2Request(TransportRequest):
     @classmethod
     def _post_or_put(cls, method, host, target, data, timeout):
         request_data = (
-            json.dumps(data, separators=(",", ":"))
+            json_codec.dumps_bytes(data)
             if isinstance(data, dict)
-            else data
+            else bytes(data, "utf-8")
         )
 
-        request_data = bytes(request_data, "utf-8")
-
         request = Http2Request._request(
             method=method,
             target=target,
@@ -202,7 +226,6 @@ class TransportResponse(object):
     def __init__(self, uuid=None, timeout=0):
         # type: (Optional[UUID], float) -> None
         self.headers = HeaderDict()  # type: HeaderDict
-        self.content = b""  # type: bytes
         self.status_code = None  # type: Optional[int]
         self.uuid = uuid or uuid4()
         self.creation_time = time.time()
@@ -211,17 +234,188 @@ class TransportResponse(object):
         self.receive_time = None  # type: Optional[float]
         self.request_info = None  # type: Optional[Any]
 
+        # The body is either written into a pre-sized buffer, if the size
+        # of it is known in advance, or it is collected as a list of chunks
+        # that is joined only once, when the content is accessed.
+        self._chunks = []  # type: List[bytes]
+        self._buffer = None  # type: Optional[bytearray]
+        self._buffer_size = 0  # type: int
+
+        # Decompressor for gzip or deflate encoded bodies, the body is
+        # decoded chunk by chunk as it arrives.
+        self._decompressor = None  # type: Optional[Any]
+        self._decoding_failed = False
+        # Body size in bytes as received from the network and after decoding
+        # the content encoding.
+        self.received_size = 0  # type: int
+        self.content_size = 0  # type: int
+        self.max_decompressed_size = MAX_DECOMPRESSED_BODY_SIZE  # type: int
+
     def add_response(self, response):
         raise NotImplementedError
 
+    def _prepare_body(self):
+        # type: () -> None
+        """Prepare the body storage once all the headers are known."""
+        encoding = self.headers.get("content-encoding", "identity")
+        encoding = encoding.strip().lower()
+
+        if encoding in ("gzip", "x-gzip", "deflate"):
+            # Let zlib figure out if it's a gzip or zlib stream.
+            self._decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        elif encoding != "identity":
+            logger.warning("Unsupported content encoding {}".format(encoding))
+        elif "content-length" in self.headers:
+            self._allocate_buffer(self.headers["content-length"])
+
+    def _allocate_buffer(self, content_length):
+        # type: (Any) -> None
+        """Pre-allocate the body buffer from a Content-Length header value."""
+        try:
+            length = int(content_length)
+        except (TypeError, ValueError):
+            return
+
+        if length <= 0 or length > MAX_PREALLOCATED_BODY_SIZE:
+            return
+
+        if self._chunks or self._buffer is not None:
+            return
+
+        self._buffer = bytearray(length)
+
+    def _decompress(self, content):
+        # type: (bytes) -> bytes
+        assert self._decompressor
+
+        # Decoding stops one byte past the limit, this is enough to notice
+        # that the body is too big.
+        remaining = max(self.max_decompressed_size - self.content_size, 0)
+        return self._decompressor.decompress(content, remaining + 1)
+
+    def _fail_decoding(self):
+        # type: () -> None
+        self._decompressor = None
+        self._decoding_failed = True
+        self.content = b""
+
+    def _check_decompressed_size(self, content):
+        # type: (bytes) -> bytes
+        if self.content_size + len(content) > self.max_decompressed_size:
+            logger.error("Decoded response body is bigger than {} bytes, "
+                         "dropping it".format(self.max_decompressed_size))
+            self._fail_decoding()
+            return b""
+
+        return content
+
+    def _decode(self, content):
+        # type: (bytes) -> bytes
+        assert self._decompressor
+
+        try:
+            return self._check_decompressed_size(self._decompress(content))
+        except zlib.error as e:
+            # Some servers send raw deflate streams without the zlib header,
+            # retry with a raw decompressor if nothing was decoded yet.
+            if self.received_size == len(content):
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                try:
+                    return self._check_decompressed_size(
+                        self._decompress(content)
+                    )
+                except zlib.error:
+                    pass
+
+            logger.error("Error decoding response body: {}".format(e))
+            self._fail_decoding()
+            return b""
+
     def add_data(self, content):
         # type: (bytes) -> None
-        self.content = self.content + content
+        if not content or self._decoding_failed:
+            return
+
+        self.received_size += len(content)
+
+        if self._decompressor:
+            content = self._decode(content)
+
+        self._store(content)
+
+    def _store(self, content):
+        # type: (bytes) -> None
+        if not content:
+            return
+
+        self.content_size += len(content)
+        end = self._buffer_size + len(content)
+
+        if self._buffer is not None and end <= len(self._buffer):
+            memoryview(self._buffer)[self._buffer_size:end] = content
+            self._buffer_size = end
+            return
+
+        # The server sent more than it announced, move what we have into
+        # the chunk list and continue from there.
+        if self._buffer is not None:
+            self._chunks.append(bytes(self._buffer[:self._buffer_size]))
+            self._buffer = None
+            self._buffer_size = 0
+
+        self._chunks.append(content)
+
+    @property
+    def body(self):
+        # type: () -> memoryview
+        """A read-only view of the response body.
+
+        The view is created without copying the data if the body was
+        received into a pre-sized buffer, otherwise the received chunks are
+        joined once and cached.
+        """
+        if self._buffer is not None:
+            view = memoryview(self._buffer)[:self._buffer_size]
+        else:
+            view = memoryview(self._join_chunks())
+
+        return view.toreadonly() if hasattr(view, "toreadonly") else view
+
+    def _join_chunks(self):
+        # type: () -> bytes
+        if len(self._chunks) > 1:
+            self._chunks = [b"".join(self._chunks)]
+
+        return self._chunks[0] if self._chunks else b""
+
+    @property
+    def content(self):
+        # type: () -> bytes
+        if self._buffer is not None:
+            if self._buffer_size != len(self._buffer):
+                return bytes(self._buffer[:self._buffer_size])
+            return bytes(self._buffer)
+
+        return self._join_chunks()
+
+    @content.setter
+    def content(self, content):
+        # type: (bytes) -> None
+        self._buffer = None
+        self._buffer_size = 0
+        self._chunks = [content] if content else []
 
     def mark_as_sent(self):
         self.send_time = time.time()
 
     def mark_as_received(self):
+        if self._decompressor:
+            content = self._check_decompressed_size(
+                self._decompressor.flush()
+            )
+            self._store(content)
+            self._decompressor = None
+
         self.receive_time = time.time()
 
     @property
@@ -240,7 +434,8 @@ class TransportResponse(object):
 
     @property
     def text(self):
-        return self.content.decode("utf-8")
+        # type: () -> str
+        return codecs.decode(self.body, "utf-8")
 
     @property
     def is_ok(self):
@@ -251,6 +446,10 @@ class TransportResponse(object):
 
 
 class HttpResponse(TransportResponse):
+    def __init__(self, uuid=None, timeout=0):
+        super().__init__(uuid, timeout)
+        self.was_reset = False
+
     def add_response(self, response):
         # type: (h11.Response) -> None
         self.status_code = response.status_code
@@ -262,6 +461,8 @@ class HttpResponse(TransportResponse):
             logger.debug("Got http header {}: {}".format(name, value))
             self.headers[name] = value
 
+        self._prepare_body()
+
 
 class Http2Response(TransportResponse):
     def __init__(self, uuid=None, timeout=0):
@@ -273,13 +474,21 @@ class Http2Response(TransportResponse):
         # type: (h2.events.ResponseReceived) -> None
         for header in headers:
             name, value = header
+
+            if isinstance(name, bytes):
+                name = name.decode("utf-8")
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+
             logger.debug("Got http2 header {}: {}".format(name, value))
 
-            if name == b":status" or name == ":status":
+            if name == ":status":
                 self.status_code = int(value)
             else:
                 self.headers[name] = value
 
+        self._prepare_body()
+
     @property
     def is_ok(self):
         if self.was_reset:
@@ -302,101 +511,240 @@ class Connection(object):
 
 
 class HttpConnection(Connection):
-    def __init__(self):
-        # type: () -> None
+    def __init__(self, pipelining=False, max_pipeline_depth=8):
+        # type: (bool, int) -> None
         self._connection = h11.Connection(our_role=h11.CLIENT)
         self._message_queue = deque()  # type: Deque[HttpRequest]
+        # Requests that are written out and are waiting for a response, in
+        # the order they were sent. Only the first one is known to the h11
+        # connection, the rest are handed to it once their turn comes.
+        self._in_flight = deque()  # type: Deque[HttpRequest]
         self._current_response = None  # type: Optional[HttpResponse]
+        # Responses of requests that can't be sent again, they were lost
+        # when the server closed the connection.
+        self._failed = []  # type: List[HttpResponse]
+        self.pipelining = pipelining
+        self.max_pipeline_depth = max_pipeline_depth
+        self.closed = False
+
+    def _can_send(self, request):
+        # type: (HttpRequest) -> bool
+        if not self._in_flight:
+            return self._connection.our_state == h11.IDLE
+
+        if not self.pipelining:
+            return False
+
+        if len(self._in_flight) >= self.max_pipeline_depth:
+            return False
+
+        # Only requests that are safe to repeat can be pipelined, if the
+        # server closes the connection they will be sent again.
+        return request.idempotent and all(
+            r.idempotent for r in self._in_flight
+        )
+
+    @staticmethod
+    def _write_request(connection, request):
+        # type: (h11.Connection, HttpRequest) -> bytes
+        data = connection.send(request._request)
+
+        if request._data:
+            data = data + connection.send(request._data)
+
+        return data + connection.send(request._end_of_message)
+
+    def _start_request(self, request):
+        # type: (HttpRequest) -> bytes
+        if self._in_flight:
+            # The h11 connection can only handle a single request at a time,
+            # serialize the pipelined request with a throwaway connection.
+            data = self._write_request(
+                h11.Connection(our_role=h11.CLIENT),
+                request
+            )
+        else:
+            data = self._write_request(self._connection, request)
+
+        assert request.response
+        request.response.mark_as_sent()
+        self._in_flight.append(request)
+
+        return data
+
+    def _next_cycle(self):
+        # type: () -> None
+        try:
+            self._connection.start_next_cycle()
+        except h11.ProtocolError:
+            self._reset()
+            return
+
+        # Let the h11 connection know about the next pipelined request, the
+        # request itself was already written out.
+        if self._in_flight:
+            self._write_request(self._connection, self._in_flight[0])
+
+    def _reset(self):
+        # type: () -> None
+        self._connection = h11.Connection(our_role=h11.CLIENT)
+        self._current_response = None
+        self.closed = True
+
+        if not self._in_flight:
+            return
+
+        if self.pipelining:
+            logger.warning("Connection closed with pipelined requests in "
+                           "flight, disabling pipelining")
+            self.pipelining = False
+
+        # Put the unanswered requests back in front of the queue, they are
+        # moved to the connection that replaces this one.
+        while self._in_flight:
+            request = self._in_flight.pop()
+            assert request.response
+
+            if not request.idempotent:
+                logger.error("Connection closed before a response to a {} "
+                             "request was received".format(
+                                 request._request.method))
+                request.response.was_reset = True
+                request.response.mark_as_received()
+                self._failed.insert(0, request.response)
+                continue
+
+            request.response = HttpResponse(
+                request.response.uuid,
+                request.timeout
+            )
+            self._message_queue.appendleft(request)
+
+    def connection_lost(self):
+        # type: () -> List[HttpResponse]
+        """Mark the connection as closed.
+
+        Returns the failed responses of the requests that were in flight and
+        can't be sent again.
+        """
+        if not self.closed:
+            self._reset()
+
+        failed, self._failed = self._failed, []
+        return failed
+
+    def unsent_requests(self):
+        # type: () -> List[HttpRequest]
+        """Take the requests that weren't sent or answered yet.
+
+        The requests should be passed to requeue() of the connection that
+        replaces this one.
+        """
+        requests = list(self._message_queue)
+        self._message_queue.clear()
+        return requests
+
+    def requeue(self, requests):
+        # type: (List[HttpRequest]) -> None
+        """Queue requests that were taken from a closed connection."""
+        self._message_queue.extend(requests)
 
     def data_to_send(self):
         # type: () -> bytes
-        if self._current_response:
-            return b""
+        data = b""
 
-        if not self._message_queue:
-            return b""
+        if self.closed:
+            return data
 
-        if not self._connection.our_state == h11.IDLE:
-            return b""
+        while self._message_queue and self._can_send(self._message_queue[0]):
+            request = self._message_queue.popleft()
+            data = data + self._start_request(request)
 
-        request = self._message_queue.popleft()
-        _, data = self.send(request)
         return data
 
     @property
     def elapsed(self):
         # type: () -> float
-        if not self._current_response:
+        if not self._in_flight:
             return 0
 
-        response = self._current_response
-
-        return response.elapsed
+        return max(
+            request.response.elapsed for request in self._in_flight
+            if request.response
+        )
 
     def send(self, request, uuid=None):
         # type: (TransportRequest, Optional[UUID]) -> Tuple[UUID, bytes]
-        data = b""
-
         if not isinstance(request, HttpRequest):
             raise TypeError("Invalid request type for HttpConnection")
 
-        if (
-            self._connection.our_state == h11.IDLE
-            and not self._current_response
-        ):
-            data = data + self._connection.send(request._request)
+        if not request.response:
+            request.response = HttpResponse(uuid, request.timeout)
 
-            if request._data:
-                data = data + self._connection.send(request._data)
+        if (not self.closed and not self._message_queue
+                and self._can_send(request)):
+            return request.response.uuid, self._start_request(request)
 
-            data = data + self._connection.send(request._end_of_message)
+        self._message_queue.append(request)
+        return request.response.uuid, b""
 
-            if request.response:
-                self._current_response = request.response
+    def _response_in_progress(self):
+        # type: () -> HttpResponse
+        if not self._current_response:
+            if self._in_flight:
+                self._current_response = self._in_flight[0].response
             else:
-                self._current_response = HttpResponse(uuid, request.timeout)
+                self._current_response = HttpResponse()
 
-            # Make mypy happy
-            assert self._current_response
+        assert self._current_response
+        return self._current_response
 
-            self._current_response.mark_as_sent()
-            return self._current_response.uuid, data
-        else:
-            request.response = HttpResponse(uuid, request.timeout)
-            self._message_queue.append(request)
-            return request.response.uuid, b""
+    def _get_responses(self):
+        # type: () -> List[HttpResponse]
+        responses = []  # type: List[HttpResponse]
 
-    def _get_response(self):
-        # type: () -> Optional[HttpResponse]
         ret = self._connection.next_event()
 
-        if not self._current_response:
-            self._current_response = HttpResponse()
-
         while ret != h11.NEED_DATA:
-            if ret == h11.PAUSED or isinstance(ret, h11.EndOfMessage):
-                try:
-                    self._connection.start_next_cycle()
-                except h11.ProtocolError:
-                    self._connection = h11.Connection(our_role=h11.CLIENT)
-                response = self._current_response
+            if isinstance(ret, h11.EndOfMessage):
+                response = self._response_in_progress()
                 self._current_response = None
+
+                if self._in_flight:
+                    self._in_flight.popleft()
+
                 response.mark_as_received()
-                return response
+                responses.append(response)
+                self._next_cycle()
+
+            elif ret == h11.PAUSED:
+                self._next_cycle()
+            elif isinstance(ret, h11.ConnectionClosed):
+                self._reset()
             elif isinstance(ret, h11.InformationalResponse):
                 pass
             elif isinstance(ret, h11.Response):
-                self._current_response.add_response(ret)
+                self._response_in_progress().add_response(ret)
             elif isinstance(ret, h11.Data):
-                self._current_response.add_data(ret.data)
+                self._response_in_progress().add_data(ret.data)
 
             ret = self._connection.next_event()
 
-        return None
+        if self._failed:
+            responses.extend(self._failed)
+            self._failed = []
+
+        return responses
 
     def receive(self, data):
+        # type: (bytes) -> List[HttpResponse]
+        """Pass received data to the connection.
+
+        Returns a list of all the responses that were completed by the data,
+        the list is empty if more data is needed to complete a response.
+        """
         self._connection.receive_data(data)
-        return self._get_response()
+        return self._get_responses()
 
 
 class Http2Connection(Connection):
@@ -405,6 +753,10 @@ class Http2Connection(Connection):
         self._connection = h2.connection.H2Connection()
         self._responses = OrderedDict()  \
             # type: OrderedDict[int, Http2Response]
+        # Request bodies that couldn't be sent yet because the flow control
+        # window of the stream or connection is exhausted.
+        self._pending_data = OrderedDict()  \
+            # type: OrderedDict[int, memoryview]
 
     @property
     def elapsed(self):
@@ -414,6 +766,53 @@ class Http2Connection(Connection):
 
         return max(response.elapsed for response in self._responses.values())
 
+    def _send_pending_data(self, stream_id):
+        # type: (int) -> None
+        """Send as much of a pending request body as flow control allows.
+
+        The body is split into frames that respect the max frame size of the
+        peer. The stream is ended once the whole body is sent, otherwise the
+        rest stays queued until the peer opens up the window again.
+        """
+        data = self._pending_data[stream_id]
+
+        while data:
+            try:
+                window = self._connection.local_flow_control_window(stream_id)
+            except h2.exceptions.StreamClosedError:
+                del self._pending_data[stream_id]
+                return
+
+            chunk_size = min(
+                window,
+                self._connection.max_outbound_frame_size,
+                len(data)
+            )
+
+            if chunk_size <= 0:
+                self._pending_data[stream_id] = data
+                return
+
+            self._connection.send_data(stream_id, data[:chunk_size])
+            data = data[chunk_size:]
+
+        del self._pending_data[stream_id]
+        self._connection.end_stream(stream_id)
+
+    def _resume_pending_data(self, stream_id):
+        # type: (int) -> None
+        # A window update for stream 0 opens up the connection window, every
+        # stream may continue in that case.
+        if stream_id == 0:
+            stream_ids = list(self._pending_data.keys())
+        elif stream_id in self._pending_data:
+            stream_ids = [stream_id]
+        else:
+            return
+
+        for stream_id in stream_ids:
+            self._send_pending_data(stream_id)
+
     def send(self, request, uuid=None):
         # type: (TransportRequest, Optional[UUID]) -> Tuple[UUID, bytes]
         if not isinstance(request, Http2Request):
@@ -427,11 +826,13 @@ class Http2Connection(Connection):
 
         stream_id = self._connection.get_next_available_stream_id()
         logger.debug("New stream id {}".format(stream_id))
-        self._connection.send_headers(stream_id, request._request)
-        # TODO we need to split the data here according to window
-        # and frame size.
-        self._connection.send_data(stream_id, request._data)
-        self._connection.end_stream(stream_id)
+        self._connection.send_headers(
+            stream_id,
+            request._request,
+            priority_weight=request.priority_weight
+        )
+        self._pending_data[stream_id] = memoryview(request._data)
+        self._send_pending_data(stream_id)
         ret = self._connection.data_to_send()
         response = Http2Response(uuid, request.timeout)
         response.mark_as_sent()
@@ -440,6 +841,13 @@ class Http2Connection(Connection):
         return response.uuid, ret
 
     def data_to_send(self):
+        # type: () -> bytes
+        """Get the data that needs to be sent to the server.
+
+        This should be called after receiving data as well, since window
+        updates from the server allow the remaining request bodies to be
+        sent.
+        """
         return self._connection.data_to_send()
 
     def connect(self):
@@ -451,6 +859,7 @@ class Http2Connection(Connection):
         # type: () -> bytes
         self._connection.close_connection()
         self._responses.clear()
+        self._pending_data.clear()
         return self._connection.data_to_send()
 
     def _handle_response(self, event):
@@ -474,14 +883,22 @@ class Http2Connection(Connection):
         response.add_data(data)
 
     def _handle_reset(self, event):
-        # type: (h2.events.StreamReset) -> Http2Response
-        response = self._responses.pop(event.stream_id)
+        # type: (h2.events.StreamReset) -> Optional[Http2Response]
+        self._pending_data.pop(event.stream_id, None)
+        response = self._responses.pop(event.stream_id, None)
+
+        if not response:
+            return None
+
         response.was_reset = True
         response.error_code = event.error_code
+        response.mark_as_received()
         return response
 
     def _handle_events(self, events):
-        # type: (h2.events.Event) -> Optional[Http2Response]
+        # type: (List[h2.events.Event]) -> List[Http2Response]
+        responses = []  # type: List[Http2Response]
+
         for event in events:
             logger.info("Handling Http2 event: {}".format(repr(event)))
 
@@ -492,22 +909,34 @@ class Http2Connection(Connection):
             elif isinstance(event, h2.events.StreamEnded):
                 response = self._responses.pop(event.stream_id)
                 response.mark_as_received()
-                return response
+                responses.append(response)
             elif isinstance(event, h2.events.SettingsAcknowledged):
                 pass
             elif isinstance(event, h2.events.WindowUpdated):
-                pass
+                self._resume_pending_data(event.stream_id)
+            elif isinstance(event, h2.events.RemoteSettingsChanged):
+                # A change of the initial window size can open up the
+                # window of every stream.
+                self._resume_pending_data(0)
             elif isinstance(event, h2.events.StreamReset):
                 logger.error("Http2 stream reset")
-                return self._handle_reset(event.stream_id)
-            elif isinstance(events, h2.events.ConnectionTerminated):
+                response = self._handle_reset(event)
+
+                if response:
+                    responses.append(response)
+            elif isinstance(event, h2.events.ConnectionTerminated):
                 logger.error("Http2 connection terminated")
                 # TODO reset the client
                 pass
 
-        return None
+        return responses
 
     def receive(self, data):
-        # type: (bytes) -> Optional[Http2Response]
+        # type: (bytes) -> List[Http2Response]
+        """Pass received data to the connection.
+
+        Returns a list of all the responses that were completed by the data,
+        the list is empty if more data is needed to complete a response.
+        """
         events = self._connection.receive_data(data)
         return self._handle_events(events)
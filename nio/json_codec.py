@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2018 Damir Jelić <poljar@termina.org.uk>
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY
+# SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER
+# RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF
+# CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN
+# CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+"""nio JSON codec module.
+
+This module contains the JSON encoders and decoders used by nio. The standard
+library json module is used by default, orjson or ujson can be selected if
+they are installed.
+
+The codec is a module level setting, it is selected for the whole process
+using set_codec() and is shared by every client. A client selects it as well
+if the json_codec option of its ClientConfig is set.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import json
+from builtins import bytes, str, super
+from typing import Any, Dict, List, Union
+
+from .exceptions import LocalProtocolError
+
+try:
+    from json.decoder import JSONDecodeError
+except ImportError:  # pragma: no cover
+    JSONDecodeError = ValueError  # type: ignore
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+JsonData = Union[str, bytes, bytearray, memoryview]
+
+
+class JsonCodec(object):
+    """JSON codec using the standard library json module."""
+
+    name = "json"
+
+    def loads(self, data):
+        # type: (JsonData) -> Any
+        """Parse a JSON document.
+
+        Args:
+            data (str, bytes): The UTF-8 encoded JSON document.
+
+        Raises JSONDecodeError if the document isn't valid JSON.
+        """
+        if not isinstance(data, str):
+            data = codecs.decode(data, "utf-8")
+
+        return json.loads(data)
+
+    def dumps(self, content):
+        # type: (Any) -> str
+        """Turn an object into a compact JSON string."""
+        return json.dumps(content, separators=(",", ":"))
+
+    def dumps_bytes(self, content):
+        # type: (Any) -> bytes
+        """Turn an object into a compact UTF-8 encoded JSON document."""
+        return self.dumps(content).encode("utf-8")
+
+    def canonical_dumps(self, content):
+        # type: (Dict[Any, Any]) -> str
+        """Turn a dictionary into a canonical JSON string.
+
+        The canonical form is used for signing, keys are sorted, no
+        whitespace is inserted and non-ASCII characters aren't escaped.
+        """
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+
+
+class OrjsonCodec(JsonCodec):
+    """JSON codec using the orjson library."""
+
+    name = "orjson"
+
+    def loads(self, data):
+        # type: (JsonData) -> Any
+        # Orjson errors are subclasses of the standard JSONDecodeError.
+        return orjson.loads(data)
+
+    def dumps(self, content):
+        # type: (Any) -> str
+        return self.dumps_bytes(content).decode("utf-8")
+
+    def dumps_bytes(self, content):
+        # type: (Any) -> bytes
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            # Orjson refuses integers that don't fit into 64 bits and
+            # non-string dictionary keys, let the standard library deal
+            # with those.
+            return super().dumps(content).encode("utf-8")
+
+    def canonical_dumps(self, content):
+        # type: (Dict[Any, Any]) -> str
+        # Orjson output is compact and doesn't escape non-ASCII characters,
+        # with sorted keys it matches the canonical form.
+        try:
+            return orjson.dumps(
+                content,
+                option=orjson.OPT_SORT_KEYS
+            ).decode("utf-8")
+        except TypeError:
+            return super().canonical_dumps(content)
+
+
+class UjsonCodec(JsonCodec):
+    """JSON codec using the ujson library.
+
+    Ujson escapes characters differently than the standard library, the
+    canonical form is therefore still produced by the standard library.
+    """
+
+    name = "ujson"
+
+    def loads(self, data):
+        # type: (JsonData) -> Any
+        if not isinstance(data, (str, bytes)):
+            data = bytes(data)
+
+        try:
+            return ujson.loads(data)
+        except ValueError as e:
+            raise JSONDecodeError(str(e), "", 0)
+
+    def dumps(self, content):
+        # type: (Any) -> str
+        return ujson.dumps(
+            content,
+            ensure_ascii=False,
+            escape_forward_slashes=False
+        )
+
+
+CODECS = {
+    JsonCodec.name: (JsonCodec, json),
+    OrjsonCodec.name: (OrjsonCodec, orjson),
+    UjsonCodec.name: (UjsonCodec, ujson),
+}
+
+_codec = JsonCodec()  # type: JsonCodec
+
+
+def available_codecs():
+    # type: () -> List[str]
+    """Get the names of the codecs that can be used."""
+    return [name for name, (_, module) in CODECS.items() if module]
+
+
+def set_codec(name):
+    # type: (str) -> JsonCodec
+    """Select the JSON codec nio should use.
+
+    Args:
+        name (str): The name of the codec, one of "json", "orjson", "ujson"
+            or "auto". The "auto" codec picks the fastest installed library.
+
+    Returns the newly selected codec. Raises LocalProtocolError if the codec
+    is unknown or its library isn't installed.
+    """
+    global _codec
+
+    if name == "auto":
+        name = next(
+            n for n in ("orjson", "ujson", "json") if CODECS[n][1]
+        )
+
+    if name not in CODECS:
+        raise LocalProtocolError("Unknown JSON codec {}".format(name))
+
+    codec_class, module = CODECS[name]
+
+    if not module:
+        raise LocalProtocolError(
+            "The JSON codec {} isn't installed".format(name)
+        )
+
+    if type(_codec) is not codec_class:
+        _codec = codec_class()
+
+    return _codec
+
+
+def get_codec():
+    # type: () -> JsonCodec
+    """Get the currently selected JSON codec."""
+    return _codec
+
+
+def loads(data):
+    # type: (JsonData) -> Any
+    return _codec.loads(data)
+
+
+def dumps(content):
+    # type: (Any) -> str
+    return _codec.dumps(content)
+
+
+def dumps_bytes(content):
+    # type: (Any) -> bytes
+    return _codec.dumps_bytes(content)
+
+
+def canonical_dumps(content):
+    # type: (Dict[Any, Any]) -> str
+    return _codec.canonical_dumps(content)
@@ -41,6 +41,8 @@ from .events import (
     InviteEvent,
     UnknownBadEvent,
     ToDeviceEvent,
+    LazyEvent,
+    lazy_events_enabled
 )
 from .log import logger_group
 from .schemas import Schemas, validate_json
@@ -50,6 +52,8 @@ from .crypto import OlmDevice
 logger = Logger("nio.responses")
 logger_group.add_logger(logger)
 
+RoomEventType = Union[Event, UnknownBadEvent, LazyEvent]
+
 
 __all__ = [
     "DeleteDevicesAuthResponse",
@@ -133,50 +137,50 @@ def verify(schema, error_class, pass_arguments=True):
     return decorator
 
 
-@attr.s
+@attr.s(slots=True)
 class Rooms(object):
     invite = attr.ib(type=Dict)
     join = attr.ib(type=Dict)
     leave = attr.ib(type=Dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class DeviceOneTimeKeyCount(object):
     curve25519 = attr.ib(type=int)
     signed_curve25519 = attr.ib(type=int)
 
 
-@attr.s
+@attr.s(slots=True)
 class DeviceList(object):
     changed = attr.ib(type=List[str])
     left = attr.ib(type=List[str])
 
 
-@attr.s
+@attr.s(slots=True)
 class Timeline(object):
     events = attr.ib(type=List)
     limited = attr.ib(type=bool)
     prev_batch = attr.ib(type=str)
 
 
-@attr.s
+@attr.s(slots=True)
 class InviteInfo(object):
     invite_state = attr.ib(type=List)
 
 
-@attr.s
+@attr.s(slots=True)
 class TypingNoticeEvent(object):
     users = attr.ib(type=List)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomSummary(object):
     invited_member_count = attr.ib(default=None, type=Optional[int])
     joined_member_count = attr.ib(default=None, type=Optional[int])
     heroes = attr.ib(default=[], type=List[str])
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomInfo(object):
     timeline = attr.ib(type=Timeline)
     state = attr.ib(type=List)
@@ -195,14 +199,14 @@ class RoomInfo(object):
         return events
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMember(object):
     user_id = attr.ib(type=str)
     display_name = attr.ib(type=str)
     avatar_url = attr.ib(type=str)
 
 
-@attr.s
+@attr.s(slots=True)
 class Device(object):
     id = attr.ib(type=str)
     display_name = attr.ib(type=str)
@@ -224,12 +228,25 @@ class Device(object):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class Response(object):
-    uuid = ""          # type : str
-    start_time = None  # type : Optional[float]
-    end_time = None    # type : Optional[float]
-    timeout = 0        # type : int
+    # Transport details of the response, they are set by the client after
+    # the response is created and aren't part of the response value.
+    uuid = attr.ib(
+        default="", init=False, repr=False, eq=False
+    )  # type: str
+    start_time = attr.ib(
+        default=None, init=False, repr=False, eq=False
+    )  # type: Optional[float]
+    end_time = attr.ib(
+        default=None, init=False, repr=False, eq=False
+    )  # type: Optional[float]
+    timeout = attr.ib(
+        default=0, init=False, repr=False, eq=False
+    )  # type: int
+    status_code = attr.ib(
+        default=None, init=False, repr=False, eq=False
+    )  # type: Optional[int]
 
     @property
     def elapsed(self):
@@ -239,7 +256,7 @@ class Response(object):
         return max(0, elapsed - (self.timeout / 1000))
 
 
-@attr.s
+@attr.s(slots=True)
 class ErrorResponse(Response):
     message = attr.ib(type=str)
     status_code = attr.ib(default=None, type=Optional[int])
@@ -268,7 +285,7 @@ class ErrorResponse(Response):
         return cls(parsed_dict["error"], parsed_dict["errcode"])
 
 
-@attr.s
+@attr.s(slots=True)
 class _ErrorWithRoomId(ErrorResponse):
     room_id = attr.ib(default="", type=str)
 
@@ -282,101 +299,123 @@ class _ErrorWithRoomId(ErrorResponse):
         return cls(parsed_dict["error"], parsed_dict["errcode"], room_id)
 
 
+@attr.s(slots=True)
 class LoginError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class SyncError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class RoomSendError(_ErrorWithRoomId):
     pass
 
 
+@attr.s(slots=True)
 class RoomPutStateError(_ErrorWithRoomId):
     pass
 
 
+@attr.s(slots=True)
 class RoomRedactError(_ErrorWithRoomId):
     pass
 
 
+@attr.s(slots=True)
 class RoomTypingError(_ErrorWithRoomId):
     """A response representing a unsuccessful room typing request."""
 
     pass
 
 
+@attr.s(slots=True)
 class RoomReadMarkersError(_ErrorWithRoomId):
     """A response representing a unsuccessful room read markers request."""
 
     pass
 
 
+@attr.s(slots=True)
 class RoomKickError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class RoomInviteError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class JoinError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class RoomLeaveError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class RoomMessagesError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class KeysUploadError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class KeysQueryError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class KeysClaimError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class UploadError(ErrorResponse):
     """A response representing a unsuccessful upload request."""
 
     pass
 
 
+@attr.s(slots=True)
 class ShareGroupSessionError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class DevicesError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class DeleteDevicesError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class UpdateDeviceError(ErrorResponse):
     pass
 
 
+@attr.s(slots=True)
 class JoinedMembersError(_ErrorWithRoomId):
     pass
 
 
+@attr.s(slots=True)
 class ProfileSetDisplayNameError(ErrorResponse):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class LoginResponse(Response):
     user_id = attr.ib(type=str)
     device_id = attr.ib(type=str)
@@ -399,7 +438,7 @@ class LoginResponse(Response):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class JoinedMembersResponse(Response):
     members = attr.ib(type=List[RoomMember])
     room_id = attr.ib(type=str)
@@ -425,7 +464,7 @@ class JoinedMembersResponse(Response):
         return cls(members, room_id)
 
 
-@attr.s
+@attr.s(slots=True)
 class UploadResponse(Response):
     """A response representing a successful upload request."""
 
@@ -440,7 +479,7 @@ class UploadResponse(Response):
         )
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomEventIdResponse(Response):
     event_id = attr.ib(type=str)
     room_id = attr.ib(type=str)
@@ -464,24 +503,28 @@ class RoomEventIdResponse(Response):
         return cls(parsed_dict["event_id"], room_id)
 
 
+@attr.s(slots=True)
 class RoomSendResponse(RoomEventIdResponse):
     @staticmethod
     def create_error(parsed_dict, room_id):
         return RoomSendError.from_dict(parsed_dict, room_id)
 
 
+@attr.s(slots=True)
 class RoomPutStateResponse(RoomEventIdResponse):
     @staticmethod
     def create_error(parsed_dict, room_id):
         return RoomPutStateError.from_dict(parsed_dict, room_id)
 
 
+@attr.s(slots=True)
 class RoomRedactResponse(RoomEventIdResponse):
     @staticmethod
     def create_error(parsed_dict, room_id):
         return RoomRedactError.from_dict(parsed_dict, room_id)
 
 
+@attr.s(slots=True)
 class EmptyResponse(Response):
     @staticmethod
     def create_error(parsed_dict):
@@ -498,7 +541,7 @@ class EmptyResponse(Response):
         return cls()
 
 
-@attr.s
+@attr.s(slots=True)
 class _EmptyResponseWithRoomId(Response):
     room_id = attr.ib(type=str)
 
@@ -517,24 +560,28 @@ class _EmptyResponseWithRoomId(Response):
         return cls(room_id)
 
 
+@attr.s(slots=True)
 class RoomKickResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return RoomKickError.from_dict(parsed_dict)
 
 
+@attr.s(slots=True)
 class RoomInviteResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return RoomInviteError.from_dict(parsed_dict)
 
 
+@attr.s(slots=True)
 class ShareGroupSessionResponse(_EmptyResponseWithRoomId):
     @staticmethod
     def create_error(parsed_dict, room_id):
         return ShareGroupSessionError.from_dict(parsed_dict)
 
 
+@attr.s(slots=True)
 class RoomTypingResponse(_EmptyResponseWithRoomId):
     """A response representing a successful room typing request."""
 
@@ -543,6 +590,7 @@ class RoomTypingResponse(_EmptyResponseWithRoomId):
         return RoomTypingError.from_dict(parsed_dict, room_id)
 
 
+@attr.s(slots=True)
 class RoomReadMarkersResponse(_EmptyResponseWithRoomId):
     """A response representing a successful room read markers request."""
 
@@ -551,7 +599,7 @@ class RoomReadMarkersResponse(_EmptyResponseWithRoomId):
         return RoomTypingError.from_dict(parsed_dict, room_id)
 
 
-@attr.s
+@attr.s(slots=True)
 class DeleteDevicesAuthResponse(Response):
     session = attr.ib(type=str)
     flows = attr.ib(type=Dict)
@@ -571,13 +619,14 @@ class DeleteDevicesAuthResponse(Response):
         )
 
 
+@attr.s(slots=True)
 class DeleteDevicesResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return DeleteDevicesError.from_dict(parsed_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomMessagesResponse(Response):
     chunk = attr.ib(type=List[Union[Event, UnknownBadEvent]])
     start = attr.ib(type=str)
@@ -592,7 +641,7 @@ class RoomMessagesResponse(Response):
         return cls(chunk, parsed_dict["start"], parsed_dict["end"])
 
 
-@attr.s
+@attr.s(slots=True)
 class RoomIdResponse(Response):
     room_id = attr.ib(type=str)
 
@@ -611,19 +660,21 @@ class RoomIdResponse(Response):
         return cls(parsed_dict["room_id"])
 
 
+@attr.s(slots=True)
 class JoinResponse(RoomIdResponse):
     @staticmethod
     def create_error(parsed_dict):
         return JoinError.from_dict(parsed_dict)
 
 
+@attr.s(slots=True)
 class RoomLeaveResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return RoomLeaveError.from_dict(parsed_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class KeysUploadResponse(Response):
     curve25519_count = attr.ib(type=int)
     signed_curve25519_count = attr.ib(type=int)
@@ -636,7 +687,7 @@ class KeysUploadResponse(Response):
         return cls(counts["curve25519"], counts["signed_curve25519"])
 
 
-@attr.s
+@attr.s(slots=True)
 class KeysQueryResponse(Response):
     device_keys = attr.ib(type=Dict)
     failures = attr.ib(type=Dict)
@@ -656,7 +707,7 @@ class KeysQueryResponse(Response):
         return cls(device_keys, failures)
 
 
-@attr.s
+@attr.s(slots=True)
 class KeysClaimResponse(Response):
     one_time_keys = attr.ib(type=Dict[Any, Any])
     failures = attr.ib(type=Dict[Any, Any])
@@ -676,7 +727,7 @@ class KeysClaimResponse(Response):
         return cls(one_time_keys, failures, room_id)
 
 
-@attr.s
+@attr.s(slots=True)
 class DevicesResponse(Response):
     devices = attr.ib(type=List[Device])
 
@@ -695,19 +746,21 @@ class DevicesResponse(Response):
         return cls(devices)
 
 
+@attr.s(slots=True)
 class UpdateDeviceResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return UpdateDeviceError.from_dict(parsed_dict)
 
 
+@attr.s(slots=True)
 class ProfileSetDisplayNameResponse(EmptyResponse):
     @staticmethod
     def create_error(parsed_dict):
         return ProfileSetDisplayNameError.from_dict(parsed_dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class _SyncResponse(Response):
     next_batch = attr.ib(type=str)
     rooms = attr.ib(type=Rooms)
@@ -738,19 +791,24 @@ class _SyncResponse(Response):
             parsed_dict,  # type: List[Dict[Any, Any]]
             max_events=0  # type: int
     ):
-        # type: (...) -> Tuple[int, List[Union[Event, UnknownBadEvent]]]
-        events = []  # type: List[Union[Event, UnknownBadEvent]]
+        # type: (...) -> Tuple[int, List[RoomEventType]]
+        events = []  # type: List[RoomEventType]
         counter = 0
 
+        lazy = lazy_events_enabled()
+
         for counter, event_dict in enumerate(parsed_dict, 1):
-            try:
-                validate_json(event_dict, Schemas.room_event)
-            except (SchemaError, ValidationError) as e:
-                logger.error("Error validating event: {}".format(str(e)))
-                events.append(UnknownBadEvent(event_dict))
-                continue
+            if lazy and LazyEvent.can_defer(event_dict):
+                event = LazyEvent(event_dict)
+            else:
+                try:
+                    validate_json(event_dict, Schemas.room_event)
+                except (SchemaError, ValidationError) as e:
+                    logger.error("Error validating event: {}".format(str(e)))
+                    events.append(UnknownBadEvent(event_dict))
+                    continue
 
-            event = Event.parse_event(event_dict)
+                event = Event.parse_event(event_dict)
 
             if event:
                 events.append(event)
@@ -985,11 +1043,12 @@ class _SyncResponse(Response):
         )
 
 
+@attr.s(slots=True)
 class SyncResponse(_SyncResponse):
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class PartialSyncResponse(_SyncResponse):
     unhandled_rooms = attr.ib(type=Dict[str, RoomInfo])
 
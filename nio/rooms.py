@@ -17,7 +17,8 @@
 from __future__ import unicode_literals
 
 from builtins import super
-from typing import Any, Dict, NamedTuple, Optional, List
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, NamedTuple, Optional, List, Set
 
 from jsonschema.exceptions import SchemaError, ValidationError
 from logbook import Logger
@@ -43,9 +44,54 @@ logger = Logger("nio.rooms")
 logger_group.add_logger(logger)
 
 
-class MatrixRoom(object):
-    def __init__(self, room_id, own_user_id):
+class EncryptedRoomIndex(object):
+    """Index of the encrypted rooms that users are members of.
+
+    The index is kept up to date by the rooms that share it as members join
+    or leave and as rooms become encrypted.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._rooms = defaultdict(set)  # type: DefaultDict[str, Set[str]]
+
+    def add(self, user_id, room_id):
+        # type: (str, str) -> None
+        self._rooms[user_id].add(room_id)
+
+    def remove(self, user_id, room_id):
         # type: (str, str) -> None
+        rooms = self._rooms.get(user_id)
+
+        if rooms is None:
+            return
+
+        rooms.discard(room_id)
+
+        if not rooms:
+            del self._rooms[user_id]
+
+    def rooms_for_user(self, user_id):
+        # type: (str) -> Set[str]
+        """Get the ids of the encrypted rooms the user is a member of.
+
+        The returned set must not be modified.
+        """
+        return self._rooms.get(user_id, set())
+
+    def __contains__(self, user_id):
+        # type: (object) -> bool
+        return user_id in self._rooms
+
+
+class MatrixRoom(object):
+    def __init__(
+        self,
+        room_id,                    # type: str
+        own_user_id,                # type: str
+        encrypted_room_index=None,  # type: Optional[EncryptedRoomIndex]
+    ):
+        # type: (...) -> None
         # yapf: disable
         self.room_id = room_id        # type: str
         self.own_user_id = own_user_id
@@ -56,6 +102,7 @@ class MatrixRoom(object):
         self.power_levels = PowerLevels()  # type: PowerLevels
         self.typing_users = []        # type: List[str]
         self.summary = None           # type: Optional[RoomSummary]
+        self.encrypted_room_index = encrypted_room_index
         # yapf: enable
 
     @property
@@ -163,6 +210,32 @@ class MatrixRoom(object):
         user = MatrixUser(user_id, display_name, level)
         self.users[user_id] = user
 
+        if self.encrypted and self.encrypted_room_index is not None:
+            self.encrypted_room_index.add(user_id, self.room_id)
+
+    def remove_member(self, user_id):
+        # type: (str) -> None
+        if user_id not in self.users:
+            return
+
+        del self.users[user_id]
+
+        if self.encrypted_room_index is not None:
+            self.encrypted_room_index.remove(user_id, self.room_id)
+
+    def _set_encrypted(self):
+        # type: () -> None
+        if self.encrypted:
+            return
+
+        self.encrypted = True
+
+        if self.encrypted_room_index is None:
+            return
+
+        for user_id in self.users:
+            self.encrypted_room_index.add(user_id, self.room_id)
+
     def _handle_membership(self, event):
         # type: (Any) -> None
         def join(event):
@@ -180,9 +253,7 @@ class MatrixRoom(object):
                     user.display_name = event.content["displayname"]
 
         elif event.content["membership"] in ["leave", "ban"]:
-            if event.state_key in self.users:
-                del self.users[event.state_key]
-                return
+            self.remove_member(event.state_key)
 
         elif event.content["membership"] == "invite":
             pass
@@ -212,7 +283,7 @@ class MatrixRoom(object):
             self.topic = event.topic
 
         elif isinstance(event, RoomEncryptionEvent):
-            self.encrypted = True
+            self._set_encrypted()
 
         elif isinstance(event, PowerLevelsEvent):
             self.power_levels.update(event.power_levels)
@@ -304,6 +375,8 @@ class MatrixInvitedRoom(MatrixRoom):
 
 
 class MatrixUser(object):
+    __slots__ = ("user_id", "display_name", "power_level")
+
     def __init__(self, user_id, display_name=None, power_level=0):
         # yapf: disable
         self.user_id = user_id            # type: str
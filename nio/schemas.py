@@ -16,7 +16,15 @@
 
 from __future__ import unicode_literals
 
+import re
+import threading
+from contextlib import contextmanager
+from enum import Enum, unique
+from builtins import str
+from typing import Any, Dict, Tuple, Union
+
 from jsonschema import Draft4Validator, FormatChecker, validators
+from jsonschema.exceptions import ValidationError
 
 RoomRegex = "^![a-zA-Z0-9]+:.+$"
 UserIdRegex = "^@.*:.+$"
@@ -59,8 +67,216 @@ def check_user_id(value):
     return True
 
 
+@unique
+class ValidationMode(Enum):
+    """Enum representing how strictly server responses are validated.
+
+    strict: Responses and events are fully validated against their schema.
+    lenient: Required keys, the types of the known fields and enumerated
+        values are checked, format checks and checks for unknown keys are
+        skipped.
+    trusted: Only the presence of required keys is checked. Should only be
+        used with a trusted homeserver.
+
+    The mode only applies to data coming from the homeserver, decrypted
+    end to end encrypted payloads are always validated strictly.
+    """
+
+    strict = "strict"
+    lenient = "lenient"
+    trusted = "trusted"
+
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+_format_checker = FormatChecker()
+
+_validation_mode = ValidationMode.strict
+
+# Per thread override of the validation mode, see strict_validation().
+_local = threading.local()
+
+# Compiled validators, keyed by the id of the schema they were created for.
+# The schema is stored alongside the validator so the id can't be reused
+# while the cache entry is alive.
+_validators = dict()  # type: Dict[int, Tuple[Dict[Any, Any], Any]]
+
+
+def set_validation_mode(mode):
+    # type: (Union[ValidationMode, str]) -> None
+    """Select how server responses and events should be validated.
+
+    The mode is a module level setting, it applies to every client in the
+    process.
+
+    Args:
+        mode (ValidationMode): The validation mode that should be used, the
+            name of the mode is accepted as well.
+    """
+    global _validation_mode
+    _validation_mode = ValidationMode(mode)
+
+
+def get_validation_mode():
+    # type: () -> ValidationMode
+    """Get the currently used validation mode."""
+    return _validation_mode
+
+
+@contextmanager
+def strict_validation():
+    """Validate strictly inside the block, whatever the validation mode is.
+
+    This is used for data that doesn't come from the homeserver, e.g. the
+    decrypted payloads of end to end encrypted events that any device can
+    send us.
+    """
+    previous = getattr(_local, "strict", False)
+    _local.strict = True
+
+    try:
+        yield
+    finally:
+        _local.strict = previous
+
+
+def get_validator(schema):
+    # type: (Dict[Any, Any]) -> Any
+    """Get a validator for the given schema.
+
+    Validators are created once per schema and reused afterwards, the
+    schema must therefore not be modified once it has been used for
+    validation.
+    """
+    try:
+        cached_schema, validator = _validators[id(schema)]
+
+        if cached_schema is schema:
+            return validator
+    except KeyError:
+        pass
+
+    validator = Validator(schema, format_checker=_format_checker)
+    _validators[id(schema)] = (schema, validator)
+
+    return validator
+
+
+def _is_type(instance, json_type):
+    # type: (Any, str) -> bool
+    python_type = JSON_TYPES.get(json_type)
+
+    # Unknown types aren't checked.
+    if not python_type:
+        return True
+
+    # Booleans are integers in Python but not in JSON.
+    if isinstance(instance, bool) and json_type in ("integer", "number"):
+        return False
+
+    return isinstance(instance, python_type)
+
+
+def check_schema(instance, schema, check_types=True):
+    # type: (Any, Dict[Any, Any], bool) -> None
+    """Check an instance against a schema without using jsonschema.
+
+    This implements the lenient and trusted validation modes. Objects need to
+    be dictionaries and contain their required keys, default values from the
+    schema are set the same as with schema validation.
+
+    Args:
+        instance: The object that should be checked.
+        schema (Dict): The schema that the object should be checked against.
+        check_types (bool): Should the types and the enumerated values of the
+            fields be checked.
+
+    Raises ValidationError if the instance doesn't match the schema.
+    """
+    schema_type = schema.get("type")
+
+    if check_types and schema_type:
+        types = schema_type if isinstance(schema_type, list) else [schema_type]
+
+        if not any(_is_type(instance, t) for t in types):
+            raise ValidationError(
+                "{!r} is not of type {}".format(instance, schema_type)
+            )
+
+        if "enum" in schema and instance not in schema["enum"]:
+            raise ValidationError(
+                "{!r} is not one of {!r}".format(instance, schema["enum"])
+            )
+
+        if "const" in schema and instance != schema["const"]:
+            raise ValidationError(
+                "{!r} was expected".format(schema["const"])
+            )
+
+    if not isinstance(instance, dict):
+        if schema_type == "object":
+            raise ValidationError(
+                "{!r} is not of type 'object'".format(instance)
+            )
+
+        if isinstance(instance, list) and isinstance(
+            schema.get("items"), dict
+        ):
+            for item in instance:
+                check_schema(item, schema["items"], check_types)
+
+        return
+
+    for key in schema.get("required", ()):
+        if key not in instance:
+            raise ValidationError("{!r} is a required property".format(key))
+
+    properties = schema.get("properties", {})
+
+    for key, subschema in properties.items():
+        if "default" in subschema:
+            instance.setdefault(key, subschema["default"])
+
+        if key in instance:
+            check_schema(instance[key], subschema, check_types)
+
+    pattern_properties = schema.get("patternProperties")
+
+    if not pattern_properties:
+        return
+
+    for key, value in instance.items():
+        if key in properties:
+            continue
+
+        for pattern, subschema in pattern_properties.items():
+            if re.search(pattern, key):
+                check_schema(value, subschema, check_types)
+
+
 def validate_json(instance, schema):
-    Validator(schema, format_checker=FormatChecker()).validate(instance)
+    # type: (Any, Dict[Any, Any]) -> None
+    """Validate a server response or event according to the validation mode.
+
+    Raises ValidationError if the instance isn't valid.
+    """
+    if (_validation_mode is ValidationMode.strict
+            or getattr(_local, "strict", False)):
+        get_validator(schema).validate(instance)
+    else:
+        check_schema(
+            instance,
+            schema,
+            _validation_mode is ValidationMode.lenient
+        )
 
 
 class Schemas(object):
@@ -17,8 +17,18 @@ import time
 
 from builtins import bytes, super
 from logbook import Logger
-from typing import List, Optional, DefaultDict, Iterator, Dict
-from datetime import datetime
+from typing import (
+    List,
+    Optional,
+    DefaultDict,
+    Iterable,
+    Iterator,
+    Dict,
+    Set,
+    Tuple
+)
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
 from functools import wraps
 from atomicwrites import atomic_write
 
@@ -28,6 +38,7 @@ from .crypto import (
     OlmAccount,
     Session,
     InboundGroupSession,
+    OutboundGroupSession,
     OlmDevice,
     SessionStore,
     GroupSessionStore,
@@ -42,7 +53,10 @@ from peewee import (
     BooleanField,
     ForeignKeyField,
     CompositeKey,
-    DoesNotExist
+    DoesNotExist,
+    FloatField,
+    IntegerField,
+    chunked
 )
 
 
@@ -122,6 +136,9 @@ class KeyStore(object):
     def __init__(self, filename):
         # type: (str) -> None
         self._entries = []  # type: List[Key]
+        # The entries indexed by their user and device id.
+        self._index = defaultdict(list) \
+            # type: DefaultDict[Tuple[str, str], List[Key]]
         self._filename = filename  # type: str
 
         self._load(filename)
@@ -150,15 +167,21 @@ class KeyStore(object):
                     if not entry:
                         continue
 
-                    self._entries.append(entry)
+                    self._append(entry)
         except FileNotFoundError:
             pass
 
+    def _append(self, key):
+        # type: (Key) -> None
+        self._entries.append(key)
+        self._index[(key.user_id, key.device_id)].append(key)
+
     def get_key(self, user_id, device_id):
         # type: (str, str) -> Optional[Key]
-        for entry in self._entries:
-            if user_id == entry.user_id and device_id == entry.device_id:
-                return entry
+        keys = self._index.get((user_id, device_id))
+
+        if keys:
+            return keys[0]
 
         return None
 
@@ -200,15 +223,22 @@ class KeyStore(object):
                     logger.error(message)
                     raise OlmTrustError(message)
 
-        self._entries.append(key)
+        self._append(key)
         self._save()
         return True
 
     @_save_store
     def remove(self, key):
         # type: (Key) -> bool
-        if key in self._entries:
+        if key in self:
             self._entries.remove(key)
+
+            user_device = (key.user_id, key.device_id)
+            self._index[user_device].remove(key)
+
+            if not self._index[user_device]:
+                del self._index[user_device]
+
             self._save()
             return True
 
@@ -216,7 +246,16 @@ class KeyStore(object):
 
     def check(self, key):
         # type: (Key) -> bool
-        return key in self._entries
+        return key in self
+
+    def __contains__(self, key):
+        # type: (object) -> bool
+        try:
+            keys = self._index.get((key.user_id, key.device_id), [])
+        except AttributeError:
+            return False
+
+        return key in keys
 
 
 class ByteField(BlobField):
@@ -304,6 +343,46 @@ class ForwardedChains(Model):
     )
 
 
+class MegolmOutboundSessions(Model):
+    creation_time = DateField()
+    device = ForeignKeyField(
+        column_name="device_id",
+        field="device_id",
+        model=Accounts,
+        on_delete="CASCADE"
+    )
+    max_age_s = FloatField()
+    max_messages = IntegerField()
+    message_count = IntegerField()
+    room_id = TextField()
+    session = ByteField()
+
+    class Meta:
+        table_name = "megolm_outbound_sessions"
+        primary_key = CompositeKey("device", "room_id")
+
+
+class MegolmOutboundRecipients(Model):
+    device = ForeignKeyField(
+        column_name="device_id",
+        field="device_id",
+        model=Accounts,
+        on_delete="CASCADE"
+    )
+    room_id = TextField()
+    user_device_id = TextField()
+    user_id = TextField()
+
+    class Meta:
+        table_name = "megolm_outbound_recipients"
+        primary_key = CompositeKey(
+            "device",
+            "room_id",
+            "user_id",
+            "user_device_id"
+        )
+
+
 class OlmSessions(Model):
     creation_time = DateField()
     curve_key = TextField()
@@ -318,6 +397,9 @@ class OlmSessions(Model):
 
     class Meta:
         table_name = "olm_sessions"
+        indexes = (
+            (("curve_key",), False),
+        )
 
 
 class OutgoingKeyRequests(Model):
@@ -356,13 +438,30 @@ def use_database(fn):
 
 @attr.s
 class MatrixStore(object):
-    """Storage class for matrix state."""
+    """Storage class for matrix state.
+
+    Olm and Megolm sessions change on every message that is encrypted or
+    decrypted with them. Instead of writing every change in a separate
+    transaction the sessions can be marked as dirty using
+    mark_session_dirty() and mark_inbound_group_session_dirty(), all the
+    dirty sessions are then written out in a single transaction by flush().
+    Newly created sessions are still saved right away.
+
+    The client flushes the store at the end of every receive_response() call
+    and before any to-device message containing Olm ciphertext is handed out
+    to be sent. A crash between marking a session dirty and flushing it loses
+    only the session changes made while processing the current response,
+    since the sync token of that response isn't used before the flush, the
+    server will resend the events after a restart.
+    """
 
     models = [
         Accounts,
         OlmSessions,
         MegolmInboundSessions,
         ForwardedChains,
+        MegolmOutboundSessions,
+        MegolmOutboundRecipients,
         DeviceKeys,
     ]
 
@@ -374,6 +473,12 @@ class MatrixStore(object):
     database_path = attr.ib(type=str, init=False)
     database = attr.ib(type=SqliteDatabase, init=False)
 
+    # Sessions waiting to be written by flush(), keyed by the session id.
+    _dirty_sessions = attr.ib(init=False, factory=dict) \
+        # type: Dict[str, Tuple[str, Session]]
+    _dirty_group_sessions = attr.ib(init=False, factory=dict) \
+        # type: Dict[str, Tuple[str, str, InboundGroupSession]]
+
     def __attrs_post_init__(self):
         self.database_name = self.database_name or "{}_{}.db".format(
             self.user_id,
@@ -451,9 +556,11 @@ class MatrixStore(object):
         """
         session_store = SessionStore()
 
+        # Without a record of their last use, the newest sessions are
+        # considered to be the most recently used ones.
         sessions = OlmSessions.select().join(Accounts).where(
             Accounts.device_id == self.device_id
-        )
+        ).order_by(OlmSessions.creation_time)
 
         for s in sessions:
             session = Session.from_pickle(
@@ -465,6 +572,114 @@ class MatrixStore(object):
 
         return session_store
 
+    @use_database
+    def load_sessions_for(self, curve_key):
+        # type: (str) -> List[Session]
+        """Load the Olm sessions of a single device from the database.
+
+        Args:
+            curve_key (str): The curve key that owns the Olm sessions.
+
+        Returns:
+            A list of ``Session`` objects ordered from the oldest to the
+                newest one, sessions that weren't flushed yet are returned
+                instead of their stored copies.
+
+        """
+        sessions = OrderedDict()  # type: OrderedDict[str, Session]
+
+        rows = OlmSessions.select().join(Accounts).where(
+            (Accounts.device_id == self.device_id)
+            & (OlmSessions.curve_key == curve_key)
+        ).order_by(OlmSessions.creation_time)
+
+        for s in rows:
+            sessions[s.session_id] = Session.from_pickle(
+                s.session,
+                s.creation_time,
+                self.pickle_key
+            )
+
+        for dirty_key, session in self._dirty_sessions.values():
+            if dirty_key == curve_key:
+                sessions[session.id] = session
+
+        return list(sessions.values())
+
+    @use_database
+    def load_sessions_for_keys(self, curve_keys):
+        # type: (Iterable[str]) -> Dict[str, List[Session]]
+        """Load the Olm sessions of many devices from the database at once.
+
+        Args:
+            curve_keys (Iterable[str]): The curve keys that own the Olm
+                sessions.
+
+        Returns:
+            A dictionary mapping the curve keys that have sessions to a list
+                of ``Session`` objects ordered from the oldest to the newest
+                one, sessions that weren't flushed yet are returned instead
+                of their stored copies.
+
+        """
+        keys = set(curve_keys)
+        sessions = defaultdict(OrderedDict) \
+            # type: DefaultDict[str, OrderedDict[str, Session]]
+
+        for batch in chunked(keys, 500):
+            rows = OlmSessions.select().join(Accounts).where(
+                (Accounts.device_id == self.device_id)
+                & (OlmSessions.curve_key.in_(batch))
+            ).order_by(OlmSessions.creation_time)
+
+            for s in rows:
+                sessions[s.curve_key][s.session_id] = Session.from_pickle(
+                    s.session,
+                    s.creation_time,
+                    self.pickle_key
+                )
+
+        for dirty_key, session in self._dirty_sessions.values():
+            if dirty_key in keys:
+                sessions[dirty_key][session.id] = session
+
+        return {
+            curve_key: list(key_sessions.values())
+            for curve_key, key_sessions in sessions.items()
+        }
+
+    @use_database
+    def load_session_keys(self, curve_keys):
+        # type: (Iterable[str]) -> Set[str]
+        """Find out which of the given curve keys own Olm sessions.
+
+        Unlike load_sessions_for_keys() no session gets unpickled.
+
+        Args:
+            curve_keys (Iterable[str]): The curve keys that should be checked.
+
+        Returns the set of curve keys that own at least one Olm session.
+        """
+        keys = set(curve_keys)
+        found = set()  # type: Set[str]
+
+        for batch in chunked(keys, 500):
+            rows = OlmSessions.select(OlmSessions.curve_key).join(
+                Accounts
+            ).where(
+                (Accounts.device_id == self.device_id)
+                & (OlmSessions.curve_key.in_(batch))
+            ).distinct()
+
+            found.update(row.curve_key for row in rows)
+
+        found.update(
+            dirty_key for dirty_key, _ in self._dirty_sessions.values()
+            if dirty_key in keys
+        )
+
+        return found
+
     @use_database
     def save_session(self, curve_key, session):
         """Save the provided Olm session to the database.
@@ -474,6 +689,10 @@ class MatrixStore(object):
             session (Session): The Olm session that will be pickled and
                 saved in the database.
         """
+        self._dirty_sessions.pop(session.id, None)
+        self._save_session(curve_key, session)
+
+    def _save_session(self, curve_key, session):
         OlmSessions.replace(
             device=self.device_id,
             curve_key=curve_key,
@@ -508,6 +727,48 @@ class MatrixStore(object):
 
         return store
 
+    @use_database
+    def load_inbound_group_session(self, room_id, curve_key, session_id):
+        # type: (str, str, str) -> Optional[InboundGroupSession]
+        """Load a single Megolm inbound group session from the database.
+
+        Args:
+            room_id (str): The room corresponding to the session.
+            curve_key (str): The curve25519 key of the device.
+            session_id (str): The id of the session.
+
+        Returns:
+            ``InboundGroupSession`` object, or ``None`` if the session wasn't
+                found.
+
+        """
+        dirty = self._dirty_group_sessions.get(session_id)
+
+        if dirty:
+            dirty_room_id, dirty_curve_key, session = dirty
+
+            if dirty_room_id == room_id and dirty_curve_key == curve_key:
+                return session
+
+            return None
+
+        try:
+            s = MegolmInboundSessions.select().join(Accounts).where(
+                (Accounts.device_id == self.device_id)
+                & (MegolmInboundSessions.session_id == session_id)
+                & (MegolmInboundSessions.room_id == room_id)
+                & (MegolmInboundSessions.curve_key == curve_key)
+            ).get()
+        except DoesNotExist:
+            return None
+
+        return InboundGroupSession.from_pickle(
+            s.session,
+            s.ed_key,
+            self.pickle_key,
+            [chain.curve_key for chain in s.forwarded_chains]
+        )
+
     @use_database
     def save_inbound_group_session(self, room_id, curve_key, session):
         """Save the provided Megolm inbound group session to the database.
@@ -517,6 +778,10 @@ class MatrixStore(object):
             curve_key (str): The curve25519 key of the device.
             session (InboundGroupSession): The session to save.
         """
+        self._dirty_group_sessions.pop(session.id, None)
+        self._save_inbound_group_session(room_id, curve_key, session)
+
+    def _save_inbound_group_session(self, room_id, curve_key, session):
         MegolmInboundSessions.insert(
             curve_key=curve_key,
             device=self.device_id,
@@ -541,6 +806,168 @@ class MatrixStore(object):
                 session=session.id
             ).execute()
 
+    @use_database
+    def load_outbound_group_sessions(self):
+        # type: () -> Dict[str, OutboundGroupSession]
+        """Load all the Megolm outbound group sessions from the database.
+
+        Returns:
+            A dictionary mapping room ids to ``OutboundGroupSession``
+                objects.
+
+        """
+        recipients = defaultdict(list) \
+            # type: DefaultDict[str, List[Tuple[str, str]]]
+
+        for r in MegolmOutboundRecipients.select().join(Accounts).where(
+                Accounts.device_id == self.device_id):
+            recipients[r.room_id].append((r.user_id, r.user_device_id))
+
+        sessions = MegolmOutboundSessions.select().join(Accounts).where(
+            Accounts.device_id == self.device_id
+        )
+
+        outbound_sessions = dict()  # type: Dict[str, OutboundGroupSession]
+
+        for s in sessions:
+            session = OutboundGroupSession.from_pickle(
+                s.session,
+                s.creation_time,
+                s.message_count,
+                self.pickle_key,
+                recipients[s.room_id]
+            )
+            session.max_age = timedelta(seconds=s.max_age_s)
+            session.max_messages = s.max_messages
+            outbound_sessions[s.room_id] = session
+
+        return outbound_sessions
+
+    @use_database
+    def save_outbound_group_session(self, room_id, session, recipients=()):
+        """Save the provided Megolm outbound group session to the database.
+
+        The session replaces the stored session of the room, the recipients
+        of the stored session need to be removed using
+        remove_outbound_group_session() if the session is a new one.
+
+        Args:
+            room_id (str): The room corresponding to the session.
+            session (OutboundGroupSession): The session to save.
+            recipients (Iterable[Tuple[str, str]]): User and device id pairs
+                that were added to the shared_with set of the session since
+                the last time it was saved.
+        """
+        rows = [
+            {
+                "device": self.device_id,
+                "room_id": room_id,
+                "user_id": user_id,
+                "user_device_id": device_id,
+            }
+            for user_id, device_id in recipients
+        ]
+
+        with self.database.atomic():
+            MegolmOutboundSessions.replace(
+                creation_time=session.creation_time,
+                device=self.device_id,
+                max_age_s=session.max_age.total_seconds(),
+                max_messages=session.max_messages,
+                message_count=session.message_count,
+                room_id=room_id,
+                session=session.pickle(self.pickle_key)
+            ).execute()
+
+            for batch in chunked(rows, 200):
+                MegolmOutboundRecipients.insert_many(
+                    batch
+                ).on_conflict_ignore().execute()
+
+    @use_database
+    def remove_outbound_group_session(self, room_id):
+        """Remove the Megolm outbound group session of a room.
+
+        Args:
+            room_id (str): The room corresponding to the session.
+        """
+        with self.database.atomic():
+            MegolmOutboundSessions.delete().where(
+                (MegolmOutboundSessions.device == self.device_id)
+                & (MegolmOutboundSessions.room_id == room_id)
+            ).execute()
+
+            MegolmOutboundRecipients.delete().where(
+                (MegolmOutboundRecipients.device == self.device_id)
+                & (MegolmOutboundRecipients.room_id == room_id)
+            ).execute()
+
+    def mark_session_dirty(self, curve_key, session):
+        # type: (str, Session) -> None
+        """Mark the provided Olm session to be saved on the next flush.
+
+        Args:
+            curve_key (str): The curve key that owns the Olm session.
+            session (Session): The Olm session that changed.
+        """
+        self._dirty_sessions[session.id] = (curve_key, session)
+
+    def mark_inbound_group_session_dirty(self, room_id, curve_key, session):
+        # type: (str, str, InboundGroupSession) -> None
+        """Mark the provided Megolm session to be saved on the next flush.
+
+        Args:
+            room_id (str): The room corresponding to the session.
+            curve_key (str): The curve25519 key of the device.
+            session (InboundGroupSession): The session that changed.
+        """
+        self._dirty_group_sessions[session.id] = (room_id, curve_key, session)
+
+    @property
+    def dirty(self):
+        # type: () -> bool
+        """Are there any sessions waiting to be flushed."""
+        return bool(self._dirty_sessions or self._dirty_group_sessions)
+
+    @use_database
+    def flush(self):
+        # type: () -> None
+        """Write all the dirty sessions to the database.
+
+        The sessions are written in a single transaction, either all of them
+        are saved or none of them are and they stay marked as dirty.
+        """
+        if not self.dirty:
+            return
+
+        rows = [
+            {
+                "device": self.device_id,
+                "curve_key": curve_key,
+                "session": session.pickle(self.pickle_key),
+                "session_id": session.id,
+                "creation_time": session.creation_time,
+            }
+            for curve_key, session in self._dirty_sessions.values()
+        ]
+
+        with self.database.atomic():
+            # Older SQLite versions allow only 999 variables per statement.
+            for batch in chunked(rows, 100):
+                OlmSessions.replace_many(batch).execute()
+
+            for room_id, curve_key, session in (
+                    self._dirty_group_sessions.values()):
+                self._save_inbound_group_session(room_id, curve_key, session)
+
+        logger.debug("Flushed {} Olm and {} Megolm sessions".format(
+            len(self._dirty_sessions),
+            len(self._dirty_group_sessions)
+        ))
+
+        self._dirty_sessions.clear()
+        self._dirty_group_sessions.clear()
+
     @use_database
     def load_device_keys(self):
         # type: () -> DeviceStore
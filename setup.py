@@ -17,6 +17,7 @@ setup(
         "future",
         "peewee",
         "typing;python_version<'3.5'",
+        "futures;python_version<'3'",
         "h11",
         "h2",
         "logbook",
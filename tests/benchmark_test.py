@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import tracemalloc
+from collections import OrderedDict
+
+import attr
+import pytest
+from jsonschema import FormatChecker
+
+from nio.crypto import DeviceStore, OlmDevice
+from nio.events import Event, set_lazy_events
+from nio.responses import SyncResponse
+from nio.schemas import (
+    Schemas,
+    ValidationMode,
+    Validator,
+    get_validator,
+    set_validation_mode,
+    validate_json
+)
+
+
+class TestClass(object):
+    @staticmethod
+    def _load_response(filename):
+        # type: (str) -> Dict[Any, Any]
+        with open(filename) as f:
+            return json.loads(f.read())
+
+    def _timeline_events(self, count=1000):
+        parsed_dict = self._load_response("tests/data/sync.json")
+        room = next(iter(parsed_dict["rooms"]["join"].values()))
+        event = room["timeline"]["events"][0]
+
+        return [dict(event) for _ in range(count)]
+
+    def test_validator_cache(self):
+        assert get_validator(Schemas.room_event) is \
+            get_validator(Schemas.room_event)
+        assert get_validator(Schemas.room_event) is not \
+            get_validator(Schemas.room_message)
+
+    def test_uncached_event_validation(self, benchmark):
+        events = self._timeline_events()
+
+        def validate():
+            for event in events:
+                Validator(
+                    Schemas.room_event,
+                    format_checker=FormatChecker()
+                ).validate(event)
+
+        benchmark(validate)
+
+    def test_event_validation(self, benchmark):
+        events = self._timeline_events()
+
+        def validate():
+            for event in events:
+                validate_json(event, Schemas.room_event)
+
+        benchmark(validate)
+
+    @pytest.mark.parametrize("mode", ["strict", "lenient", "trusted"])
+    def test_validation_modes(self, benchmark, mode):
+        events = self._timeline_events()
+
+        def parse():
+            for event in events:
+                validate_json(event, Schemas.room_event)
+                Event.parse_event(event)
+
+        try:
+            set_validation_mode(mode)
+            benchmark(parse)
+        finally:
+            set_validation_mode(ValidationMode.strict)
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_lazy_events(self, benchmark, lazy):
+        events = self._timeline_events()
+
+        try:
+            set_lazy_events(lazy)
+            benchmark(SyncResponse._get_room_events, events)
+        finally:
+            set_lazy_events(False)
+
+    def test_event_memory(self):
+        event_count = 100000
+        room_count = 100
+
+        template = self._timeline_events(1)[0]
+        rooms = {}
+
+        for room in range(room_count):
+            events = []
+
+            for i in range(event_count // room_count):
+                event = dict(template)
+                event["event_id"] = "${}:{}:localhost".format(room, i)
+                event["content"] = dict(template["content"])
+                events.append(event)
+
+            rooms["!room{}:localhost".format(room)] = {
+                "timeline": {
+                    "events": events,
+                    "limited": False,
+                    "prev_batch": "prev"
+                },
+                "state": {"events": []},
+                "ephemeral": {"events": []},
+                "account_data": {"events": []},
+            }
+
+        parsed_dict = self._load_response("tests/data/sync.json")
+        parsed_dict["rooms"]["join"] = rooms
+
+        try:
+            set_validation_mode(ValidationMode.trusted)
+            response = SyncResponse.from_dict(parsed_dict)
+        finally:
+            set_validation_mode(ValidationMode.strict)
+
+        events = [
+            event
+            for info in response.rooms.join.values()
+            for event in info.timeline.events
+        ]
+
+        assert len(events) == event_count
+        assert not hasattr(events[0], "__dict__")
+
+        # The same classes without slots, as attrs creates them by default.
+        event_class = type(events[0])
+        unslotted_class = attr.make_class(
+            event_class.__name__,
+            OrderedDict(
+                (field.name, attr.ib(default=field.default, init=field.init))
+                for field in attr.fields(event_class)
+            ),
+            slots=False
+        )
+        fields = [
+            field for field in attr.fields(event_class) if field.init
+        ]
+
+        arguments = [
+            [getattr(event, field.name) for field in fields]
+            for event in events
+        ]
+
+        def allocated(cls):
+            tracemalloc.start()
+
+            try:
+                instances = [cls(*args) for args in arguments]
+                size, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            assert len(instances) == event_count
+            return size
+
+        assert allocated(event_class) < allocated(unslotted_class)
+
+    def test_device_store_add(self, benchmark):
+        devices = [
+            OlmDevice(
+                "@user{}:localhost".format(i // 10),
+                "DEVICE{}".format(i),
+                "ed25519_{}".format(i),
+                "curve25519_{}".format(i)
+            )
+            for i in range(100000)
+        ]
+
+        def add_devices():
+            store = DeviceStore()
+
+            for device in devices:
+                store.add(device)
+
+            return store
+
+        store = benchmark(add_devices)
+
+        assert store.get_by_curve25519("curve25519_99999") is devices[-1]
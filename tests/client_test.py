@@ -19,9 +19,15 @@ from nio import (
     RoomEncryptionEvent,
     RoomSummary,
     KeysQueryResponse,
+    KeysClaimResponse,
     JoinedMembersResponse,
-    RoomMember
+    RoomMember,
+    ShareGroupSessionResponse
 )
+from nio.client import ClientConfig, RequestType, TransportType
+from nio.crypto import OlmDevice, RotationPolicy
+from nio.events import LazyEvent, set_lazy_events
+from nio.exceptions import GroupEncryptionError
 
 HOST = "example.org"
 USER = "example"
@@ -266,6 +272,292 @@ class TestClass(object):
 
         assert client.users_for_key_query == set([BOB_ID])
 
+    def test_devices_without_room_key(self, client):
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        assert client.devices_without_room_key(TEST_ROOM_ID) == {
+            ALICE_ID: [ALICE_DEVICE_ID]
+        }
+
+        alice_device = client.device_store[ALICE_ID][ALICE_DEVICE_ID]
+        client.olm.create_outbound_group_session(TEST_ROOM_ID)
+        session = client.olm.outbound_group_sessions[TEST_ROOM_ID]
+        session.add_pending_share("1", [(ALICE_ID, ALICE_DEVICE_ID)])
+
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = "1"
+        client.receive_response(response)
+
+        assert not client.devices_without_room_key(TEST_ROOM_ID)
+
+        # A device that knows the room key gets blacklisted, the session
+        # needs to be rotated.
+        client.blacklist_device(alice_device)
+        assert TEST_ROOM_ID not in client.olm.outbound_group_sessions
+
+    def test_room_send_new_device(self, tempdir):
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        client.olm.create_outbound_group_session(TEST_ROOM_ID)
+        uuid, _ = client.share_group_session(TEST_ROOM_ID, True)
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = uuid
+        client.receive_response(response)
+
+        # Alice's device was skipped, we have no Olm session with it.
+        assert not client.devices_without_room_key(TEST_ROOM_ID)
+        client.room_send(TEST_ROOM_ID, "m.room.message", {})
+
+        key_pair = faker.olm_key_pair()
+        client.device_store.add(OlmDevice(
+            ALICE_ID,
+            "NEWDEVICE",
+            key_pair["ed25519"],
+            key_pair["curve25519"]
+        ))
+
+        # The new device would get a message it can't decrypt.
+        assert client.devices_without_room_key(TEST_ROOM_ID) == {
+            ALICE_ID: ["NEWDEVICE"]
+        }
+        with pytest.raises(GroupEncryptionError):
+            client.room_send(TEST_ROOM_ID, "m.room.message", {})
+
+        uuid, _ = client.share_group_session(TEST_ROOM_ID, True)
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = uuid
+        client.receive_response(response)
+
+        client.room_send(TEST_ROOM_ID, "m.room.message", {})
+
+    def test_room_send_key_check(self, tempdir):
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        client.olm.create_outbound_group_session(TEST_ROOM_ID)
+        uuid, _ = client.share_group_session(TEST_ROOM_ID, True)
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = uuid
+        client.receive_response(response)
+
+        checks = []
+        get_devices = client.olm.get_devices_without_room_key
+
+        def devices_without_room_key(room_id, users):
+            checks.append(room_id)
+            return get_devices(room_id, users)
+
+        client.olm.get_devices_without_room_key = devices_without_room_key
+
+        # The devices of the room are only looked at for the first message.
+        client.room_send(TEST_ROOM_ID, "m.room.message", {})
+        client.room_send(TEST_ROOM_ID, "m.room.message", {})
+        assert checks == [TEST_ROOM_ID]
+
+        # A membership change makes the next message check them again.
+        client.receive_response(self.joined_members)
+        client.room_send(TEST_ROOM_ID, "m.room.message", {})
+        assert checks == [TEST_ROOM_ID, TEST_ROOM_ID]
+
+    def _finish_requests(self, client, requests):
+        return [client.requests_made.pop(uuid).type for uuid, _ in requests]
+
+    def test_send_queue(self, tempdir):
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+
+        tx_id = client.queue_room_send(
+            TEST_ROOM_ID,
+            "m.room.message",
+            {"msgtype": "m.text", "body": "Hello"}
+        )
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.keys_query
+        ]
+        client.receive_response(self.keys_query_response)
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.keys_claim
+        ]
+        # Alice has no one-time keys left, her device is left out of the
+        # key share.
+        client.receive_response(KeysClaimResponse({}, {}, TEST_ROOM_ID))
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.share_group_session
+        ]
+        assert client.send_queues[TEST_ROOM_ID].messages
+
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = requests[0][0]
+        client.receive_response(response)
+
+        requests = client.send_queued_messages()
+        assert [uuid for uuid, _ in requests] == [tx_id]
+        assert self._finish_requests(client, requests) == [
+            RequestType.room_send
+        ]
+        assert not client.send_queued_messages()
+
+        # Once the key is shared messages are released right away.
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.room_send
+        ]
+
+    def test_send_queue_share_ahead(self, tempdir):
+        config = ClientConfig(
+            rotation_policy=RotationPolicy(max_messages=4, share_ahead=0.5)
+        )
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir, config)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.keys_claim
+        ]
+        client.receive_response(KeysClaimResponse({}, {}, TEST_ROOM_ID))
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.share_group_session
+        ]
+        response = ShareGroupSessionResponse(TEST_ROOM_ID)
+        response.uuid = requests[0][0]
+        client.receive_response(response)
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.room_send
+        ]
+
+        # The session is halfway to its rotation, its successor gets shared.
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+        requests = client.send_queued_messages()
+        assert [client.requests_made[uuid].type for uuid, _ in requests] == [
+            RequestType.room_send,
+            RequestType.share_group_session
+        ]
+        self._finish_requests(client, requests[:1])
+
+        # Messages are still sent with the current session while the share
+        # of its successor is in flight, and the successor is only shared
+        # once.
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.room_send
+        ]
+        assert not client.send_queues[TEST_ROOM_ID].messages
+
+    def test_send_queue_concurrent_requests(self, tempdir):
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+        client.receive_response(self.joined_members)
+
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+
+        # The devices of Alice are known, claiming keys for them doesn't need
+        # to wait for the query of the devices of Bob.
+        requests = client.send_queued_messages()
+        assert [client.requests_made[uuid].type for uuid, _ in requests] == [
+            RequestType.keys_query,
+            RequestType.keys_claim
+        ]
+
+        # Nothing else can be done while the requests are in flight.
+        assert not client.send_queued_messages()
+        assert len(client.send_queues[TEST_ROOM_ID].messages) == 2
+
+    def test_send_queue_skips_unchanged_rooms(self, tempdir):
+        client = HttpClient(HOST, "ephemeral", "DEVICEID", tempdir)
+        client.connect(TransportType.HTTP2)
+        client.receive_response(self.login_response)
+        client.receive_response(KeysUploadResponse(50, 50))
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        client.queue_room_send(TEST_ROOM_ID, "m.room.message", {})
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.keys_claim
+        ]
+
+        key_pair = faker.olm_key_pair()
+        client.device_store.add(OlmDevice(
+            ALICE_ID,
+            "NEWDEVICE",
+            key_pair["ed25519"],
+            key_pair["curve25519"]
+        ))
+
+        # No response changed the room since the last pass, the devices of
+        # the room members aren't looked at again.
+        assert not client.send_queued_messages()
+
+        client.receive_response(KeysClaimResponse({}, {}, TEST_ROOM_ID))
+
+        requests = client.send_queued_messages()
+        assert self._finish_requests(client, requests) == [
+            RequestType.keys_claim
+        ]
+        assert (ALICE_ID, "NEWDEVICE") in client.send_queues[
+            TEST_ROOM_ID].claimed
+
+    def test_lazy_sync_events(self, client):
+        client.receive_response(self.login_response)
+
+        try:
+            set_lazy_events(True)
+            response = SyncResponse.from_dict(
+                self._load_response("tests/data/sync.json")
+            )
+        finally:
+            set_lazy_events(False)
+
+        client.receive_response(response)
+
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        events = response.rooms.join[room_id].timeline.events
+        lazy_events = [e for e in events if type(e) is LazyEvent]
+
+        # Events that don't change the client state aren't parsed, the room
+        # still picked up its members.
+        assert lazy_events
+        assert all(event._event is None for event in lazy_events)
+        assert client.rooms[room_id].users
+
     @ephemeral
     def test_query_rule(self):
         client = Client("ephemeral", "DEVICEID", ephemeral_dir)
@@ -2,9 +2,11 @@
 
 import os
 import pytest
+import threading
 import json
 import copy
 
+from helpers import faker
 from olm import (
     Account,
     OutboundGroupSession,
@@ -13,14 +15,19 @@ from olm import (
 )
 
 from nio.crypto import (
+    olm_machine,
     Olm,
     OlmDevice,
+    InboundSession,
     OutboundSession,
+    RotationPolicy,
     SessionStore,
     DeviceStore
 )
-from nio.exceptions import OlmTrustError
-from nio.responses import KeysQueryResponse
+from nio.events import BadEvent, MegolmEvent
+from nio.exceptions import OlmTrustError, VerificationError
+from nio.schemas import ValidationMode, set_validation_mode
+from nio.responses import KeysQueryResponse, ShareGroupSessionResponse
 from nio.store import KeyStore, Ed25519Key, Key, DefaultStore
 
 
@@ -169,10 +176,13 @@ class TestClass(object):
         store.add(curve_key, s)
         store.add(curve_key, s2)
 
-        if s.id < s2.id:
-            assert s == store.get(curve_key)
-        else:
-            assert s2 == store.get(curve_key)
+        # The most recently used session comes first.
+        assert s2 == store.get(curve_key)
+        assert store[curve_key] == [s2, s]
+
+        assert store.promote(curve_key, s)
+        assert s == store.get(curve_key)
+        assert store[curve_key] == [s, s2]
 
     def test_device_store(self):
         alice = OlmDevice(
@@ -188,6 +198,60 @@ class TestClass(object):
         assert store.add(alice) is False
         assert alice in store
 
+        # Devices can only be added through add() which keeps the key
+        # indexes up to date.
+        with pytest.raises(TypeError):
+            store["example"]["OTHERDEVICE"] = alice
+
+        assert not store["@unknown:example.org"]
+        assert "@unknown:example.org" not in store.users
+
+    @ephemeral
+    def test_olm_payload_sender_device(self):
+        olm = self.ephemeral_olm
+        key_pair = faker.olm_key_pair()
+        alice_device = OlmDevice(
+            AliceId,
+            Alice_device,
+            key_pair["ed25519"],
+            key_pair["curve25519"]
+        )
+        olm.device_store.add(alice_device)
+
+        payload = {
+            "sender": AliceId,
+            "recipient": olm.user_id,
+            "recipient_keys": {
+                "ed25519": olm.account.identity_keys["ed25519"]
+            },
+            "keys": {"ed25519": alice_device.ed25519}
+        }
+
+        assert olm._verify_olm_payload(
+            AliceId,
+            alice_device.curve25519,
+            payload
+        )
+
+        # The sender key belongs to a device with another signing key.
+        payload["keys"]["ed25519"] = faker.olm_key_pair()["ed25519"]
+        with pytest.raises(VerificationError):
+            olm._verify_olm_payload(
+                AliceId,
+                alice_device.curve25519,
+                payload
+            )
+
+        # The sender key belongs to a device of another user.
+        payload["sender"] = MaloryId
+        payload["keys"]["ed25519"] = alice_device.ed25519
+        with pytest.raises(VerificationError):
+            olm._verify_olm_payload(
+                MaloryId,
+                alice_device.curve25519,
+                payload
+            )
+
     @ephemeral
     def test_olm_outbound_session_create(self):
         bob = Account()
@@ -202,7 +266,7 @@ class TestClass(object):
         )
 
         olm = self.ephemeral_olm
-        olm.device_store[bob_device.user_id][bob_device.id] = bob_device
+        olm.device_store.add(bob_device)
         olm.create_session(one_time, bob_device.curve25519)
         assert isinstance(
             olm.session_store.get(bob.identity_keys["curve25519"]),
@@ -219,6 +283,193 @@ class TestClass(object):
         assert (bob_session.id
                 == "EeEiqT9LjCtECaN7WTqcBQ7D5Dwm4+/L9Uxr1IyPAts")
 
+    @ephemeral
+    def test_parallel_encryption(self):
+        olm = self.ephemeral_olm
+        olm.encryption_workers = 2
+
+        bob = Account()
+        bob.generate_one_time_keys(2)
+        one_time_keys = list(bob.one_time_keys["curve25519"].values())
+        bob_curve = bob.identity_keys["curve25519"]
+
+        first = OutboundSession(olm.account, bob_curve, one_time_keys[0])
+        second = OutboundSession(olm.account, bob_curve, one_time_keys[1])
+
+        # Two of the payloads share a session, they need to be encrypted in
+        # order.
+        recipients = [
+            (None, first, "first"),
+            (None, second, "second"),
+            (None, first, "third"),
+        ]
+
+        threshold = olm_machine.PARALLEL_ENCRYPTION_THRESHOLD
+        threads = threading.active_count()
+
+        try:
+            olm_machine.PARALLEL_ENCRYPTION_THRESHOLD = 1
+            messages = olm._encrypt_for_devices(recipients)
+        finally:
+            olm_machine.PARALLEL_ENCRYPTION_THRESHOLD = threshold
+
+        # The worker threads are gone once the encryption is done.
+        assert threading.active_count() == threads
+
+        first_inbound = InboundSession(bob, messages[0])
+        second_inbound = InboundSession(bob, messages[1])
+
+        assert first_inbound.decrypt(messages[0]) == "first"
+        assert second_inbound.decrypt(messages[1]) == "second"
+        assert first_inbound.decrypt(messages[2]) == "third"
+
+    @ephemeral
+    def test_encryption_without_thread_pool(self):
+        olm = self.ephemeral_olm
+        olm.encryption_workers = 2
+
+        bob = Account()
+        bob.generate_one_time_keys(1)
+        one_time_key = list(bob.one_time_keys["curve25519"].values())[0]
+        session = OutboundSession(
+            olm.account,
+            bob.identity_keys["curve25519"],
+            one_time_key
+        )
+
+        threshold = olm_machine.PARALLEL_ENCRYPTION_THRESHOLD
+        executor = olm_machine.ThreadPoolExecutor
+
+        # Without the futures backport on Python 2 the keys are encrypted in
+        # the calling thread.
+        try:
+            olm_machine.PARALLEL_ENCRYPTION_THRESHOLD = 1
+            olm_machine.ThreadPoolExecutor = None
+            message, = olm._encrypt_for_devices([(None, session, "first")])
+        finally:
+            olm_machine.PARALLEL_ENCRYPTION_THRESHOLD = threshold
+            olm_machine.ThreadPoolExecutor = executor
+
+        assert InboundSession(bob, message).decrypt(message) == "first"
+
+    @ephemeral
+    def test_olm_lazy_session_store(self):
+        olm = self.ephemeral_olm
+        bob_account = Account()
+        bob_account.generate_one_time_keys(1)
+        one_time = list(bob_account.one_time_keys["curve25519"].values())[0]
+        bob_curve = bob_account.identity_keys["curve25519"]
+
+        olm.create_session(one_time, bob_curve)
+        session = olm.session_store.get(bob_curve)
+
+        del olm
+
+        olm = Olm(
+            "ephemeral",
+            "DEVICEID",
+            self._get_store("ephemeral", "DEVICEID"),
+            session_cache_size=10
+        )
+
+        assert not list(olm.session_store)
+
+        loaded_session = olm.session_store.get(bob_curve)
+        assert loaded_session
+        assert loaded_session.id == session.id
+        assert list(olm.session_store) == [loaded_session]
+
+    @ephemeral
+    def test_olm_outbound_group_session_store(self):
+        olm = self.ephemeral_olm
+        olm.create_outbound_group_session("!test_room")
+        session = olm.outbound_group_sessions["!test_room"]
+        session.add_pending_share(None, [(BobId, Bob_device)])
+        olm.handle_response(ShareGroupSessionResponse("!test_room"))
+
+        olm.group_encrypt("!test_room", {"type": "m.room.message"})
+
+        del olm
+        olm = self.ephemeral_olm
+
+        loaded_session = olm.outbound_group_sessions["!test_room"]
+        assert loaded_session.id == session.id
+        assert loaded_session.message_index == session.message_index
+        assert loaded_session.message_count == 1
+        assert loaded_session.shared_with == {(BobId, Bob_device)}
+
+        # Rotating the session forgets the recipients of the old one.
+        olm.rotate_outbound_group_session("!test_room")
+
+        olm = self.ephemeral_olm
+        loaded_session = olm.outbound_group_sessions["!test_room"]
+        assert loaded_session.id != session.id
+        assert not loaded_session.shared_with
+
+    @ephemeral
+    def test_decrypted_payload_validation(self):
+        olm = self.ephemeral_olm
+        room_id = "!test_room"
+
+        olm.create_outbound_group_session(room_id)
+        olm.share_group_session(room_id, [])
+        olm.handle_response(ShareGroupSessionResponse(room_id))
+
+        payload = olm.group_encrypt(
+            room_id,
+            {"type": "m.room.message", "content": {"msgtype": 1, "body": 2}}
+        )
+        event = MegolmEvent(
+            "$event:example.org",
+            olm.user_id,
+            0,
+            payload["sender_key"],
+            payload["device_id"],
+            payload["session_id"],
+            payload["ciphertext"],
+            room_id
+        )
+
+        # Decrypted payloads come from other devices, they are validated
+        # strictly even if the homeserver is trusted.
+        try:
+            set_validation_mode(ValidationMode.trusted)
+            assert isinstance(olm.decrypt_megolm_event(event), BadEvent)
+        finally:
+            set_validation_mode(ValidationMode.strict)
+
+    @ephemeral
+    def test_share_ahead(self):
+        olm = self.ephemeral_olm
+        olm.rotation_policy = RotationPolicy(max_messages=2, share_ahead=0.5)
+        room_id = "!test_room"
+
+        olm.create_outbound_group_session(room_id)
+        session = olm.outbound_group_sessions[room_id]
+        olm.share_group_session(room_id, [])
+        olm.handle_response(ShareGroupSessionResponse(room_id))
+
+        assert not olm.should_share_ahead(room_id)
+        olm.group_encrypt(room_id, {"type": "m.room.message"})
+        assert olm.should_share_ahead(room_id)
+
+        olm.share_group_session(room_id, [], successor=True)
+        successor = olm.group_session_successors[room_id]
+        assert successor.id != session.id
+        assert olm.should_share_ahead(room_id)
+
+        olm.handle_response(ShareGroupSessionResponse(room_id))
+        assert successor.shared
+        assert not olm.should_share_ahead(room_id)
+
+        olm.group_encrypt(room_id, {"type": "m.room.message"})
+
+        # The session expired, the successor takes over without a new share.
+        payload = olm.group_encrypt(room_id, {"type": "m.room.message"})
+        assert payload["session_id"] == successor.id
+        assert olm.outbound_group_sessions[room_id] is successor
+        assert room_id not in olm.group_session_successors
+
     @ephemeral
     def test_olm_group_session_store(self):
         olm = self.ephemeral_olm
@@ -245,6 +496,43 @@ class TestClass(object):
         assert (bob_session.id
                 == outbound_session.id)
 
+    @ephemeral
+    def test_olm_lazy_group_session_store(self):
+        olm = self.ephemeral_olm
+        bob_account = Account()
+        outbound_session = OutboundGroupSession()
+        olm.create_group_session(
+            bob_account.identity_keys["curve25519"],
+            bob_account.identity_keys["ed25519"],
+            "!test_room",
+            outbound_session.id,
+            outbound_session.session_key)
+
+        del olm
+
+        olm = Olm(
+            "ephemeral",
+            "DEVICEID",
+            self._get_store("ephemeral", "DEVICEID"),
+            group_session_cache_size=10
+        )
+
+        assert not list(olm.inbound_group_store)
+
+        bob_session = olm.inbound_group_store.get(
+            "!test_room",
+            bob_account.identity_keys["curve25519"],
+            outbound_session.id
+        )
+
+        assert bob_session
+        assert bob_session.id == outbound_session.id
+        assert not olm.inbound_group_store.get(
+            "!other_room",
+            bob_account.identity_keys["curve25519"],
+            outbound_session.id
+        )
+
     @ephemeral
     def test_keys_query(self):
         olm = self.ephemeral_olm
@@ -354,6 +642,9 @@ class TestClass(object):
             [BobId, MaloryId]
         )
 
+        # the advanced Olm sessions were written out before returning
+        assert not alice.store.dirty
+
         # check that we aren't sharing the group session with malory
         with pytest.raises(KeyError):
             to_device["messages"][MaloryId][malory_device.id]["ciphertext"]
@@ -369,6 +660,10 @@ class TestClass(object):
         try:
             # pdb.set_trace()
             bob.decrypt(AliceId, alice_device.curve25519, message)
+            # the new session is written out on the next flush
+            assert bob.store.dirty
+            bob.flush()
+            assert not bob.store.dirty
 
             # we check that the session is there
             assert bob.session_store.get(alice_device.curve25519)
@@ -379,6 +674,25 @@ class TestClass(object):
                 group_session.id,
             )
 
+            # the session only gets shared with bob once
+            assert alice.get_devices_without_room_key(
+                "!test:example.org",
+                [BobId, MaloryId]
+            ) == {BobId: [bob_device.id]}
+
+            alice.handle_response(
+                ShareGroupSessionResponse("!test:example.org")
+            )
+
+            assert not alice.get_devices_without_room_key(
+                "!test:example.org",
+                [BobId, MaloryId]
+            )
+            assert not alice.share_group_session(
+                "!test:example.org",
+                [BobId, MaloryId]
+            )["messages"]
+
         finally:
             # remove the databases, the known devices store is handled by
             # monkeypatching
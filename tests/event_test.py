@@ -5,7 +5,13 @@ from __future__ import unicode_literals
 import json
 import pdb
 
+import attr
+
 from nio.events import (
+    EVENT_PARSERS,
+    MESSAGE_CLASSES,
+    Event,
+    UnknownEvent,
     BadEvent,
     UnknownBadEvent,
     RedactedEvent,
@@ -19,7 +25,9 @@ from nio.events import (
     RedactionEvent,
     RoomMessageNotice,
     ToDeviceEvent,
-    OlmEvent
+    OlmEvent,
+    register_event_type,
+    register_message_type
 )
 
 
@@ -106,3 +114,46 @@ class TestClass(object):
         parsed_dict = {}
         response = RedactedEvent.from_dict(parsed_dict)
         assert isinstance(response, UnknownBadEvent)
+
+    def test_register_event_type(self):
+        @attr.s
+        class CustomEvent(Event):
+            content = attr.ib()
+
+            @classmethod
+            def from_dict(cls, parsed_dict):
+                return cls(
+                    parsed_dict["event_id"],
+                    parsed_dict["sender"],
+                    parsed_dict["origin_server_ts"],
+                    parsed_dict["content"],
+                )
+
+        parsed_dict = TestClass._load_response(
+            "tests/data/events/topic.json")
+        parsed_dict["type"] = "org.example.custom"
+
+        event = Event.parse_event(dict(parsed_dict))
+        assert isinstance(event, UnknownEvent)
+
+        register_event_type("org.example.custom", CustomEvent)
+
+        try:
+            event = Event.parse_event(dict(parsed_dict))
+            assert isinstance(event, CustomEvent)
+            assert event.content == parsed_dict["content"]
+        finally:
+            del EVENT_PARSERS["org.example.custom"]
+
+    def test_register_message_type(self):
+        parsed_dict = TestClass._load_response(
+            "tests/data/events/message_text.json")
+        parsed_dict["content"]["msgtype"] = "org.example.notice"
+
+        register_message_type("org.example.notice", RoomMessageNotice)
+
+        try:
+            event = Event.parse_event(parsed_dict)
+            assert isinstance(event, RoomMessageNotice)
+        finally:
+            del MESSAGE_CLASSES["org.example.notice"]
@@ -6,7 +6,12 @@ import h2
 import pytest
 
 from nio.client import HttpClient, TransportType, RequestInfo, RequestType
-from nio.http import TransportResponse, Http2Response
+from nio.http import (
+    TransportResponse,
+    Http2Connection,
+    Http2Request,
+    Http2Response
+)
 from nio.responses import LoginResponse, SyncResponse
 from nio.exceptions import LocalProtocolError
 from h2.events import (
@@ -137,3 +142,85 @@ class TestClass(object):
             "m.room.message",
             content
         )
+
+    def test_client_receive_multiple(self, frame_factory):
+        client = HttpClient("localhost", "example")
+        client.connect(TransportType.HTTP2)
+        client.access_token = "ABCD"
+
+        first_uuid, _ = client.sync()
+        second_uuid, _ = client.sync()
+
+        client.receive(
+            self.sync_response(1, frame_factory)
+            + self.sync_response(3, frame_factory)
+        )
+
+        assert len(client.parse_queue) == 2
+
+        response = client.next_response()
+        assert isinstance(response, SyncResponse)
+        assert response.uuid == first_uuid
+
+        response = client.next_response()
+        assert isinstance(response, SyncResponse)
+        assert response.uuid == second_uuid
+
+    def test_flow_controlled_send(self, frame_factory):
+        connection = Http2Connection()
+        client_data = connection.connect()
+
+        conf = h2.config.H2Configuration(client_side=False)
+        server = h2.connection.H2Connection(conf)
+        server.initiate_connection()
+        server.receive_data(client_data)
+        connection.receive(server.data_to_send())
+
+        body = "a" * 100000
+        request = Http2Request.post("localhost", "/upload", body)
+        _, data = connection.send(request)
+
+        received = b""
+        ended = False
+
+        while not ended:
+            events = server.receive_data(data)
+
+            for event in events:
+                if isinstance(event, DataReceived):
+                    received += event.data
+                    server.acknowledge_received_data(
+                        event.flow_controlled_length,
+                        event.stream_id
+                    )
+                elif isinstance(event, StreamEnded):
+                    ended = True
+
+            connection.receive(server.data_to_send())
+            data = connection.data_to_send()
+
+            assert data or ended
+
+        assert received == body.encode("utf-8")
+
+    def test_request_priorities(self, frame_factory):
+        client = HttpClient("localhost", "example")
+        client.connect(TransportType.HTTP2)
+        client.access_token = "ABCD"
+
+        conf = h2.config.H2Configuration(client_side=False)
+        server = h2.connection.H2Connection(conf)
+        server.initiate_connection()
+        server.receive_data(frame_factory.preamble())
+
+        _, request = client.sync()
+        events = server.receive_data(request)
+        assert events[0].priority_updated.weight == 32
+
+        _, request = client.room_messages("!test:localhost", "start")
+        events = server.receive_data(request)
+        assert events[0].priority_updated.weight == 8
+
+        _, request = client.devices()
+        events = server.receive_data(request)
+        assert events[0].priority_updated is None
@@ -2,8 +2,26 @@
 
 from __future__ import unicode_literals
 
-from nio.client import HttpClient
-from nio.http import TransportResponse
+import gzip
+import zlib
+
+import pytest
+
+from nio.client import (
+    ClientConfig,
+    HttpClient,
+    ConnectionLane,
+    RequestType,
+    ResponseRoute,
+    RESPONSE_ROUTES
+)
+from nio.exceptions import LocalProtocolError, RemoteTransportError
+from nio.responses import (
+    ProfileSetDisplayNameError,
+    ProfileSetDisplayNameResponse
+)
+from nio.rooms import MatrixRoom
+from nio.http import HttpConnection, HttpRequest, TransportResponse
 
 
 class TestClass(object):
@@ -30,3 +48,262 @@ class TestClass(object):
         client.receive(transport_response)
         response = client.next_response()
         assert response.status_code == 502
+
+    def test_chunked_body(self):
+        response = TransportResponse()
+        response.add_data(b'{"a":')
+        response.add_data(b'"b"}')
+
+        assert response.content == b'{"a":"b"}'
+        assert response.text == '{"a":"b"}'
+        assert bytes(response.body) == b'{"a":"b"}'
+
+    def test_preallocated_body(self):
+        response = TransportResponse()
+        response._allocate_buffer("9")
+        response.add_data(b'{"a":')
+        response.add_data(b'"b"}')
+
+        assert response._buffer is not None
+        assert response.text == '{"a":"b"}'
+
+        response.add_data(b"more")
+        assert response._buffer is None
+        assert response.content == b'{"a":"b"}more'
+
+    @staticmethod
+    def _http_response(body, close=False):
+        headers = "Content-Length: {}\r\n".format(len(body))
+
+        if close:
+            headers += "Connection: close\r\n"
+
+        return (
+            "HTTP/1.1 200 OK\r\n{}\r\n{}".format(headers, body)
+        ).encode("utf-8")
+
+    def test_pipelining(self):
+        connection = HttpConnection(pipelining=True)
+
+        first_uuid, first = connection.send(
+            HttpRequest.get("localhost", "/first")
+        )
+        second_uuid, second = connection.send(
+            HttpRequest.put("localhost", "/second", "{}")
+        )
+        post_uuid, post = connection.send(
+            HttpRequest.post("localhost", "/third", "{}")
+        )
+
+        assert b"GET /first" in first
+        assert b"PUT /second" in second
+        # POST requests aren't idempotent, they have to wait.
+        assert post == b""
+
+        responses = connection.receive(
+            self._http_response("{}") + self._http_response("{}")
+        )
+
+        assert [r.uuid for r in responses] == [first_uuid, second_uuid]
+        assert b"POST /third" in connection.data_to_send()
+
+    def test_pipelining_fallback(self):
+        connection = HttpConnection(pipelining=True)
+
+        first_uuid, _ = connection.send(HttpRequest.get("localhost", "/a"))
+        second_uuid, second = connection.send(
+            HttpRequest.get("localhost", "/b")
+        )
+        assert second
+
+        responses = connection.receive(self._http_response("{}", True))
+
+        assert [r.uuid for r in responses] == [first_uuid]
+        assert not connection.pipelining
+        assert connection.closed
+        assert connection.data_to_send() == b""
+
+        # The unanswered request is sent again over a new connection.
+        new_connection = HttpConnection()
+        new_connection.requeue(connection.unsent_requests())
+
+        assert b"GET /b" in new_connection.data_to_send()
+        responses = new_connection.receive(self._http_response("{}"))
+        assert [r.uuid for r in responses] == [second_uuid]
+
+    def test_reconnect_requeues_requests(self):
+        client = HttpClient(
+            "localhost",
+            "example",
+            config=ClientConfig(http_pipelining=True)
+        )
+        client.connect()
+        client.access_token = "ABCD"
+        client.rooms["!test:localhost"] = MatrixRoom(
+            "!test:localhost",
+            "@example:localhost"
+        )
+
+        sync_uuid, _ = client.sync(30000)
+        send_uuid, send_data = client.room_send(
+            "!test:localhost",
+            "m.room.message",
+            {"body": "test", "msgtype": "m.text"}
+        )
+        assert send_data
+
+        client.receive(self._http_response("{}", True))
+
+        assert client.parse_queue[0][1].uuid == sync_uuid
+        assert client.pipelining_disabled
+        assert send_uuid in client.requests_made
+
+        data = client.connect()
+
+        assert b"PUT /_matrix/client/r0/rooms/" in data
+        assert not client.connection.pipelining
+        assert not client.requeued_requests
+
+    def test_lost_request_fails(self):
+        client = HttpClient("localhost", "example")
+        client.connect()
+        client.access_token = "ABCD"
+
+        join_uuid, _ = client.join("!test:localhost")
+
+        # The server goes away before answering, the POST request can't be
+        # repeated safely once the lane is reconnected.
+        with pytest.raises(RemoteTransportError):
+            client.receive(b"")
+
+        assert client.connect() == b""
+        _, response = client.parse_queue[0]
+
+        assert response.uuid == join_uuid
+        assert response.was_reset
+        assert not response.is_ok
+        assert join_uuid not in client.requests_made
+
+    def test_no_pipelining(self):
+        connection = HttpConnection()
+
+        connection.send(HttpRequest.get("localhost", "/a"))
+        _, second = connection.send(HttpRequest.get("localhost", "/b"))
+        assert second == b""
+
+        connection.receive(self._http_response("{}"))
+        assert b"GET /b" in connection.data_to_send()
+
+    def test_connection_lanes(self):
+        client = HttpClient("localhost", "example")
+
+        with pytest.raises(LocalProtocolError):
+            client.connect(lane=ConnectionLane.sync)
+
+        client.connect()
+        client.connect(lane=ConnectionLane.sync)
+        client.access_token = "ABCD"
+        client.rooms["!test:localhost"] = MatrixRoom(
+            "!test:localhost",
+            "@example:localhost"
+        )
+
+        assert client.lane_for(RequestType.sync) == ConnectionLane.sync
+        assert client.lane_for(RequestType.room_messages) == \
+            ConnectionLane.interactive
+
+        sync_uuid, sync_data = client.sync(30000)
+        assert sync_data
+
+        # The long running sync doesn't block other requests.
+        send_uuid, send_data = client.room_send(
+            "!test:localhost",
+            "m.room.message",
+            {"body": "test", "msgtype": "m.text"}
+        )
+        assert send_data
+
+        client.receive(self._http_response("{}"), ConnectionLane.sync)
+        assert client.parse_queue[0][1].uuid == sync_uuid
+
+        client.disconnect(ConnectionLane.sync)
+        assert client.lane_for(RequestType.sync) == ConnectionLane.interactive
+        assert send_uuid in client.requests_made
+
+    def test_accept_encoding(self):
+        connection = HttpConnection()
+        _, data = connection.send(HttpRequest.get("localhost", "/sync"))
+        assert b"accept-encoding: gzip, deflate" in data.lower()
+
+    @pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+    def test_compressed_body(self, encoding):
+        body = self._load_response("tests/data/sync.json")
+
+        if encoding == "gzip":
+            compressed = gzip.compress(body)
+        else:
+            compressed = zlib.compress(body)
+
+        connection = HttpConnection()
+        uuid, _ = connection.send(HttpRequest.get("localhost", "/sync"))
+
+        data = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Encoding: {}\r\n"
+            "Content-Length: {}\r\n\r\n".format(encoding, len(compressed))
+        ).encode("utf-8") + compressed
+
+        responses = []
+
+        # Feed the response in small pieces to exercise the incremental
+        # decoding.
+        for i in range(0, len(data), 512):
+            responses += connection.receive(data[i:i + 512])
+
+        assert len(responses) == 1
+        response = responses[0]
+        assert response.uuid == uuid
+        assert response.content == body
+        assert response.received_size == len(compressed)
+        assert response.content_size == len(body)
+
+    def test_decompression_limit(self):
+        compressed = gzip.compress(b"0" * 1024 * 1024)
+
+        response = TransportResponse()
+        response.headers["Content-Encoding"] = "gzip"
+        response._prepare_body()
+        response.max_decompressed_size = 64 * 1024
+
+        for i in range(0, len(compressed), 512):
+            response.add_data(compressed[i:i + 512])
+
+        response.mark_as_received()
+
+        assert response.content == b""
+        assert response.content_size <= response.max_decompressed_size
+
+    def test_custom_request(self):
+        client = HttpClient("localhost", "example")
+        client.connect()
+
+        api_call = ("GET", "/_matrix/client/r0/org.example/endpoint")
+
+        with pytest.raises(LocalProtocolError):
+            client.send_request("org.example.endpoint", api_call)
+
+        RESPONSE_ROUTES["org.example.endpoint"] = ResponseRoute(
+            ProfileSetDisplayNameResponse,
+            status_overrides={404: ProfileSetDisplayNameError}
+        )
+
+        try:
+            uuid, data = client.send_request("org.example.endpoint", api_call)
+            assert b"GET /_matrix/client/r0/org.example/endpoint" in data
+
+            client.receive(self._http_response("{}"))
+            response = client.next_response()
+            assert isinstance(response, ProfileSetDisplayNameResponse)
+            assert response.uuid == uuid
+        finally:
+            del RESPONSE_ROUTES["org.example.endpoint"]
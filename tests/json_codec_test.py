@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+
+import pytest
+
+from nio import json_codec
+from nio.api import Api
+from nio.client import Client, ClientConfig
+from nio.exceptions import LocalProtocolError
+from nio.json_codec import JSONDecodeError
+
+
+@pytest.fixture
+def codec(request):
+    yield json_codec.set_codec(request.param)
+    json_codec.set_codec("json")
+
+
+codecs = pytest.mark.parametrize(
+    "codec",
+    json_codec.available_codecs(),
+    indirect=True
+)
+
+
+class TestClass(object):
+    @staticmethod
+    def _load_response(filename):
+        # type: (str) -> bytes
+        with open(filename, "rb") as f:
+            return f.read()
+
+    @codecs
+    def test_loads(self, codec):
+        body = self._load_response("tests/data/sync.json")
+        expected = json.loads(body.decode("utf-8"))
+
+        assert codec.loads(body) == expected
+        assert codec.loads(memoryview(body)) == expected
+        assert codec.loads(body.decode("utf-8")) == expected
+
+        with pytest.raises(JSONDecodeError):
+            codec.loads(b"{")
+
+    @codecs
+    def test_canonical_json(self, codec):
+        content = {
+            "b": "/ünicode ",
+            "a": [1, 2, {"d": None, "c": True}],
+            "big": 2 ** 70,
+        }
+
+        expected = json.dumps(
+            content,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+
+        assert Api.to_canonical_json(content) == expected
+        assert json.loads(Api.to_json(content)) == content
+
+    def test_set_codec(self):
+        available = json_codec.available_codecs()
+        fastest = next(
+            name for name in ("orjson", "ujson", "json") if name in available
+        )
+
+        try:
+            json_codec.set_codec("auto")
+            assert json_codec.get_codec().name == fastest
+
+            # Clients without a codec option don't touch the process wide
+            # codec.
+            Client("ephemeral", config=ClientConfig())
+            assert json_codec.get_codec().name == fastest
+
+            with pytest.raises(LocalProtocolError):
+                json_codec.set_codec("yaml")
+        finally:
+            json_codec.set_codec("json")
+
+        assert json_codec.get_codec().name == "json"
+
+    def test_client_config(self):
+        available = json_codec.available_codecs()
+        fastest = next(
+            name for name in ("orjson", "ujson", "json") if name in available
+        )
+
+        try:
+            Client("ephemeral", config=ClientConfig(json_codec="auto"))
+            assert json_codec.get_codec().name == fastest
+
+            with pytest.raises(LocalProtocolError):
+                Client("ephemeral", config=ClientConfig(json_codec="yaml"))
+        finally:
+            json_codec.set_codec("json")
+
+        assert json_codec.get_codec().name == "json"
@@ -9,7 +9,11 @@ from nio.crypto import (
     InboundGroupSession,
     OutboundSession,
     SessionStore,
-    GroupSessionStore
+    LazySessionStore,
+    GroupSessionStore,
+    LazyGroupSessionStore,
+    DeviceStore,
+    OlmDevice
 )
 
 BOB_ID = "@bob:example.org"
@@ -40,6 +44,80 @@ class TestClass(object):
 
         assert (BOB_CURVE, [session]) == list(store.items())[0]
 
+    def test_session_store_miss(self):
+        account = OlmAccount()
+        store = SessionStore()
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+
+        assert store[BOB_CURVE] == []
+        assert not store.promote(BOB_CURVE, session)
+        assert not store.items()
+
+    def test_lazy_session_store(self):
+        account = OlmAccount()
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        loaded = []
+
+        def loader(curve_key):
+            loaded.append(curve_key)
+            return [session] if curve_key == BOB_CURVE else []
+
+        store = LazySessionStore(loader, max_keys=1)
+
+        assert session not in store
+        assert store.get(BOB_CURVE) is session
+        assert session in store
+        assert not store.add(BOB_CURVE, session)
+        assert loaded == [BOB_CURVE]
+
+        # Missing sessions are remembered as well, loading them drops the
+        # sessions of the least recently used key.
+        assert not store.get(BOB_ONETIME)
+        assert not store.get(BOB_ONETIME)
+        assert session not in store
+
+        assert store[BOB_CURVE] == [session]
+        assert loaded == [BOB_CURVE, BOB_ONETIME, BOB_CURVE]
+
+    def test_lazy_session_store_bulk_lookups(self):
+        account = OlmAccount()
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        loaded = []
+
+        def loader(curve_key):
+            loaded.append(curve_key)
+            return [session] if curve_key == BOB_CURVE else []
+
+        def batch_loader(curve_keys):
+            loaded.append(sorted(curve_keys))
+            return {BOB_CURVE: [session]} if BOB_CURVE in curve_keys else {}
+
+        def keys_loader(curve_keys):
+            loaded.append(sorted(curve_keys))
+            return set([BOB_CURVE]) & set(curve_keys)
+
+        store = LazySessionStore(loader, 1, batch_loader, keys_loader)
+        keys = [BOB_CURVE, BOB_ONETIME]
+
+        assert store.keys_with_sessions(keys) == set([BOB_CURVE])
+        assert store.get_many(keys) == {BOB_CURVE: session}
+        assert loaded == [sorted(keys), sorted(keys)]
+
+        # Bulk lookups don't fill the cache.
+        assert session not in store
+
+        # Keys that are in memory aren't loaded again.
+        assert not store.get(BOB_ONETIME)
+        del loaded[:]
+        assert store.keys_with_sessions(keys) == set([BOB_CURVE])
+        assert loaded == [[BOB_CURVE]]
+
+        # Without the bulk loaders every key is loaded on its own.
+        store = LazySessionStore(loader, 1)
+        del loaded[:]
+        assert store.keys_with_sessions(keys) == set([BOB_CURVE])
+        assert loaded == keys
+
     def test_group_session_store(self):
         store = GroupSessionStore()
         account = OlmAccount()
@@ -61,3 +139,82 @@ class TestClass(object):
         assert not store.add(session, TEST_ROOM, BOB_CURVE)
 
         assert store[TEST_ROOM] == {BOB_CURVE: {session.id: session}}
+
+    def test_group_session_store_miss(self):
+        store = GroupSessionStore()
+
+        assert not store.get(TEST_ROOM, BOB_CURVE, "SESSIONID")
+        assert not store._entries
+
+    def test_lazy_group_session_store(self):
+        account = OlmAccount()
+        sessions = {}
+
+        for _ in range(3):
+            out_group = OutboundGroupSession()
+            session = InboundGroupSession(
+                out_group.session_key,
+                account.identity_keys["ed25519"],
+            )
+            sessions[session.id] = session
+
+        loaded = []
+
+        def loader(room_id, sender_key, session_id):
+            loaded.append(session_id)
+            return sessions.get(session_id)
+
+        first, second, third = sessions.values()
+        store = LazyGroupSessionStore(loader, max_sessions=2)
+
+        assert store.get(TEST_ROOM, BOB_CURVE, first.id) is first
+        assert store.get(TEST_ROOM, BOB_CURVE, first.id) is first
+        assert loaded == [first.id]
+        assert not store.get(TEST_ROOM, BOB_CURVE, "SESSIONID")
+
+        assert store.add(second, TEST_ROOM, BOB_CURVE)
+        assert not store.add(second, TEST_ROOM, BOB_CURVE)
+        assert store.get(TEST_ROOM, BOB_CURVE, first.id) is first
+
+        # The least recently used session gets dropped from memory.
+        assert store.add(third, TEST_ROOM, BOB_CURVE)
+        assert first in store
+        assert second not in store
+
+        assert store.get(TEST_ROOM, BOB_CURVE, second.id) is second
+        assert loaded == [first.id, "SESSIONID", second.id]
+
+    def test_device_store(self):
+        store = DeviceStore()
+        device = faker.olm_device()
+
+        assert device not in store
+        assert not store.get(device.user_id, device.id)
+        assert not store.get_by_curve25519(device.curve25519)
+
+        assert store.add(device)
+        assert not store.add(device)
+        assert device in store
+
+        assert store.get(device.user_id, device.id) is device
+        assert store.get_by_curve25519(device.curve25519) is device
+        assert store.get_by_ed25519(device.ed25519) is device
+
+        old_key = device.curve25519
+        new_key = faker.olm_key_pair()["curve25519"]
+        store.update_curve25519(device, new_key)
+
+        assert not store.get_by_curve25519(old_key)
+        assert store.get_by_curve25519(new_key) is device
+
+        # Replacing a device removes the keys of the old one from the index.
+        new_device = OlmDevice(
+            device.user_id,
+            device.id,
+            faker.olm_key_pair()["ed25519"],
+            faker.olm_key_pair()["curve25519"]
+        )
+        assert store.add(new_device)
+        assert device not in store
+        assert not store.get_by_ed25519(device.ed25519)
+        assert store.get_by_ed25519(new_device.ed25519) is new_device
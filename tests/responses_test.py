@@ -2,8 +2,11 @@
 
 from __future__ import unicode_literals
 
+import copy
 import json
 
+import pytest
+
 from nio.responses import (
     ErrorResponse,
     LoginResponse,
@@ -21,6 +24,13 @@ from nio.responses import (
     SyncError,
     UploadResponse
 )
+from nio.client import Client, ClientConfig
+from nio.events import LazyEvent, RoomMessageText, set_lazy_events
+from nio.schemas import (
+    ValidationMode,
+    get_validation_mode,
+    set_validation_mode
+)
 
 
 class TestClass(object):
@@ -150,3 +160,83 @@ class TestClass(object):
                 "!SVkFJHzfwvuaIEawgC:localhost"
             ].timeline.events
         ) == 1
+
+    @pytest.mark.parametrize("mode", ["lenient", "trusted"])
+    def test_validation_modes(self, mode):
+        try:
+            set_validation_mode(mode)
+
+            parsed_dict = TestClass._load_response("tests/data/sync.json")
+            response = SyncResponse.from_dict(parsed_dict)
+            assert type(response) == SyncResponse
+            assert response.rooms.join[
+                "!SVkFJHzfwvuaIEawgC:localhost"
+            ].timeline.events
+
+            # Format checks are skipped.
+            parsed_dict = TestClass._load_response(
+                "tests/data/login_invalid_format.json")
+            response = LoginResponse.from_dict(parsed_dict)
+            assert isinstance(response, LoginResponse)
+
+            # Missing keys are still caught.
+            parsed_dict = TestClass._load_response(
+                "tests/data/login_response.json")
+            del parsed_dict["access_token"]
+            response = LoginResponse.from_dict(parsed_dict)
+            assert isinstance(response, ErrorResponse)
+        finally:
+            set_validation_mode(ValidationMode.strict)
+
+    def test_client_validation_config(self):
+        try:
+            Client("ephemeral", config=ClientConfig(validation="trusted"))
+            assert get_validation_mode() is ValidationMode.trusted
+
+            # Clients without a validation option keep the selected mode.
+            Client("ephemeral", config=ClientConfig())
+            assert get_validation_mode() is ValidationMode.trusted
+        finally:
+            set_validation_mode(ValidationMode.strict)
+
+    def test_lazy_sync_events(self):
+        try:
+            set_lazy_events(True)
+
+            parsed_dict = TestClass._load_response("tests/data/sync.json")
+            timeline = parsed_dict["rooms"]["join"][
+                "!SVkFJHzfwvuaIEawgC:localhost"
+            ]["timeline"]["events"]
+            timeline.append(dict(timeline[0], type="m.call.unknown"))
+
+            response = SyncResponse.from_dict(parsed_dict)
+            room = response.rooms.join["!SVkFJHzfwvuaIEawgC:localhost"]
+
+            # Unknown call events are dropped, the same as without lazy
+            # parsing.
+            assert len(room.timeline.events) == len(timeline) - 1
+
+            event = room.timeline.events[0]
+            assert isinstance(event, LazyEvent)
+            assert event.type == "m.room.message"
+            assert event.event_id == event.source["event_id"]
+            assert event.server_timestamp == event.source["origin_server_ts"]
+
+            assert copy.copy(event).source == event.source
+            assert event._event is None
+
+            # Lazy events don't pretend to be of the parsed class.
+            assert not isinstance(event, RoomMessageText)
+            assert event._event is None
+            assert isinstance(event.event, RoomMessageText)
+            assert event.body == event.source["content"]["body"]
+            # Parsing leaves the source untouched.
+            assert "content" in event.source
+
+            # Events that change the room state are parsed right away.
+            assert not any(
+                isinstance(e, LazyEvent) and e.type == "m.room.member"
+                for e in room.state
+            )
+        finally:
+            set_lazy_events(False)
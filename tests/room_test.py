@@ -1,11 +1,13 @@
 import pytest
 from helpers import faker
-from nio.rooms import MatrixRoom, MatrixInvitedRoom
+from nio.rooms import EncryptedRoomIndex, MatrixRoom, MatrixInvitedRoom
 from nio.responses import TypingNoticeEvent, RoomSummary
 from nio.events import (
     InviteNameEvent,
     InviteAliasEvent,
     InviteMemberEvent,
+    RoomEncryptionEvent,
+    RoomMemberEvent,
     RoomNameEvent
 )
 
@@ -116,3 +118,32 @@ class TestClass(object):
         assert not room.canonical_alias
         room.handle_event(InviteAliasEvent(BOB_ID, "test alias"))
         assert room.canonical_alias == "test alias"
+
+    def test_encrypted_room_index(self):
+        index = EncryptedRoomIndex()
+        room = MatrixRoom(TEST_ROOM, BOB_ID, index)
+
+        user_id, name = self.new_user
+        room.add_member(user_id, name)
+
+        # Only encrypted rooms are indexed.
+        assert user_id not in index
+
+        room.handle_event(RoomEncryptionEvent("$event1", BOB_ID, 0))
+        assert index.rooms_for_user(user_id) == {TEST_ROOM}
+
+        other_user, other_name = self.new_user
+        room.add_member(other_user, other_name)
+        assert index.rooms_for_user(other_user) == {TEST_ROOM}
+
+        room.handle_event(RoomMemberEvent(
+            "$event2",
+            user_id,
+            0,
+            user_id,
+            {"membership": "leave"}
+        ))
+
+        assert user_id not in index
+        assert index.rooms_for_user(user_id) == set()
+        assert other_user in index
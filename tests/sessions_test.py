@@ -6,6 +6,7 @@ from nio.crypto import (
     OutboundGroupSession,
     InboundGroupSession,
     OutboundSession,
+    RotationPolicy,
 )
 from nio import EncryptionError
 
@@ -53,3 +54,35 @@ class TestClass(object):
 
         with pytest.raises(EncryptionError):
             session.encrypt("Hello")
+
+    def test_outbound_group_session_shared_with(self):
+        session = OutboundGroupSession()
+
+        session.add_pending_share("first", [(BOB_ID, BOB_DEVICE)])
+        session.add_pending_share("second", [(BOB_ID, "OTHERDEVICE")])
+        assert not session.shared_with
+
+        session.mark_as_shared("first")
+        assert session.shared
+        assert session.shared_with == {(BOB_ID, BOB_DEVICE)}
+
+        session.mark_as_shared()
+        assert session.shared_with == {
+            (BOB_ID, BOB_DEVICE),
+            (BOB_ID, "OTHERDEVICE")
+        }
+        assert not session.pending_shares
+
+    def test_outbound_group_session_share_ahead(self):
+        session = OutboundGroupSession()
+        RotationPolicy(max_messages=10, share_ahead=0.2).apply(session)
+
+        assert session.max_messages == 10
+
+        session.message_count = 7
+        assert not session.should_share_ahead(0.2)
+        assert not session.should_share_ahead(0)
+
+        session.message_count = 8
+        assert session.should_share_ahead(0.2)
+        assert not session.expired
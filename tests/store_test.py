@@ -241,3 +241,127 @@ class TestClass(object):
 
         assert loaded_session
         assert session.id == loaded_session.id
+
+    @ephemeral
+    def test_store_flush(self):
+        account = self._create_ephemeral_account()
+        store = self.ephemeral_store
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        out_group = OutboundGroupSession()
+        in_group = InboundGroupSession(
+            out_group.session_key,
+            account.identity_keys["ed25519"],
+        )
+
+        store.mark_session_dirty(BOB_CURVE, session)
+        store.mark_inbound_group_session_dirty(
+            TEST_ROOM,
+            account.identity_keys["curve25519"],
+            in_group
+        )
+        assert store.dirty
+
+        store2 = self.ephemeral_store
+        assert not store2.load_sessions().get(BOB_CURVE)
+
+        store.flush()
+        assert not store.dirty
+
+        store2 = self.ephemeral_store
+        loaded_session = store2.load_sessions().get(BOB_CURVE)
+        loaded_group = store2.load_inbound_group_sessions().get(
+            TEST_ROOM,
+            account.identity_keys["curve25519"],
+            in_group.id
+        )
+
+        assert loaded_session.id == session.id
+        assert loaded_group.id == in_group.id
+
+    @ephemeral
+    def test_store_save_clears_dirty(self):
+        account = self._create_ephemeral_account()
+        store = self.ephemeral_store
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        store.mark_session_dirty(BOB_CURVE, session)
+        store.save_session(BOB_CURVE, session)
+
+        assert not store.dirty
+
+    @ephemeral
+    def test_store_sessions_for(self):
+        account = self._create_ephemeral_account()
+        store = self.ephemeral_store
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        store.save_session(BOB_CURVE, session)
+
+        assert not store.load_sessions_for(BOB_ONETIME)
+
+        loaded_session, = store.load_sessions_for(BOB_CURVE)
+        assert loaded_session.id == session.id
+        assert loaded_session is not session
+
+        # Sessions that weren't flushed are preferred to the stored ones.
+        store.mark_session_dirty(BOB_CURVE, session)
+        assert store.load_sessions_for(BOB_CURVE) == [session]
+
+        indexes = store.database.get_indexes("olm_sessions")
+        assert any(index.columns == ["curve_key"] for index in indexes)
+
+    @ephemeral
+    def test_store_sessions_for_keys(self):
+        account = self._create_ephemeral_account()
+        store = self.ephemeral_store
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        store.save_session(BOB_CURVE, session)
+
+        assert store.load_session_keys([BOB_CURVE, BOB_ONETIME]) == set(
+            [BOB_CURVE]
+        )
+        sessions = store.load_sessions_for_keys([BOB_CURVE, BOB_ONETIME])
+        assert list(sessions) == [BOB_CURVE]
+        assert [s.id for s in sessions[BOB_CURVE]] == [session.id]
+
+        # Sessions that weren't flushed are found as well.
+        other = OutboundSession(account, BOB_ONETIME, BOB_ONETIME)
+        store.mark_session_dirty(BOB_ONETIME, other)
+
+        assert store.load_session_keys([BOB_ONETIME]) == set([BOB_ONETIME])
+        assert store.load_sessions_for_keys([BOB_ONETIME]) == {
+            BOB_ONETIME: [other]
+        }
+
+    @ephemeral
+    def test_store_outbound_group_session(self):
+        self._create_ephemeral_account()
+        store = self.ephemeral_store
+
+        session = OutboundGroupSession()
+        session.message_count = 5
+        store.save_outbound_group_session(TEST_ROOM, session)
+
+        loaded = self.ephemeral_store.load_outbound_group_sessions()
+        loaded_session = loaded[TEST_ROOM]
+
+        assert loaded_session.id == session.id
+        assert loaded_session.message_count == 5
+        assert loaded_session.max_messages == session.max_messages
+        assert loaded_session.max_age == session.max_age
+        assert not loaded_session.shared
+
+        store.save_outbound_group_session(
+            TEST_ROOM,
+            session,
+            [(BOB_ID, BOB_DEVICE)]
+        )
+
+        loaded = self.ephemeral_store.load_outbound_group_sessions()
+        assert loaded[TEST_ROOM].shared
+        assert loaded[TEST_ROOM].shared_with == {(BOB_ID, BOB_DEVICE)}
+
+        store.remove_outbound_group_session(TEST_ROOM)
+        assert not self.ephemeral_store.load_outbound_group_sessions()